@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+"""Event-filter invocations and time per mouse event vs. number of list items.
+
+Builds a MainWindow with N items on the offscreen platform, then sends mouse
+moves to the list viewport both idle and during a drag-select. Filter calls
+per event should stay constant (none while idle) whatever N is.
+"""
+import os
+import sys
+import tempfile
+import time
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PySide6.QtCore import QEvent, QPointF, Qt
+from PySide6.QtGui import QMouseEvent
+from PySide6.QtWidgets import QApplication
+import contextyap_gui
+
+ITEM_COUNTS = (10, 100, 1000)
+EVENTS = 500
+
+filter_calls = 0
+original_event_filter = contextyap_gui.DragToggleController.eventFilter
+
+def counting_event_filter(self, obj, event):
+    global filter_calls
+    filter_calls += 1
+    return original_event_filter(self, obj, event)
+
+contextyap_gui.DragToggleController.eventFilter = counting_event_filter
+
+def send_moves(viewport, buttons):
+    for i in range(EVENTS):
+        pos = QPointF(5, i % max(1, viewport.height()))
+        event = QMouseEvent(QEvent.MouseMove, pos, viewport.mapToGlobal(pos), Qt.NoButton, buttons, Qt.NoModifier)
+        QApplication.sendEvent(viewport, event)
+
+def measure(window, buttons):
+    global filter_calls
+    filter_calls = 0
+    start = time.perf_counter()
+    send_moves(window.list_view.viewport(), buttons)
+    elapsed_us = (time.perf_counter() - start) * 1e6 / EVENTS
+    return filter_calls / EVENTS, elapsed_us
+
+def main():
+    app = QApplication.instance() or QApplication(sys.argv)
+    print(f"{'items':>6} {'idle calls/ev':>14} {'idle us/ev':>11} {'drag calls/ev':>14} {'drag us/ev':>11}")
+    for count in ITEM_COUNTS:
+        with tempfile.TemporaryDirectory() as tmp:
+            os.chdir(tmp)
+            window = contextyap_gui.MainWindow()
+            for i in range(count):
+                window.add_item_to_list({"name": f"item-{i}", "is_link": False, "checked": False})
+            window.show()
+            app.processEvents()
+
+            idle_calls, idle_us = measure(window, Qt.NoButton)
+            window.drag_controller.begin(window.items[0])
+            drag_calls, drag_us = measure(window, Qt.LeftButton)
+            window.drag_controller.end()
+
+            print(f"{count:>6} {idle_calls:>14.2f} {idle_us:>11.1f} {drag_calls:>14.2f} {drag_us:>11.1f}")
+            window.save_timer.stop()
+            window.close()
+            os.chdir("/")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,48 @@
+#!/usr/bin/env python3
+"""Toggle and load latency vs. total stored content for StateStore.
+
+Each round stores more cold-copy content, then times a single checkbox toggle
+followed by a save, and a fresh load of the state file. Both should stay flat
+as stored bytes grow.
+"""
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from contextyap_core import StateStore
+
+ITEMS_PER_ROUND = 10
+ITEM_BYTES = 5 * 1024 * 1024
+ROUNDS = 6
+TOGGLES = 50
+
+def main():
+    with tempfile.TemporaryDirectory() as tmp:
+        store = StateStore(os.path.join(tmp, "state.json"), os.path.join(tmp, "content"))
+        state = {"items": [], "opacity": 0.85, "width": 200, "height": 400}
+        blob = "x" * ITEM_BYTES
+        print(f"{'stored MB':>10} {'toggle+save ms':>15} {'load ms':>10}")
+        for round_index in range(ROUNDS):
+            for i in range(ITEMS_PER_ROUND):
+                name = f"item-{round_index}-{i}"
+                content_hash = store.put_content(name + blob)  # Distinct bodies, no dedup
+                state["items"].append({"name": name, "is_link": False, "content_hash": content_hash, "checked": False})
+            store.save(state)
+
+            start = time.perf_counter()
+            for toggle in range(TOGGLES):
+                state["items"][0]["checked"] = not state["items"][0]["checked"]
+                store.save(state)
+            elapsed_ms = (time.perf_counter() - start) * 1000 / TOGGLES
+
+            start = time.perf_counter()
+            StateStore(store.state_file, store.blobs.directory).load()
+            load_ms = (time.perf_counter() - start) * 1000
+
+            stored_mb = len(state["items"]) * ITEM_BYTES / (1024 * 1024)
+            print(f"{stored_mb:>10.0f} {elapsed_ms:>15.3f} {load_ms:>10.3f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+"""MainWindow startup time vs. number of stored items.
+
+Writes a state file with N items (a mix of cold copies and live links), then
+times MainWindow construction plus the first show/paint on the offscreen
+platform.
+"""
+import json
+import os
+import sys
+import tempfile
+import time
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PySide6.QtWidgets import QApplication
+import contextyap_core
+import contextyap_gui
+
+ITEM_COUNTS = (100, 1000, 10000)
+
+def write_state(count):
+    items = []
+    for i in range(count):
+        if i % 2:
+            items.append({"name": f"link-{i}", "is_link": True, "link_path": f"/tmp/link-{i}.txt", "checked": i % 3 == 0})
+        else:
+            items.append({"name": f"📎 clipboard-{i}", "is_link": False, "content_hash": "0" * 64, "checked": i % 3 == 0})
+    state = {"items": items, "opacity": contextyap_core.DEFAULT_OPACITY, "width": 200, "height": 400}
+    with open(contextyap_core.STATE_FILE, "w", encoding="utf-8") as f:
+        json.dump(state, f)
+
+def main():
+    app = QApplication.instance() or QApplication(sys.argv)
+    print(f"{'items':>6} {'startup ms':>11}")
+    for count in ITEM_COUNTS:
+        with tempfile.TemporaryDirectory() as tmp:
+            os.chdir(tmp)
+            write_state(count)
+            start = time.perf_counter()
+            window = contextyap_gui.MainWindow()
+            window.show()
+            app.processEvents()
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            print(f"{count:>6} {elapsed_ms:>11.1f}")
+            window.save_timer.stop()
+            window.hide()
+            os.chdir("/")
+
+if __name__ == "__main__":
+    main()
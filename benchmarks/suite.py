@@ -0,0 +1,338 @@
+#!/usr/bin/env python3
+"""Benchmark suite: ingestion, persistence, copy, outlining, start-up and drag-toggle on synthetic trees.
+
+    python benchmarks/suite.py [--out results.json] [--scales small,medium] [--cases ingest,copy]
+    python benchmarks/suite.py --compare before.json after.json [--threshold 0.1]
+
+Trees come from synthetic_tree.py, so every run sees the same bytes. Each
+case runs in a fresh subprocess on the offscreen Qt platform with its own
+working directory, store and command socket, so start-up cost and peak RSS
+are not polluted by earlier cases. Results are written as JSON keyed by
+"case/parameter". A run exits non-zero when any case fails; --compare diffs
+two such files and exits non-zero when a case failed in the second or a
+timing or memory figure got worse by more than the threshold.
+"""
+import argparse
+import importlib
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+sys.path.insert(0, ROOT)
+
+CASES = ("ingest", "persistence-json", "persistence-sqlite", "copy", "outline", "startup", "toggle")
+DEFAULT_SCALES = ("small", "medium", "large")
+ITEM_COUNTS = (100, 1000, 10000)  # For start-up and toggle
+SAVE_REPEATS = 20
+LOAD_REPEATS = 5
+TOGGLE_ROWS = 200
+WAIT_TIMEOUT = 600  # Seconds before a case gives up waiting on a background job
+MB = 1024 * 1024
+
+# Metric name suffixes, and which way is better, for --compare
+LOWER_IS_BETTER = ("_ms", "rss_mb", "growth_mb")
+HIGHER_IS_BETTER = ("_per_s",)
+
+# --- Child side: one case per process -----------------------------------------
+
+def peak_rss_mb():
+    try:
+        import resource
+    except ImportError:  # Windows
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / MB if sys.platform == "darwin" else peak / 1024  # Bytes on macOS, KiB elsewhere
+
+def median(values):
+    ordered = sorted(values)
+    return ordered[len(ordered) // 2]
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+def wait_until(app, condition):
+    deadline = time.monotonic() + WAIT_TIMEOUT
+    while not condition():
+        if time.monotonic() > deadline:
+            raise TimeoutError("Timed out waiting for a background job")
+        app.processEvents()
+        time.sleep(0.001)
+
+def open_window():
+    """Imports the GUI and builds a MainWindow over the working directory's store; returns (app, window, import ms)."""
+    start = time.perf_counter()
+    from PySide6.QtWidgets import QApplication
+    import contextyap_gui
+    import_ms = (time.perf_counter() - start) * 1000
+    app = QApplication.instance() or QApplication(sys.argv[:1])
+    return app, contextyap_gui.MainWindow(), import_ms
+
+def add_tree(app, window, tree, link=True):
+    """Drops tree as a cold folder, optionally links it too, checks both and waits for them to settle."""
+    items = [window.process_folder_drop(tree)]
+    if link:
+        items.append(window.process_folder_link(tree))
+    wait_until(app, lambda: not any(item_data.get("pending") for item_data in items)
+               and not window.folder_refresh_jobs and all(item_data.get("stats") for item_data in items))
+    for item_data in items:
+        window.update_item_state(item_data["id"], True)
+    window.flush_state()
+    return items
+
+def stored_mb(work):
+    total = 0
+    for root, _, files in os.walk(work):
+        for file_name in files:
+            if file_name.startswith("search.db"):
+                continue  # The search index is not the store
+            total += os.path.getsize(os.path.join(root, file_name))
+    return total / MB
+
+def case_ingest(tree, work):
+    from contextyap_core import IngestFilter
+    files = sum(1 for _ in IngestFilter().iter_files(tree))
+    app, window, _ = open_window()
+    start = time.perf_counter()
+    item_data = window.process_folder_drop(tree)
+    wait_until(app, lambda: not item_data.get("pending"))
+    elapsed = time.perf_counter() - start
+    size = item_data["stats"][0] / MB
+    return {"files": files, "output_mb": size, "ingest_ms": elapsed * 1000, "mb_per_s": size / elapsed,
+            "files_per_s": files / elapsed, "peak_rss_mb": peak_rss_mb()}
+
+def case_persistence(tree, work):
+    app, window, _ = open_window()
+    items = add_tree(app, window, tree)
+    saves = []
+    for i in range(SAVE_REPEATS):
+        window.update_item_state(items[0]["id"], i % 2 == 0)  # One toggle, as from a click
+        start = time.perf_counter()
+        window.flush_state()
+        saves.append((time.perf_counter() - start) * 1000)
+    loads = []
+    for _ in range(LOAD_REPEATS):
+        start = time.perf_counter()
+        window.load_state()
+        loads.append((time.perf_counter() - start) * 1000)
+    return {"stored_mb": stored_mb(work), "save_ms": median(saves), "save_p99_ms": percentile(saves, 0.99),
+            "load_ms": median(loads)}
+
+def case_copy_setup(tree, work):
+    app, window, _ = open_window()
+    add_tree(app, window, tree)
+    return {}
+
+def case_copy(tree, work):
+    app, window, _ = open_window()
+    wait_until(app, lambda: not window.folder_refresh_jobs)
+    baseline = peak_rss_mb()
+    copied = []
+    start = time.perf_counter()
+    job = window.copy_job()  # The C button's path: assembled in memory for the clipboard
+    job.finished.connect(copied.append)
+    job.start()
+    wait_until(app, lambda: copied)
+    elapsed_ms = (time.perf_counter() - start) * 1000
+    peak = peak_rss_mb()
+    return {"items": len(window.checked_items()), "output_mb": len((copied[0] or "").encode("utf-8")) / MB,
+            "copy_ms": elapsed_ms, "peak_rss_mb": peak, "rss_growth_mb": peak - baseline if peak else None}
+
+def case_outline(tree, work):
+    from contextyap_core import IngestFilter, OutlineCache, read_text_file
+    files = []
+    for file_path in IngestFilter().iter_files(tree):
+        result = read_text_file(file_path)
+        if result is not None:
+            files.append((os.path.relpath(file_path, tree), result[0], None))
+    outlines = OutlineCache()
+    start = time.perf_counter()
+    outlines.warm(files)  # Cold: parsed on the process pool, including its start-up
+    cold_ms = (time.perf_counter() - start) * 1000
+    start = time.perf_counter()
+    outlined = [outlines.get(*source) for source in files]
+    cached_ms = (time.perf_counter() - start) * 1000
+    outlines.close()  # Before run_child's os._exit, which would orphan the workers
+    full = sum(len(text) for _, text, _ in files)
+    size = sum(len(text) for text in outlined)
+    return {"files": len(files), "input_mb": full / MB, "output_mb": size / MB, "ratio": full / size,
+            "outline_ms": cold_ms, "cached_ms": cached_ms}
+
+def case_startup(count, work):
+    start = time.perf_counter()
+    importlib.import_module("contextyap_gui")  # Timed on its own; bench_startup would import it first
+    import_ms = (time.perf_counter() - start) * 1000
+    from bench_startup import write_state  # Cold copies and live links, as in bench_startup
+    write_state(int(count))
+    start = time.perf_counter()
+    app, window, _ = open_window()
+    window.show()
+    app.processEvents()
+    return {"import_ms": import_ms, "startup_ms": (time.perf_counter() - start) * 1000,
+            "peak_rss_mb": peak_rss_mb()}
+
+def case_toggle(count, work):
+    from PySide6.QtCore import QEvent, QPointF, Qt
+    from PySide6.QtGui import QMouseEvent
+    from contextyap_gui import ItemDelegate
+    app, window, _ = open_window()
+    for i in range(int(count)):
+        window.add_item_to_list({"name": f"item-{i}", "is_link": False, "checked": False})
+    window.resize(300, ItemDelegate.ROW_HEIGHT * (TOGGLE_ROWS + 10))
+    window.show()
+    app.processEvents()
+
+    view = window.list_view
+    viewport = view.viewport()
+    def send(kind, row, buttons):
+        rect = view.visualRect(window.model.index(row, 0))
+        pos = QPointF(ItemDelegate.checkbox_rect(rect).center())
+        button = Qt.LeftButton if kind != QEvent.MouseMove else Qt.NoButton
+        app.sendEvent(viewport, QMouseEvent(kind, pos, viewport.mapToGlobal(pos), button, buttons, Qt.NoModifier))
+
+    rows = min(TOGGLE_ROWS, int(count))
+    send(QEvent.MouseButtonPress, 0, Qt.LeftButton)
+    toggles = []
+    for row in range(1, rows):
+        start = time.perf_counter()
+        send(QEvent.MouseMove, row, Qt.LeftButton)
+        app.processEvents()  # Includes the repaint
+        toggles.append((time.perf_counter() - start) * 1000)
+    send(QEvent.MouseButtonRelease, rows - 1, Qt.NoButton)
+    checked = sum(1 for item_data in window.items if item_data.get("checked"))
+    if checked != rows:
+        raise RuntimeError(f"Drag toggled {checked} of {rows} rows")
+    window.save_timer.stop()
+    return {"toggles": len(toggles), "toggle_ms": median(toggles), "toggle_p99_ms": percentile(toggles, 0.99)}
+
+CHILD_CASES = {
+    "ingest": case_ingest, "persistence-json": case_persistence, "persistence-sqlite": case_persistence,
+    "copy-setup": case_copy_setup, "copy": case_copy, "outline": case_outline, "startup": case_startup,
+    "toggle": case_toggle,
+}
+
+def run_child(case, parameter, work):
+    os.chdir(work)  # The JSON store lives in the working directory
+    result = CHILD_CASES[case](parameter, work)
+    print(json.dumps(result), flush=True)
+    os._exit(0)  # Skip Qt teardown and daemon worker threads
+
+# --- Parent side ---------------------------------------------------------------
+
+def spawn(case, parameter, work):
+    os.makedirs(work, exist_ok=True)
+    env = dict(os.environ, QT_QPA_PLATFORM="offscreen", XDG_DATA_HOME=work,
+               CONTEXTYAP_SOCKET=os.path.join(work, "contextyap.sock"),  # Never reach a real running window
+               CONTEXTYAP_STORE="sqlite" if case == "persistence-sqlite" else "json")
+    completed = subprocess.run([sys.executable, os.path.abspath(__file__), "--child", case, str(parameter), work],
+                               env=env, capture_output=True, text=True)
+    lines = completed.stdout.strip().splitlines()
+    if completed.returncode != 0 or not lines:
+        return {"error": (completed.stderr.strip().splitlines() or [f"exit code {completed.returncode}"])[-1]}
+    return json.loads(lines[-1])
+
+def metadata():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                                text=True).stdout.strip() or None
+    except OSError:
+        commit = None
+    try:
+        from importlib.metadata import version
+        pyside = version("PySide6")
+    except Exception:
+        pyside = None
+    return {"commit": commit, "time": time.strftime("%Y-%m-%dT%H:%M:%S%z"), "python": platform.python_version(),
+            "pyside6": pyside, "platform": platform.platform(), "cpus": os.cpu_count()}
+
+def run_suite(cases, scales, out_path):
+    from synthetic_tree import make_tree
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        trees = {}
+        for scale in scales:
+            trees[scale] = os.path.join(tmp, "trees", scale)
+            files, size = make_tree(trees[scale], scale)
+            print(f"{scale}: {files} files, {size / MB:.1f} MB generated", file=sys.stderr)
+
+        plan = []
+        for case in cases:
+            if case in ("startup", "toggle"):
+                plan += [(case, str(count), count) for count in ITEM_COUNTS]
+            else:
+                plan += [(case, scale, trees[scale]) for scale in scales]
+        for case, label, parameter in plan:
+            work = os.path.join(tmp, "work", f"{case}-{label}")
+            if case == "copy":
+                setup = spawn("copy-setup", parameter, work)
+                result = setup if "error" in setup else spawn(case, parameter, work)
+            else:
+                result = spawn(case, parameter, work)
+            results[f"{case}/{label}"] = result
+            print(f"{case}/{label}: " + ", ".join(
+                f"{key}={value:.2f}" if isinstance(value, float) else f"{key}={value}"
+                for key, value in result.items()), file=sys.stderr)
+
+    report = {"meta": metadata(), "results": results}
+    with open(out_path, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"Wrote {out_path}", file=sys.stderr)
+    failed = [key for key, result in results.items() if "error" in result]
+    if failed:
+        print(f"{len(failed)} case(s) failed: {', '.join(failed)}", file=sys.stderr)
+    return 1 if failed else 0
+
+def compare(base_path, new_path, threshold):
+    with open(base_path, encoding="utf-8") as f:
+        base = json.load(f)
+    with open(new_path, encoding="utf-8") as f:
+        new = json.load(f)
+    print(f"{base['meta'].get('commit')} -> {new['meta'].get('commit')}")
+    print(f"{'metric':<42} {'before':>10} {'after':>10} {'change':>8}")
+    regressions = 0
+    for key in sorted(new["results"]):
+        if "error" in new["results"][key]:  # No figures to compare, and a failure all the same
+            regressions += 1
+            print(f"{key:<42} error: {new['results'][key]['error']}")
+    for key in sorted(base["results"].keys() & new["results"].keys()):
+        before_metrics, after_metrics = base["results"][key], new["results"][key]
+        for metric in sorted(before_metrics.keys() & after_metrics.keys()):
+            before, after = before_metrics[metric], after_metrics[metric]
+            if not (isinstance(before, (int, float)) and isinstance(after, (int, float))) or not before:
+                continue
+            change = after / before - 1
+            flag = ""
+            if metric.endswith(LOWER_IS_BETTER) and change > threshold:
+                flag = "  worse"
+            elif metric.endswith(HIGHER_IS_BETTER) and change < -threshold:
+                flag = "  worse"
+            regressions += bool(flag)
+            print(f"{key + '.' + metric:<42} {before:>10.2f} {after:>10.2f} {change:>+8.1%}{flag}")
+    return 1 if regressions else 0
+
+def main():
+    if len(sys.argv) > 1 and sys.argv[1] == "--child":
+        run_child(*sys.argv[2:5])
+    parser = argparse.ArgumentParser(description="Run the benchmark suite, or compare two result files.")
+    parser.add_argument("--out", default="benchmark-results.json")
+    parser.add_argument("--scales", default=",".join(DEFAULT_SCALES), help="from synthetic_tree.SCALES")
+    parser.add_argument("--cases", default=",".join(CASES), help=f"any of {', '.join(CASES)}")
+    parser.add_argument("--compare", nargs=2, metavar=("BEFORE", "AFTER"))
+    parser.add_argument("--threshold", type=float, default=0.1, help="relative change that counts as worse")
+    args = parser.parse_args()
+    if args.compare:
+        return compare(*args.compare, args.threshold)
+    cases = args.cases.split(",")
+    unknown = set(cases) - set(CASES)
+    if unknown:
+        parser.error(f"unknown case(s): {', '.join(sorted(unknown))}")
+    return run_suite(cases, args.scales.split(","), args.out)
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""Deterministic source trees shaped like date-fns, for the benchmarks.
+
+date-fns has ~250 functions, each a folder under src/ with an index.js, a
+test.js and type definitions, plus ~90 locales under src/locale/ (pruned by
+DEFAULT_EXCLUDE), markdown docs, and a node_modules/ that is never descended.
+make_tree() writes that layout at a chosen scale; the same scale and seed
+always produce byte-identical files.
+
+    python benchmarks/synthetic_tree.py DIR [small|medium|large|xlarge]
+"""
+import os
+import random
+import sys
+
+SCALES = {  # Name -> (functions, locales, docs)
+    "small": (50, 10, 5),
+    "medium": (250, 90, 20),  # About the size of date-fns itself
+    "large": (1000, 90, 60),
+    "xlarge": (5000, 90, 200),  # Opt-in stress scale
+}
+SEED = 42
+
+LICENSE = """/*
+ * Copyright (c) Synthetic Authors
+ * Licensed under the MIT License. See LICENSE in the project root.
+ */
+"""
+WORDS = ("date", "time", "interval", "day", "week", "month", "year", "hour", "minute", "second",
+         "start", "end", "add", "sub", "diff", "is", "get", "set", "format", "parse", "locale", "zone")
+
+def function_name(rng, index):
+    return f"{rng.choice(WORDS)}{rng.choice(WORDS).title()}{rng.choice(WORDS).title()}{index}"
+
+def index_js(rng, name):
+    params = ", ".join(rng.sample(("date", "amount", "options", "dateLeft", "dateRight", "interval"), rng.randint(1, 3)))
+    lines = [LICENSE if rng.random() < 0.3 else "", "import toDate from '../toDate/index.js'",
+             "import requiredArgs from '../_lib/requiredArgs/index.js'", "",
+             "/**", f" * @name {name}", " * @category Common Helpers", f" * @summary {name} helper.", " *",
+             " * @description"]
+    lines += [f" * {' '.join(rng.choices(WORDS, k=12))}" for _ in range(rng.randint(3, 12))]
+    lines += [" */", f"export default function {name}({params}) {{", f"  requiredArgs({params.count(',') + 1}, arguments)",
+              "  const result = toDate(date)"]
+    for i in range(rng.randint(10, 60)):
+        lines.append(f"  const {rng.choice(WORDS)}{i} = result.get{rng.choice(WORDS).title()}() + {rng.randint(0, 999)}"
+                     f"  // {' '.join(rng.choices(WORDS, k=4))}")
+    lines += ["  return result", "}", ""]
+    return "\n".join(lines)
+
+def test_js(rng, name):
+    lines = ["/* eslint-env mocha */", "import assert from 'assert'", f"import {name} from './index.js'", "",
+             f"describe('{name}', () => {{"]
+    for i in range(rng.randint(5, 30)):
+        lines += [f"  it('{' '.join(rng.choices(WORDS, k=6))}', () => {{",
+                  f"    const result = {name}(new Date({rng.randint(1970, 2030)}, {rng.randint(0, 11)}, {rng.randint(1, 28)}))",
+                  f"    assert.deepStrictEqual(result, {rng.randint(0, 10 ** 6)})", "  })", ""]
+    lines += ["})", ""]
+    return "\n".join(lines)
+
+def locale_js(rng, locale):
+    entries = ",\n".join(f"  {rng.choice(WORDS)}{i}: '{' '.join(rng.choices(WORDS, k=5))}'" for i in range(200))
+    return f"const locale = {{\n  code: '{locale}',\n{entries}\n}}\nexport default locale\n"
+
+def doc_md(rng, index):
+    paragraphs = ["\n".join(" ".join(rng.choices(WORDS, k=14)) for _ in range(rng.randint(2, 8)))
+                  for _ in range(rng.randint(5, 20))]
+    return f"# Guide {index}\n\n" + "\n\n".join(paragraphs) + "\n"
+
+def write(path, text):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w", encoding="utf-8", newline="\n") as f:
+        f.write(text)
+
+def make_tree(root, scale="medium", seed=SEED):
+    """Writes a date-fns-like tree under root; returns (files written, bytes written)."""
+    functions, locales, docs = SCALES[scale]
+    rng = random.Random(seed)
+    files = []
+    for i in range(functions):
+        name = function_name(rng, i)
+        files.append((f"src/{name}/index.js", index_js(rng, name)))
+        files.append((f"src/{name}/test.js", test_js(rng, name)))
+        files.append((f"src/{name}/index.d.ts", f"declare function {name}(date: Date | number): number\nexport default {name}\n"))
+    files.append(("src/index.js", "".join(f"export {{ default as f{i} }} from './f{i}/index.js'\n" for i in range(functions))))
+    for i in range(locales):
+        locale = f"l{i:02d}-{rng.choice(WORDS)}"
+        for part in ("index.js", "_lib/localize/index.js", "_lib/formatLong/index.js"):
+            files.append((f"src/locale/{locale}/{part}", locale_js(rng, locale)))
+    for i in range(docs):
+        files.append((f"docs/guide{i}.md", doc_md(rng, i)))
+    files.append(("README.md", doc_md(rng, "readme")))
+    files.append(("package.json", '{\n  "name": "synthetic-date-fns",\n  "version": "1.0.0"\n}\n'))
+    files.append(("yarn.lock", "".join(f"dep{i}@^1.0.0:\n  version \"1.0.{i}\"\n\n" for i in range(2000))))
+    files.append((".gitignore", "node_modules/\nlib/\n"))
+    for i in range(functions // 5):
+        files.append((f"node_modules/dep{i}/index.js", index_js(rng, f"dep{i}")))
+    total = 0
+    for relative_path, text in files:
+        write(os.path.join(root, relative_path), text)
+        total += len(text.encode("utf-8"))
+    return len(files), total
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        sys.exit(__doc__)
+    count, size = make_tree(sys.argv[1], sys.argv[2] if len(sys.argv) > 2 else "medium")
+    print(f"{count} files, {size / (1024 * 1024):.1f} MB")
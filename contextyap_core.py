@@ -0,0 +1,2030 @@
+"""Qt-free core of ContextYap: the item store, folder ingestion and context assembly.
+
+Shared by the GUI (contextyap_gui) and the command line (contextyap), which
+read and write the same state files.
+"""
+import os
+import io
+import re
+import sys
+import json
+import sqlite3
+import codecs
+import fnmatch
+import hashlib
+import tempfile
+import threading
+import uuid
+import time
+import zlib
+import atexit
+import contextlib
+import ast
+from collections import OrderedDict
+
+STATE_FILE = "state.json"
+CONTENT_DIR = "state_content"  # Content-addressed cold-copy bodies
+STORE_ENV = "CONTEXTYAP_STORE"  # "sqlite" selects SQLiteStateStore; anything else keeps STATE_FILE
+DATABASE_NAME = "contextyap.db"  # In user_data_dir()
+SEARCH_DATABASE_NAME = "search.db"  # Next to the store; a separate file so long index writes never block saves
+DATABASE_TIMEOUT = 5.0  # Seconds to wait on another process's write lock
+SOCKET_ENV = "CONTEXTYAP_SOCKET"  # Overrides server_address()
+TRACE_ENV = "CONTEXTYAP_TRACE"  # A JSONL file; turns profiling on at start-up and appends every span to it
+DEFAULT_OPACITY = 0.85
+INGEST_WORKERS = 8  # Parallel file reads per folder drop
+INGEST_PROGRESS_INTERVAL = 0.1  # Seconds between progress updates
+COPY_CHUNK_SIZE = 1024 * 1024  # Bytes read per step when streaming content out
+LINK_CACHE_SIZE = 64 * 1024 * 1024  # Characters of decoded live-link text kept between copies
+DEFAULT_TOKEN_BUDGET = 128000  # Tokens; the header total turns red above this
+
+# Include/exclude use .gitignore syntax; an empty include list takes every text file
+DEFAULT_INCLUDE = ['*.js', '*.md']  # date-fns exports 5k lines
+DEFAULT_EXCLUDE = ['.git/', 'node_modules/', '/src/locale/']  # Pruned, never descended
+
+# DEFAULT_INCLUDE = []  # date-fns exports 200k lines
+
+IGNORE_FILES = ('.gitignore', '.ignore')
+MAX_FILE_SIZE = 1024 * 1024  # Bytes; larger files are skipped
+BINARY_SNIFF_BYTES = 8192  # A NUL byte in this prefix marks a file as binary
+
+# Compaction (copy_context with a budget) replaces these files with a one-line stub
+STUB_FILE_NAMES = {
+    "package-lock.json", "npm-shrinkwrap.json", "yarn.lock", "pnpm-lock.yaml", "bun.lock", "Cargo.lock", "Gemfile.lock",
+    "poetry.lock", "Pipfile.lock", "uv.lock", "composer.lock", "go.sum", "mix.lock", "flake.lock",
+}
+STUB_LICENSE_NAME = re.compile(  # LICENSE, COPYING.LESSER, LICENSE-MIT.md...; not LicenseService.ts or licenses.py
+    r"(?:LICEN[CS]E|COPYING)(?:[-_.](?:MIT|APACHE(?:-2\.0)?|BSD|ISC|MPL|GPL|LGPL|AGPL|LESSER|LIB|THIRD-PARTY))?"
+    r"(?:\.(?:txt|md|markdown|rst))?", re.IGNORECASE)
+MINIFIED_LINE_LENGTH = 300  # Mean characters per line above which a file counts as minified
+MIN_TRUNCATED_TOKENS = 200  # Truncation never cuts a file below this
+DEDUPE_MIN_LENGTH = 64  # Characters below which a repeated file is cheaper to repeat than to back-reference
+BACK_REFERENCE = "[Same content as {}]"  # Filled with the header, or header/path, of the first copy
+HASH_COMMENT_EXTENSIONS = {".py", ".pyi", ".sh", ".bash", ".zsh", ".rb", ".pl", ".r", ".yaml", ".yml", ".toml", ".cfg", ".conf"}
+OUTLINE_CACHE_SIZE = 32 * 1024 * 1024  # Characters of outline text kept between copies
+OUTLINE_PARALLEL_MIN = 64  # Files in one batch before outlining moves to a process pool
+OUTLINE_SUMMARY_LENGTH = 120  # Characters of a docstring's first line kept in an outline
+PYTHON_EXTENSIONS = {".py", ".pyi"}
+SCRIPT_EXTENSIONS = {".js", ".jsx", ".mjs", ".cjs", ".ts", ".tsx", ".mts", ".cts"}
+MARKDOWN_EXTENSIONS = {".md", ".markdown"}
+SLASH_COMMENT_EXTENSIONS = {
+    ".js", ".jsx", ".mjs", ".cjs", ".ts", ".tsx", ".c", ".h", ".cc", ".cpp", ".hpp", ".java", ".kt", ".go", ".rs",
+    ".swift", ".cs", ".scala", ".dart", ".php", ".css", ".scss", ".less",
+}
+
+class _Span:
+    __slots__ = ("profiler", "name", "start")
+
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.profiler.record(self.name, time.perf_counter() - self.start)
+
+_NO_SPAN = contextlib.nullcontext()
+
+class Profiler:
+    """Named timing spans and counters around the hot paths, shared by every thread.
+
+    While disabled, span() hands back one shared no-op context manager and
+    count() returns after a single attribute check, so instrumented code runs
+    at its uninstrumented speed. Enabled, each span name keeps its call count,
+    total and worst time; with a trace file, every span is also appended as a
+    JSON line, and the counters follow when tracing stops.
+    """
+    def __init__(self):
+        self.enabled = False
+        self.spans = {}  # Name -> [calls, total seconds, worst seconds]
+        self.counters = {}
+        self.trace_path = None
+        self._trace = None
+        self._lock = threading.Lock()
+
+    def enable(self, trace_path=None):
+        with self._lock:
+            if trace_path and self._trace is None:
+                self._trace = open(trace_path, "a", encoding="utf-8", buffering=1)  # Line-buffered: survives a crash
+                self.trace_path = trace_path
+                atexit.register(self.close)
+            self.enabled = True
+
+    def enable_from_env(self):
+        if os.environ.get(TRACE_ENV):
+            self.enable(os.environ[TRACE_ENV])
+
+    def disable(self):
+        self.enabled = False
+        self.close()
+
+    def close(self):
+        """Writes the counters to the trace file, if one is open, and closes it."""
+        with self._lock:
+            if self._trace is not None:
+                self._trace.write(json.dumps({"counters": self.counters, "time": round(time.time(), 3)}) + "\n")
+                self._trace.close()
+                self._trace = self.trace_path = None
+
+    def reset(self):
+        with self._lock:
+            self.spans = {}
+            self.counters = {}
+
+    def span(self, name):
+        return _Span(self, name) if self.enabled else _NO_SPAN
+
+    def count(self, name, amount=1):
+        if self.enabled:
+            with self._lock:
+                self.counters[name] = self.counters.get(name, 0) + amount
+
+    def record(self, name, elapsed):
+        with self._lock:
+            totals = self.spans.setdefault(name, [0, 0.0, 0.0])
+            totals[0] += 1
+            totals[1] += elapsed
+            totals[2] = max(totals[2], elapsed)
+            if self._trace is not None:
+                self._trace.write(json.dumps({"span": name, "ms": round(elapsed * 1000, 3),
+                                              "start": round(time.time() - elapsed, 6),
+                                              "thread": threading.current_thread().name}) + "\n")
+
+    def report(self):
+        """The spans, largest total first, then the counters, as aligned text."""
+        with self._lock:
+            spans = sorted(self.spans.items(), key=lambda item: -item[1][1])
+            counters = sorted(self.counters.items())
+        lines = [f"{'span':<24} {'calls':>7} {'total ms':>10} {'mean ms':>9} {'max ms':>9}"]
+        for name, (calls, total, worst) in spans:
+            lines.append(f"{name:<24} {calls:>7} {total * 1000:>10.1f} {total * 1000 / calls:>9.2f} {worst * 1000:>9.2f}")
+        lines.append("")
+        lines.extend(f"{name:<24} {value:>12,}" for name, value in counters)
+        return "\n".join(lines)
+
+PROFILER = Profiler()  # Off until enable(), the debug panel, or TRACE_ENV
+
+def atomic_write(path, data):
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".tmp-", suffix=os.path.basename(path))
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+def glob_to_regex(pattern):
+    """Translates the body of a .gitignore pattern (no `!`, no trailing `/`)."""
+    parts = []
+    i = 0
+    while i < len(pattern):
+        if pattern.startswith("**/", i):
+            parts.append("(?:.*/)?")
+            i += 3
+        elif pattern.startswith("/**", i) and i + 3 == len(pattern):
+            parts.append("/.*")
+            i += 3
+        elif pattern.startswith("**", i):
+            parts.append(".*")
+            i += 2
+        elif pattern[i] == "*":
+            parts.append("[^/]*")
+            i += 1
+        elif pattern[i] == "?":
+            parts.append("[^/]")
+            i += 1
+        elif pattern[i] == "[" and "]" in pattern[i + 1:]:
+            end = pattern.index("]", i + 1)
+            body = pattern[i + 1:end]
+            if body.startswith("!"):
+                body = "^" + body[1:]
+            parts.append(f"[{body}]")
+            i = end + 1
+        elif pattern[i] == "\\" and i + 1 < len(pattern):
+            parts.append(re.escape(pattern[i + 1]))
+            i += 2
+        else:
+            parts.append(re.escape(pattern[i]))
+            i += 1
+    return "".join(parts)
+
+class IgnoreRules:
+    """An ordered list of .gitignore-style rules; the last matching rule wins.
+
+    Paths are POSIX-style and relative to the dropped folder. Rules read from a
+    nested ignore file only apply below the directory that holds it.
+    """
+    def __init__(self, rules=()):
+        self.rules = list(rules)  # (compiled regex, negated, dir_only)
+
+    def extended(self, lines, base="", ignore_case=False):
+        """A copy with lines appended; ignore_case suits extension lists, not ignore files."""
+        rules = IgnoreRules(self.rules)
+        for line in lines:
+            line = line.rstrip("\n").rstrip()
+            if not line or line.startswith("#"):
+                continue
+            negated = line.startswith("!")
+            if negated:
+                line = line[1:]
+            dir_only = line.endswith("/")
+            line = line.rstrip("/")
+            if not line:
+                continue
+            anchored = "/" in line
+            body = glob_to_regex(line.lstrip("/"))
+            prefix = re.escape(base + "/") if base else ""
+            regex = f"^{prefix}{body}$" if anchored else f"^{prefix}(?:.*/)?{body}$"
+            rules.rules.append((re.compile(regex, re.IGNORECASE if ignore_case else 0), negated, dir_only))
+        return rules
+
+    def match(self, relative_path, is_dir):
+        ignored = False
+        for regex, negated, dir_only in self.rules:
+            if dir_only and not is_dir:
+                continue
+            if regex.match(relative_path):
+                ignored = not negated
+        return ignored
+
+class IngestFilter:
+    """Decides which files a folder drop reads.
+
+    Directories matched by an exclude pattern or an ignore file are pruned from
+    the walk in place, so their contents are never listed.
+    """
+    def __init__(self, include=None, exclude=None, max_file_size=MAX_FILE_SIZE):
+        self.include = list(DEFAULT_INCLUDE if include is None else include)
+        self.exclude = list(DEFAULT_EXCLUDE if exclude is None else exclude)
+        self.max_file_size = max_file_size
+        self._include_rules = IgnoreRules().extended(self.include, ignore_case=True)  # README.MD counts as *.md
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data.get("include"), data.get("exclude"), data.get("max_file_size", MAX_FILE_SIZE))
+
+    def to_dict(self):
+        return {"include": self.include, "exclude": self.exclude, "max_file_size": self.max_file_size}
+
+    def _rules_for(self, directory, relative_dir, parent_rules):
+        lines = []
+        for ignore_file in IGNORE_FILES:
+            try:
+                with open(os.path.join(directory, ignore_file), "r", encoding="utf-8") as f:
+                    lines.extend(f.readlines())
+            except FileNotFoundError:
+                pass
+            except (OSError, UnicodeDecodeError):
+                PROFILER.count("errors.ignore_file")  # Read as if absent
+        rules = parent_rules.extended(lines, relative_dir) if lines else parent_rules
+        # User excludes are appended last so they win over ignore-file negations
+        return rules.extended(self.exclude) if lines or not relative_dir else rules
+
+    def iter_files(self, folder_path, directories=None):
+        """Yields matching file paths; appends every directory walked to directories, if given."""
+        rules_by_dir = {folder_path: self._rules_for(folder_path, "", IgnoreRules())}
+        for root, dir_names, file_names in os.walk(folder_path):
+            if directories is not None:
+                directories.append(root)
+            relative_root = os.path.relpath(root, folder_path).replace(os.sep, "/")
+            relative_root = "" if relative_root == "." else relative_root
+            rules = rules_by_dir.pop(root)
+
+            kept_dirs = []
+            for dir_name in dir_names:
+                relative_path = f"{relative_root}/{dir_name}" if relative_root else dir_name
+                if not rules.match(relative_path, True):
+                    kept_dirs.append(dir_name)
+                    dir_path = os.path.join(root, dir_name)
+                    rules_by_dir[dir_path] = self._rules_for(dir_path, relative_path, rules)
+            dir_names[:] = kept_dirs  # Prune in place so os.walk never descends
+
+            for file_name in file_names:
+                relative_path = f"{relative_root}/{file_name}" if relative_root else file_name
+                if rules.match(relative_path, False):
+                    continue
+                if self.include and not self._include_rules.match(relative_path, False):
+                    continue
+                file_path = os.path.join(root, file_name)
+                try:
+                    if os.path.getsize(file_path) > self.max_file_size:
+                        PROFILER.count("skipped.too_large")
+                        continue
+                except OSError:
+                    PROFILER.count("errors.stat")
+                    continue
+                yield file_path
+
+def format_progress(files_read, bytes_read):
+    return f"{files_read} files, {bytes_read / (1024 * 1024):.1f} MB"
+
+def ingest_folder(folder_path, blobs, ingest_filter, cancelled=None, progress=None):
+    """Reads a folder's matching files on a worker pool into one fenced blob.
+
+    The `📎 relative/path` output is assembled in walk order, alongside a
+    segment index blob of [relative path, segment_key(), start, end] per file
+    for copy-time dedup. Returns the content hash, measure_text() stats and
+    index hash, (None, None, None) if no file matched, or None once the
+    cancelled Event is set. progress(files read, bytes read) is called at most
+    every INGEST_PROGRESS_INTERVAL seconds.
+    """
+    file_paths = []
+    with PROFILER.span("ingest.walk"):
+        for file_path in ingest_filter.iter_files(folder_path):
+            if cancelled and cancelled.is_set():
+                return None
+            file_paths.append(file_path)
+
+    formatted_content = []
+    segments = []
+    position = 0  # Of the next line in the joined output
+    files_read = bytes_read = 0
+    last_report = time.monotonic()
+    from concurrent.futures import ThreadPoolExecutor  # Deferred: costs the CLI ~10 ms at start-up
+    with PROFILER.span("ingest.read"), ThreadPoolExecutor(max_workers=INGEST_WORKERS) as pool:
+        for file_path, result in zip(file_paths, pool.map(read_text_file, file_paths)):
+            if cancelled and cancelled.is_set():
+                pool.shutdown(cancel_futures=True)
+                return None
+            if result is None:
+                continue  # Counted by read_text_file()
+            content, size = result
+            relative_path = os.path.relpath(file_path, folder_path)
+            header = f"📎 {relative_path}\n```\n"
+            formatted_content.append(header + content + "\n```")
+            start = position + len(header)
+            segments.append([relative_path, segment_key(content), start, start + len(content)])
+            position = start + len(content) + 5  # Closing fence and the joining newline
+            files_read += 1
+            bytes_read += size
+            now = time.monotonic()
+            if progress and now - last_report >= INGEST_PROGRESS_INTERVAL:
+                progress(files_read, bytes_read)
+                last_report = now
+
+    if not formatted_content:
+        return None, None, None
+    with PROFILER.span("ingest.store"):
+        full_content = "\n".join(formatted_content)
+        return blobs.put(full_content), measure_text(full_content), blobs.put(json.dumps({"segments": segments}))
+
+def read_text_file(file_path):
+    """Returns (content, size in bytes), or None for unreadable, binary or non-UTF-8 files."""
+    try:
+        with open(file_path, "rb") as f:
+            data = f.read()
+    except OSError:
+        PROFILER.count("errors.read")
+        return None
+    PROFILER.count("bytes.read", len(data))
+    if b"\0" in data[:BINARY_SNIFF_BYTES]:
+        PROFILER.count("skipped.binary")
+        return None
+    try:
+        content = data.decode("utf-8")
+    except UnicodeDecodeError:
+        PROFILER.count("skipped.not_utf8")
+        return None
+    PROFILER.count("files.read")
+    # Match text-mode reads: universal newlines
+    return content.replace("\r\n", "\n").replace("\r", "\n"), len(data)
+
+def estimate_tokens(text):
+    """Local token estimate: BPE tokenizers average about 4 characters per token on code and prose."""
+    return (len(text) + 3) // 4
+
+TOKEN_ESTIMATOR = estimate_tokens  # Any text -> int callable; cached counts are dropped when its name changes
+
+def measure_text(text):
+    """Returns [bytes, lines, estimated tokens] for text."""
+    lines = text.count("\n") + (1 if text and not text.endswith("\n") else 0)
+    return [len(text.encode("utf-8")), lines, TOKEN_ESTIMATOR(text)]
+
+def segment_key(text):
+    """Hash of one file's text for copy-time dedup, blind to trailing whitespace and blank lines at either end.
+
+    None for texts under DEDUPE_MIN_LENGTH, which are never deduplicated.
+    """
+    normalized = "\n".join(line.rstrip() for line in text.split("\n")).strip("\n")
+    if len(normalized) < DEDUPE_MIN_LENGTH:
+        return None
+    return hashlib.blake2b(normalized.encode("utf-8"), digest_size=16).hexdigest()
+
+def format_count(count):
+    if count >= 1000000:
+        return f"{count / 1000000:.1f}M"
+    if count >= 1000:
+        return f"{count / 1000:.1f}k"
+    return str(count)
+
+def write_chunks(sink, chunks, error_format):
+    """Writes text chunks to sink; on failure, replaces whatever this call wrote with an error."""
+    start = sink.tell() if sink.seekable() else None
+    try:
+        for chunk in chunks:
+            sink.write(chunk)
+    except (OSError, ValueError, zlib.error) as e:  # ValueError covers UnicodeDecodeError
+        PROFILER.count("errors.copy")
+        if start is not None:
+            sink.seek(start)
+            sink.truncate()
+        sink.write(error_format.format(e))
+
+def iter_file_text(file_path):
+    """Yields a file's text in chunks, with the universal newlines of a text-mode read."""
+    decoder = io.IncrementalNewlineDecoder(codecs.getincrementaldecoder("utf-8")(), translate=True)
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(COPY_CHUNK_SIZE), b""):
+            yield decoder.decode(chunk)
+    yield decoder.decode(b"", final=True)
+
+class LinkCache:
+    """LRU cache of decoded live-link text, validated by (mtime_ns, size, inode).
+
+    A hit costs one stat call. Files too large to be worth holding are streamed
+    from disk every time. Each cached text keeps its segment_key(), computed
+    once per version of the file. Safe to use from the copy thread while the
+    GUI thread invalidates entries.
+    """
+    def __init__(self, max_size=LINK_CACHE_SIZE):
+        self.max_size = max_size
+        self._entries = OrderedDict()  # path -> (signature, text, segment key)
+        self._size = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def signature(file_path):
+        stat = os.stat(file_path)
+        return stat.st_mtime_ns, stat.st_size, stat.st_ino
+
+    def iter_text(self, file_path):
+        signature = self.signature(file_path)
+        with self._lock:
+            entry = self._entries.get(file_path)
+            if entry and entry[0] == signature:
+                self._entries.move_to_end(file_path)
+                yield entry[1]
+                return
+        if signature[1] > self.max_size // 4:
+            yield from iter_file_text(file_path)
+            return
+        text = "".join(iter_file_text(file_path))
+        key = segment_key(text)
+        with self._lock:
+            self._discard(file_path)
+            self._entries[file_path] = (signature, text, key)
+            self._size += len(text)
+            while self._size > self.max_size:
+                _, (_, evicted, _) = self._entries.popitem(last=False)
+                self._size -= len(evicted)
+        yield text
+
+    def segment_key(self, file_path):
+        """segment_key() of the file's current text, reading it into the cache if needed; None if too large to cache."""
+        signature = self.signature(file_path)
+        if signature[1] > self.max_size // 4:
+            return None
+        with self._lock:
+            entry = self._entries.get(file_path)
+        if not (entry and entry[0] == signature):
+            for _ in self.iter_text(file_path):
+                pass
+            with self._lock:
+                entry = self._entries.get(file_path)
+        return entry[2] if entry else None
+
+    def invalidate(self, file_path):
+        with self._lock:
+            self._discard(file_path)
+
+    def _discard(self, file_path):
+        entry = self._entries.pop(file_path, None)
+        if entry:
+            self._size -= len(entry[1])
+
+def refreshed_text(folder_link, seen=None, outlines=None):
+    if not os.path.isdir(folder_link.folder_path):
+        raise FileNotFoundError(f"No such directory: '{folder_link.folder_path}'")
+    folder_link.refresh()
+    yield from folder_link.iter_text(seen, outlines)
+
+class FolderLink:
+    """A live-linked folder, kept as a manifest of per-file segments in the BlobStore.
+
+    refresh() stats every file the filter selects and re-reads only those whose
+    (mtime_ns, size) changed; the fenced output is rebuilt from stored segments.
+    """
+    def __init__(self, folder_path, blobs, ingest_filter, manifest_hash=None):
+        self.folder_path = folder_path
+        self.blobs = blobs
+        self.ingest_filter = ingest_filter
+        self.manifest_hash = manifest_hash
+        self.entries = []  # [relative path, mtime_ns, size, content hash or None if unreadable, stats, segment key]
+        self.directories = []
+        self.lock = threading.Lock()
+        if manifest_hash:
+            try:
+                self.entries = json.loads(blobs.get(manifest_hash))["entries"]
+            except (OSError, ValueError, KeyError, zlib.error):
+                self.entries = []
+
+    def refresh(self):
+        """Brings the manifest up to date; returns True if any file was added, changed or removed."""
+        with self.lock, PROFILER.span("folder_link.refresh"):
+            known = {entry[0]: entry for entry in self.entries}
+            directories = []
+            entries = []
+            stale = []
+            for file_path in self.ingest_filter.iter_files(self.folder_path, directories):
+                relative_path = os.path.relpath(file_path, self.folder_path)
+                try:
+                    stat = os.stat(file_path)
+                except OSError:
+                    PROFILER.count("errors.stat")
+                    continue
+                entry = known.get(relative_path)
+                # Entries from before segment keys existed are re-read once
+                if not (entry and len(entry) == 6 and entry[1] == stat.st_mtime_ns and entry[2] == stat.st_size):
+                    entry = [relative_path, stat.st_mtime_ns, stat.st_size, None, None, None]
+                    stale.append((entry, file_path))
+                entries.append(entry)
+
+            from concurrent.futures import ThreadPoolExecutor
+            with ThreadPoolExecutor(max_workers=INGEST_WORKERS) as pool:
+                for (entry, _), result in zip(stale, pool.map(read_text_file, [file_path for _, file_path in stale])):
+                    if result is not None:  # Unreadable files stay in the manifest so they aren't retried
+                        content, _ = result
+                        entry[3] = self.blobs.put(content)
+                        entry[4] = measure_text(f"📎 {entry[0]}\n```\n{content}\n```")
+                        entry[5] = segment_key(content)
+
+            self.directories = directories
+            if entries == self.entries and self.manifest_hash:
+                return False
+            self.entries = entries
+            self.manifest_hash = self.blobs.put(json.dumps({"entries": entries}))
+            return True
+
+    def blob_hashes(self):
+        hashes = {entry[3] for entry in self.entries if entry[3]}
+        if self.manifest_hash:
+            hashes.add(self.manifest_hash)
+        return hashes
+
+    def sources(self):
+        """(relative path, text, content hash) of every readable file, for OutlineCache.warm()."""
+        with self.lock:
+            entries = list(self.entries)
+        for relative_path, _, _, content_hash, *_ in entries:
+            if content_hash:
+                yield relative_path, self.blobs.get(content_hash), content_hash
+
+    def stats(self):
+        segments = [entry[4] for entry in self.entries if entry[3]]
+        if not segments:
+            return [0, 0, 0]
+        # Segments are joined with "\n", which adds a byte but no line between each pair
+        return [sum(stats[0] for stats in segments) + len(segments) - 1,
+                sum(stats[1] for stats in segments),
+                sum(stats[2] for stats in segments)]
+
+    def iter_text(self, seen=None, outlines=None):
+        """Yields the fenced segments; with a seen dict, repeats of earlier content become back-references.
+
+        With an OutlineCache, each file is replaced by its outline.
+        """
+        with self.lock:
+            entries = list(self.entries)
+        first = True
+        for relative_path, _, _, content_hash, _, *key in entries:
+            if not content_hash:
+                continue
+            yield f"📎 {relative_path}\n```\n" if first else f"\n📎 {relative_path}\n```\n"
+            chunks = self.blobs.iter_text(content_hash)
+            if outlines is not None:
+                chunks = _outlined(outlines, relative_path, chunks, content_hash)
+            if seen is not None:
+                chunks = first_occurrence(_outline_key(key[0] if key else None, outlines),
+                                          os.path.join(self.folder_path, relative_path), seen, chunks)
+            yield from chunks
+            yield "\n```"
+            first = False
+
+def file_item(file_path, is_link, store):
+    """Builds the item for a dropped file: a live link, or a cold copy stored now."""
+    name, _ = os.path.splitext(os.path.basename(file_path))
+    if is_link:
+        return {"name": name, "is_link": True, "link_path": os.path.abspath(file_path), "checked": False}
+    try:
+        with open(file_path, "r", encoding="utf-8") as f:
+            content = f.read()
+    except Exception as e:
+        PROFILER.count("errors.read")
+        content = f"[Error reading file: {e}]"
+    content_hash = store.put_content(content)
+    return {"name": name, "is_link": False, "content_hash": content_hash, "segment_key": segment_key(content),
+            "checked": False, "stats": store.content_stats[content_hash]}
+
+def folder_link_item(folder_path):
+    folder_path = os.path.abspath(folder_path)
+    name = os.path.basename(folder_path.rstrip(os.sep)) or folder_path
+    return {"name": name, "is_link": True, "is_folder": True, "link_path": folder_path,
+            "folder_path": folder_path, "checked": False}
+
+def sync_folder_item(item_data, folder_link, store):
+    """Copies a FolderLink's manifest hash, blobs and stats onto its item; returns its directories."""
+    with folder_link.lock:
+        item_data["manifest_hash"] = folder_link.manifest_hash
+        item_data["blob_hashes"] = folder_link.blob_hashes()
+        item_data["stats"] = folder_link.stats() if folder_link.entries else None
+        directories = list(folder_link.directories)
+    store.track_blobs(item_data["blob_hashes"])
+    return directories
+
+def search_keys(item_data):
+    """SearchIndex keys for an item's text: content hashes, or the path of a live file."""
+    if item_data.get("is_folder"):
+        return [content_hash for content_hash in item_data.get("blob_hashes", ())
+                if content_hash != item_data.get("manifest_hash")]
+    if item_data["is_link"]:
+        return [f"link:{item_data['link_path']}"]
+    return [item_data["content_hash"]] if item_data.get("content_hash") else []
+
+def first_occurrence(key, label, seen, chunks):
+    """Yields chunks the first time key turns up in seen, and a back-reference to label's copy after that."""
+    if key is not None:
+        if key in seen:
+            yield BACK_REFERENCE.format(seen[key])
+            return
+        seen[key] = label
+    yield from chunks
+
+def _outlined(outlines, path, chunks, content_hash=None):
+    yield outlines.get(path, "".join(chunks), content_hash)
+
+def _outline_key(key, outlines):
+    """The dedup key of a file copied as an outline, which must not stand in for (or be) its full copy."""
+    return f"outline:{key}" if key and outlines is not None else key
+
+def _live_link_text(link_cache, file_path, seen, outlines=None):
+    key = link_cache.segment_key(file_path)  # Inside the generator, so a missing file fails like a read
+    chunks = link_cache.iter_text(file_path)
+    if outlines is not None:
+        chunks = _outlined(outlines, file_path, chunks)
+    yield from first_occurrence(_outline_key(key, outlines), file_path, seen, chunks)
+
+def _cold_folder_text(blobs, item_data, seen, outlines=None):
+    """A cold folder drop's body, sliced along its segment index so repeated files become back-references.
+
+    seen may be None when only outlines are wanted.
+    """
+    try:
+        segments = json.loads(blobs.get(item_data["segments_hash"]))["segments"]
+    except (OSError, ValueError, KeyError, zlib.error):
+        PROFILER.count("errors.segment_index")
+        yield from blobs.iter_text(item_data["content_hash"])  # Lost index: copy in full, without dedup
+        return
+    for gap, body, segment in _split_segments(blobs.iter_text(item_data["content_hash"]), segments):
+        yield gap
+        if segment is None:
+            continue
+        relative_path, key = segment[:2]
+        if outlines is not None:
+            body = outlines.get(relative_path, body)
+        if seen is None:
+            yield body
+        else:
+            yield from first_occurrence(_outline_key(key, outlines), os.path.join(item_data["name"], relative_path),
+                                        seen, (body,))
+
+def _split_segments(chunks, segments):
+    """Slices streamed folder text along its segment index, holding one file and one read chunk in memory.
+
+    Yields (text before the segment, the segment's text, segment) for each
+    segment, then (the rest, None, None).
+    """
+    chunks = iter(chunks)
+    buffer = ""
+    offset = 0  # Of buffer[0] in the whole text
+    position = 0  # End of the previous segment
+    for segment in segments:
+        start, end = segment[2], segment[3]
+        if offset + len(buffer) < end:
+            pieces = [buffer[position - offset:]]
+            offset = position
+            size = len(pieces[0])
+            while offset + size < end:
+                chunk = next(chunks, None)
+                if chunk is None:
+                    raise ValueError("Stored folder text is shorter than its segment index")
+                pieces.append(chunk)
+                size += len(chunk)
+            buffer = "".join(pieces)
+        yield buffer[position - offset:start - offset], buffer[start - offset:end - offset], segment
+        position = end
+    yield buffer[position - offset:] + "".join(chunks), None, None
+
+def outline_sources(items, store, link_cache=None, folder_links=None):
+    """(path or None, text, content hash or None) of every file in the items copied as outlines.
+
+    Unreadable items are skipped; the copy reports their errors.
+    """
+    for item_data in items:
+        if item_data.get("copy_mode") != "outline":
+            continue
+        try:
+            if item_data.get("is_folder"):
+                if folder_links and item_data["id"] in folder_links:
+                    yield from folder_links[item_data["id"]].sources()
+            elif item_data["is_link"]:
+                file_path = item_data["link_path"]
+                chunks = link_cache.iter_text(file_path) if link_cache else iter_file_text(file_path)
+                yield file_path, "".join(chunks), None
+            elif item_data.get("segments_hash"):
+                segments = json.loads(store.blobs.get(item_data["segments_hash"]))["segments"]
+                for _, body, segment in _split_segments(store.blobs.iter_text(item_data["content_hash"]), segments):
+                    if segment is not None:
+                        yield segment[0], body, None
+            elif item_data.get("content_hash") and not item_data.get("folder_path"):
+                yield None, store.blobs.get(item_data["content_hash"]), item_data["content_hash"]
+        except (OSError, ValueError, KeyError, zlib.error):
+            continue
+
+def outline_stats(item_data, store, outlines, link_cache=None, folder_links=None):
+    """Approximate measure_text() counts of an item copied as an outline, outlining its files on the way."""
+    sources = list(outline_sources([item_data], store, link_cache, folder_links))
+    outlines.warm(sources)
+    return measure_text("\n".join(outlines.get(*source) for source in sources))
+
+def select_items(items, patterns):
+    """Items whose name (with or without the 📎 prefix) or path matches any pattern; names take shell wildcards."""
+    paths = {os.path.abspath(pattern) for pattern in patterns}
+    selected = []
+    for item_data in items:
+        names = (item_data["name"], item_data["name"].removeprefix("📎 "))
+        if (any(fnmatch.fnmatchcase(name, pattern) for name in names for pattern in patterns)
+                or item_data.get("link_path") in paths or item_data.get("folder_path") in paths):
+            selected.append(item_data)
+    return selected
+
+def item_body(item_data, store, link_cache=None, folder_links=None, seen=None, outlines=None):
+    """An item's header line, its body as text chunks, and the format for a read error.
+
+    seen maps the segment keys of files already emitted to a label for them;
+    when given, later copies of a file are replaced by a back-reference. Keys
+    come from ingest (cold items, folder manifests) or the link cache, so
+    nothing is rehashed here. With an OutlineCache, an item whose copy_mode is
+    "outline" has each of its files replaced by its outline.
+    """
+    if item_data.get("copy_mode") != "outline":
+        outlines = None
+    if item_data.get("is_folder"):
+        return item_data["link_path"], refreshed_text(folder_links[item_data["id"]], seen, outlines), "[Error: {}]"
+    if item_data["is_link"]:
+        if link_cache and seen is not None:
+            chunks = _live_link_text(link_cache, item_data["link_path"], seen, outlines)
+        else:
+            chunks = link_cache.iter_text(item_data["link_path"]) if link_cache else iter_file_text(item_data["link_path"])
+            if outlines is not None:
+                chunks = _outlined(outlines, item_data["link_path"], chunks)
+        return item_data["link_path"], chunks, "[Error: {}]"
+    if item_data.get("content_hash"):
+        if item_data.get("segments_hash") and (seen is not None or outlines is not None):
+            chunks = _cold_folder_text(store.blobs, item_data, seen, outlines)
+        else:
+            chunks = store.blobs.iter_text(item_data["content_hash"])
+            if outlines is not None and not item_data.get("folder_path"):
+                chunks = _outlined(outlines, None, chunks, item_data["content_hash"])
+            if seen is not None:
+                chunks = first_occurrence(_outline_key(item_data.get("segment_key"), outlines), item_data["name"],
+                                          seen, chunks)
+    else:
+        chunks = iter(["[No content available]"])
+    return item_data["name"], chunks, "[Error reading stored content: {}]"
+
+def write_context(items, store, sink, link_cache=None, folder_links=None, outlines=None):
+    """Streams the fenced context for items into a text sink.
+
+    Each body goes straight from disk (or the link cache) to the sink, so memory
+    use is the sink itself (nothing for a file or stdout). Folder links are
+    refreshed first, re-reading only changed files. A file that reaches the
+    context more than once (a folder drop, a cold copy and a live link of the
+    same file) is written once; later copies are back-references. Items copied
+    as outlines are outlined up front, in parallel. Returns True if anything
+    was written.
+    """
+    if outlines is not None:
+        outlines.warm(outline_sources(items, store, link_cache, folder_links))
+    wrote = False
+    seen = {}
+    for item_data in items:
+        if wrote:
+            sink.write("\n")
+        header, chunks, error_format = item_body(item_data, store, link_cache, folder_links, seen, outlines)
+        sink.write(f"{header}\n```\n")
+        write_chunks(sink, chunks, error_format)
+        sink.write("\n```\n")
+        wrote = True
+    return wrote
+
+FILE_SEGMENT = re.compile(r"📎 ([^\n]*)\n```\n(.*?)\n```(?:\n(?=📎 )|\Z)", re.S)
+
+class ContextPart:
+    """One checked item, read into memory as files for compaction.
+
+    Folder bodies (cold drops and folder links) hold one `📎 path` fenced
+    segment per file; any other body is a single file named after the item.
+    render() reproduces write_context() output exactly until files are edited.
+    """
+    def __init__(self, header, body, is_folder):
+        self.header = header
+        self.files = None
+        if is_folder:
+            files = [[match.group(1), match.group(2)] for match in FILE_SEGMENT.finditer(body)]
+            if sum(len(path) + len(text) + 12 for path, text in files) - 1 == len(body):  # Parsed with no gaps
+                self.files = files
+        self.is_folder = self.files is not None
+        if self.files is None:
+            self.files = [[header, body]]
+
+    def render(self):
+        if not self.is_folder:
+            return f"{self.header}\n```\n{self.files[0][1]}\n```\n"
+        segments = "\n".join(f"📎 {path}\n```\n{text}\n```" for path, text in self.files)
+        return f"{self.header}\n```\n{segments}\n```\n"
+
+def read_context_parts(items, store, link_cache=None, folder_links=None, outlines=None):
+    if outlines is not None:
+        outlines.warm(outline_sources(items, store, link_cache, folder_links))
+    parts = []
+    seen = {}
+    for item_data in items:
+        header, chunks, error_format = item_body(item_data, store, link_cache, folder_links, seen, outlines)
+        body = io.StringIO()
+        write_chunks(body, chunks, error_format)
+        parts.append(ContextPart(header, body.getvalue(), bool(item_data.get("is_folder") or item_data.get("folder_path"))))
+    return parts
+
+def render_context(parts, sink):
+    for i, part in enumerate(parts):
+        if i:
+            sink.write("\n")
+        sink.write(part.render())
+    return bool(parts)
+
+def _comment_style(path):
+    _, extension = os.path.splitext(path.lower())
+    if extension in HASH_COMMENT_EXTENSIONS or os.path.basename(path) in ("Makefile", "Dockerfile"):
+        return "#"
+    if extension in SLASH_COMMENT_EXTENSIONS:
+        return "//"
+    return None
+
+def _collapse_whitespace(path, text):
+    lines = [line.rstrip() for line in text.split("\n")]
+    kept = [line for i, line in enumerate(lines) if line or (i and lines[i - 1])]  # At most one blank line in a row
+    return "\n".join(kept).strip("\n")
+
+def _stub(path, text):
+    name = os.path.basename(path)
+    line_count = text.count("\n") + 1
+    if name in STUB_FILE_NAMES:
+        return f"[Lockfile omitted: {line_count:,} lines]"
+    if STUB_LICENSE_NAME.fullmatch(name):
+        return f"[License text omitted: {line_count:,} lines]"
+    if ".min." in name or name.endswith(".map") or (len(text) > 4096 and len(text) / line_count > MINIFIED_LINE_LENGTH):
+        return f"[Minified file omitted: {len(text):,} characters]"
+    return text
+
+def _strip_license_header(path, text):
+    style = _comment_style(path)
+    if style is None:
+        return text
+    lines = text.split("\n")
+    end = 1 if lines[0].startswith("#!") else 0
+    start = end
+    in_block = False
+    while end < len(lines):  # The leading run of comment (or blank) lines
+        stripped = lines[end].strip()
+        if in_block:
+            in_block = "*/" not in stripped
+        elif style == "//" and stripped.startswith("/*"):
+            in_block = "*/" not in stripped[2:]
+        elif not (stripped.startswith(style) or not stripped):
+            break
+        end += 1
+    header = "\n".join(lines[start:end]).lower()
+    if "license" not in header and "licence" not in header and "copyright" not in header:
+        return text
+    return "\n".join(lines[:start] + lines[end:])
+
+def _strip_comments(path, text):
+    """Drops whole-line comments only, so comment markers inside strings are never touched."""
+    style = _comment_style(path)
+    if style is None:
+        return text
+    kept = []
+    in_block = False
+    for i, line in enumerate(text.split("\n")):
+        stripped = line.lstrip()
+        if in_block:
+            in_block = "*/" not in stripped
+            continue
+        if style == "//" and stripped.startswith("/*") and not stripped.startswith("/**/"):
+            end = stripped.find("*/", 2)
+            if end == -1:
+                in_block = True
+                continue
+            if not stripped[end + 2:].strip():
+                continue
+        elif stripped.startswith(style) and not (i == 0 and stripped.startswith("#!")):
+            continue
+        kept.append(line)
+    return "\n".join(kept)
+
+def _truncate(text, keep_tokens, tokens):
+    """Keeps roughly keep_tokens of text: two thirds from the head and one third from the tail, on line boundaries."""
+    keep_chars = int(len(text) * keep_tokens / tokens)
+    head_end = text.rfind("\n", 0, keep_chars * 2 // 3)
+    tail_start = text.find("\n", len(text) - keep_chars // 3)
+    if head_end <= 0 or tail_start == -1 or tail_start <= head_end:
+        return text
+    cut_lines = text.count("\n", head_end + 1, tail_start) + 1
+    return f"{text[:head_end]}\n[… {cut_lines:,} lines cut …]{text[tail_start:]}"
+
+COMPACTION_PASSES = (
+    ("whitespace", _collapse_whitespace),
+    ("duplicates", None),
+    ("lockfiles and minified", _stub),
+    ("license headers", _strip_license_header),
+    ("comments", _strip_comments),
+    ("truncated", None),
+)
+
+def compact_context(parts, budget):
+    """Applies COMPACTION_PASSES in order, least lossy first, until parts fit in budget tokens.
+
+    Every pass is a single sweep over the text, so the whole stage is linear in
+    the output size. Returns a one-line report of what was cut, or None if the
+    parts already fit.
+    """
+    files = [file for part in parts for file in part.files]
+    tokens = [TOKEN_ESTIMATOR(text) for _, text in files]
+    overhead = TOKEN_ESTIMATOR("".join(part.render() for part in parts)) - sum(tokens)
+    total = overhead + sum(tokens)
+    if total <= budget:
+        return None
+    before = total
+    report = []
+    for name, transform in COMPACTION_PASSES:
+        if total <= budget:
+            break
+        changed = 0
+        saved = 0
+        if name == "duplicates":
+            first_seen = {}
+            for i, (path, text) in enumerate(files):
+                files[i][1] = "".join(first_occurrence(segment_key(text), f"📎 {path}", first_seen, (text,)))
+        elif name == "truncated":
+            cap = _truncation_cap(tokens, budget - overhead)
+            for i, (path, text) in enumerate(files):
+                if tokens[i] > cap:
+                    files[i][1] = _truncate(text, cap, tokens[i])
+        else:
+            for i, (path, text) in enumerate(files):
+                files[i][1] = transform(path, text)
+        for i, (path, text) in enumerate(files):
+            new_tokens = TOKEN_ESTIMATOR(text)
+            if new_tokens != tokens[i]:
+                changed += 1
+                saved += tokens[i] - new_tokens
+                tokens[i] = new_tokens
+        if saved:
+            total -= saved
+            report.append(f"{name} −{format_count(saved)} ({changed} file{'s' if changed != 1 else ''})")
+    summary = f"Compacted ~{format_count(before)} → ~{format_count(total)} tokens"
+    if total > budget:
+        summary += f", still over the {format_count(budget)} budget"
+    return f"{summary}: {', '.join(report)}" if report else summary
+
+def _truncation_cap(tokens, budget):
+    """The largest per-file token cap that brings sum(min(t, cap)) within budget (water-filling)."""
+    remaining = budget
+    ordered = sorted(tokens)
+    for i, count in enumerate(ordered):
+        share = remaining // (len(ordered) - i)
+        if count > share:
+            return max(share, MIN_TRUNCATED_TOKENS)
+        remaining -= count
+    return max(ordered[-1] if ordered else 0, MIN_TRUNCATED_TOKENS)
+
+def _summary(docstring):
+    first_line = docstring.strip().split("\n", 1)[0].strip()
+    return first_line[:OUTLINE_SUMMARY_LENGTH]
+
+def _python_outline(text):
+    """Imports-free skeleton of a module: its docstring, classes, function signatures and constants."""
+    tree = ast.parse(text)
+    lines = []
+    docstring = ast.get_docstring(tree)
+    if docstring:
+        lines.append(f'"""{_summary(docstring)}"""')
+
+    def visit(node, indent):
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+            lines.extend(f"{indent}@{ast.unparse(decorator)}" for decorator in node.decorator_list)
+            if isinstance(node, ast.ClassDef):
+                bases = ", ".join(ast.unparse(base) for base in node.bases + node.keywords)
+                lines.append(f"{indent}class {node.name}({bases}):" if bases else f"{indent}class {node.name}:")
+            else:
+                prefix = "async def" if isinstance(node, ast.AsyncFunctionDef) else "def"
+                returns = f" -> {ast.unparse(node.returns)}" if node.returns else ""
+                lines.append(f"{indent}{prefix} {node.name}({ast.unparse(node.args)}){returns}:")
+            docstring = ast.get_docstring(node)
+            if docstring:
+                lines.append(f'{indent}    """{_summary(docstring)}"""')
+            start = len(lines)
+            if isinstance(node, ast.ClassDef):
+                for child in node.body:
+                    visit(child, indent + "    ")
+            if len(lines) == start:
+                lines.append(f"{indent}    ...")
+        elif isinstance(node, (ast.Assign, ast.AnnAssign)) and not indent:
+            targets = node.targets if isinstance(node, ast.Assign) else [node.target]
+            names = [target.id for target in targets if isinstance(target, ast.Name)]
+            if names and all(name.isupper() or name == "__all__" for name in names):
+                statement = ast.unparse(node)
+                lines.append(statement if len(statement) <= OUTLINE_SUMMARY_LENGTH else f"{' = '.join(names)} = ...")
+
+    for node in tree.body:
+        visit(node, "")
+    return "\n".join(lines)
+
+_SCRIPT_NOISE = re.compile(r"""'(?:\\.|[^'\\])*'|"(?:\\.|[^"\\])*"|`(?:\\.|[^`\\])*`|//.*$""")
+_SCRIPT_MODIFIERS = r"(?:(?:export|default|declare|abstract|async)\s+)*"
+_SCRIPT_DECLARATION = re.compile(
+    rf"^{_SCRIPT_MODIFIERS}(?:function\*?\s*[\w$]*\s*[<(]|class\s|interface\s|type\s+[\w$]+|enum\s|namespace\s)"
+    r"|^(?:export\s+)?(?:const|let|var)\s+[\w$]+\s*(?::[^=]+)?=\s*(?:async\s*)?(?:\([^)]*\)|[\w$]+)\s*(?::[^=]+)?=>"
+    r"|^export\s*(?:\{|\*|default\s+[\w$.]+;?$|(?:const|let|var)\s)|^module\.exports\b")
+_SCRIPT_MEMBER = re.compile(
+    r"^\s*(?:(?:static|async|get|set|public|private|protected|readonly|override)\s+)*[\w$#]+\??\s*(?:<[^>]*>)?\s*\(")
+_SCRIPT_SUITE = re.compile(r"""^(?:describe|context|suite)(?:\.\w+)?\(\s*(['"`])(.*?)\1""")
+_SCRIPT_TEST = re.compile(r"^(?:it|test)(?:\.\w+)?\(")
+_SCRIPT_KEYWORDS = {"if", "for", "while", "switch", "catch", "return", "function", "super"}
+
+def _script_outline(text):
+    """JS/TS skeleton from one pass over the lines: top-level declarations and class or interface members.
+
+    Brace depth is tracked with strings and comments blanked out, so only code
+    at depth 0 (and 1 inside a class or interface) is kept, cut at its opening
+    brace. The JSDoc summary just above a declaration is kept with it, and a
+    test file is summed up as its describe() titles with a count of tests in each.
+    """
+    lines = []
+    depth = 0
+    in_comment = False
+    doc = []  # Lines of the JSDoc block being read, or the last one seen
+    container = None  # "class" or "interface" while inside one at depth 1
+    suites = []  # [index in lines, tests] per describe() seen
+    for line in text.split("\n"):
+        stripped = line.strip()
+        if in_comment:
+            doc.append(stripped.lstrip("*").strip())
+            if "*/" in stripped:
+                in_comment = False
+            continue
+        if stripped.startswith("/*"):
+            doc = [stripped[3 if stripped.startswith("/**") else 2:].strip()]
+            in_comment = "*/" not in stripped[2:]
+            continue
+        code = _SCRIPT_NOISE.sub("", line)
+        if "/*" in code:
+            code = code[:code.index("/*")]
+        if depth == 0 and _SCRIPT_DECLARATION.match(stripped):
+            summary = next((part.rstrip("*/ ").removeprefix("@summary").strip() for part in doc
+                            if part.rstrip("*/ ") and (not part.startswith("@") or part.startswith("@summary"))), None)
+            if summary:
+                lines.append(f"/** {summary[:OUTLINE_SUMMARY_LENGTH]} */")
+            lines.append(_signature(stripped))
+            container = "class" if re.search(r"\bclass\s", code) else "interface" if re.search(r"\binterface\s", code) else None
+        elif depth <= 3 and _SCRIPT_SUITE.match(stripped):
+            suites.append([len(lines), 0])
+            lines.append(f"{'  ' * depth}{_SCRIPT_SUITE.match(stripped).group()})")
+        elif suites and _SCRIPT_TEST.match(stripped):
+            suites[-1][1] += 1
+        elif depth == 1 and container:
+            name = stripped.split("(", 1)[0].split()[-1:] if stripped else []
+            if container == "interface" and stripped and stripped not in ("}", "};"):
+                lines.append(f"  {stripped}")
+            elif _SCRIPT_MEMBER.match(stripped) and name and name[0] not in _SCRIPT_KEYWORDS:
+                lines.append(f"  {_signature(stripped)}")
+        if stripped and not stripped.startswith("*"):
+            doc = [] if depth == 0 else doc
+        depth = max(0, depth + code.count("{") - code.count("}"))
+        if depth == 0:
+            container = None
+    for index, tests in suites:
+        lines[index] += f"  // {tests} test{'s' if tests != 1 else ''}"
+    return "\n".join(lines)
+
+def _markdown_outline(text):
+    """The headings, outside fenced code blocks."""
+    lines = []
+    in_fence = False
+    for line in text.split("\n"):
+        if line.startswith(("```", "~~~")):
+            in_fence = not in_fence
+        elif not in_fence and re.match(r"#{1,6} ", line):
+            lines.append(line.rstrip())
+    return "\n".join(lines)
+
+def _signature(line):
+    """A declaration line cut at its body: `f(a) {` becomes `f(a) { … }`."""
+    opening = _SCRIPT_NOISE.sub(lambda match: " " * len(match.group()), line).find("{")
+    if opening <= 0 or line.startswith(("export {", "export{")):
+        return line
+    return line[:opening].rstrip() + " { … }"
+
+def outline_text(path, text):
+    """A compact outline of a source file (signatures, classes, exported symbols, docstring summaries), or None.
+
+    Python goes through ast, JS and TS through a line scanner and Markdown is
+    cut to its headings, picked by the extension of path; without one, Python
+    is tried first, then the JS scanner. None when the
+    language is unsupported, the file does not parse, or the outline would not
+    be shorter than the file.
+    """
+    extension = os.path.splitext(path or "")[1].lower()
+    try:
+        if extension in PYTHON_EXTENSIONS:
+            outline = _python_outline(text)
+        elif extension in SCRIPT_EXTENSIONS:
+            outline = _script_outline(text)
+        elif extension in MARKDOWN_EXTENSIONS:
+            outline = _markdown_outline(text)
+        elif extension:
+            return None
+        else:
+            try:
+                outline = _python_outline(text)
+            except (SyntaxError, ValueError):
+                outline = _script_outline(text)
+    except (SyntaxError, ValueError, RecursionError):
+        return None
+    if not outline:
+        return None
+    outline = f"{outline}\n[Outline of {text.count(chr(10)) + 1:,} lines]"
+    return outline if len(outline) < len(text) else None
+
+def _outline_batch(files):
+    return [outline_text(path, text) for path, text in files]
+
+class OutlineCache:
+    """outline_text() results by content hash, shared by every copy and the background warm-up.
+
+    get() falls back to the full text for files without an outline. warm()
+    fills the cache for many files at once, on a process pool when there are
+    enough of them, and CPUs, to beat its start-up cost (parsing holds the GIL).
+    """
+    def __init__(self, max_size=OUTLINE_CACHE_SIZE):
+        self.max_size = max_size
+        self._entries = OrderedDict()  # (content hash, extension) -> outline or None
+        self._size = 0
+        self._lock = threading.Lock()
+        self._pool = None
+
+    @staticmethod
+    def key(path, text, content_hash=None):
+        if content_hash is None:
+            content_hash = hashlib.blake2b(text.encode("utf-8"), digest_size=16).hexdigest()
+        return content_hash, os.path.splitext(path or "")[1].lower()
+
+    def get(self, path, text, content_hash=None):
+        key = self.key(path, text, content_hash)
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                outline = self._entries[key]
+                return text if outline is None else outline
+        outline = outline_text(path, text)
+        self._store(key, outline)
+        return text if outline is None else outline
+
+    def warm(self, files):
+        """Outlines every (path, text, content hash or None) not yet cached."""
+        missing = {}
+        with self._lock:
+            for path, text, content_hash in files:
+                key = self.key(path, text, content_hash)
+                if key not in self._entries:
+                    missing[key] = (path, text)
+        if not missing:
+            return
+        with PROFILER.span("outline.warm"):
+            batch = list(missing.values())
+            if len(batch) < OUTLINE_PARALLEL_MIN or (os.cpu_count() or 1) < 2:
+                outlines = _outline_batch(batch)
+            else:
+                chunk = max(1, len(batch) // (4 * (os.cpu_count() or 1)))
+                try:
+                    outlines = [outline for outlines in self._executor().map(
+                        _outline_batch, [batch[i:i + chunk] for i in range(0, len(batch), chunk)]) for outline in outlines]
+                except (OSError, RuntimeError):  # RuntimeError covers a pool whose workers failed to start
+                    PROFILER.count("errors.outline_pool")
+                    self.close()
+                    outlines = _outline_batch(batch)
+            for key, outline in zip(missing, outlines):
+                self._store(key, outline)
+
+    def _executor(self):
+        with self._lock:
+            if self._pool is None:
+                import multiprocessing
+                from concurrent.futures import ProcessPoolExecutor
+                # Spawned, not forked: the GUI forks with Qt and worker threads running
+                self._pool = ProcessPoolExecutor(mp_context=multiprocessing.get_context("spawn"))
+            return self._pool
+
+    def close(self):
+        """Stops the process pool, if one was started; a later warm() starts another."""
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(cancel_futures=True)
+
+    def _store(self, key, outline):
+        with self._lock:
+            if key in self._entries:
+                return
+            self._entries[key] = outline
+            self._size += len(outline or "")
+            while self._size > self.max_size:
+                _, evicted = self._entries.popitem(last=False)
+                self._size -= len(evicted or "")
+
+class ItemRegistry:
+    """Indexes the item list by stable id and by (name, is_link).
+
+    Lookups, toggles and renames are O(1); only removals renumber rows.
+    """
+    def __init__(self, items):
+        self.items = items
+        self._by_id = {}
+        self._by_key = {}
+        self._rows = {}
+        for item_data in items:
+            item_data.setdefault("id", uuid.uuid4().hex)
+            item_data.setdefault("is_link", False)
+        self.reindex()
+
+    @staticmethod
+    def key(item_data):
+        return item_data["name"], item_data["is_link"]
+
+    def reindex(self):
+        self._by_id = {item_data["id"]: item_data for item_data in self.items}
+        self._by_key = {self.key(item_data): item_data for item_data in self.items}
+        self._rows = {item_data["id"]: row for row, item_data in enumerate(self.items)}
+
+    def __len__(self):
+        return len(self.items)
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def get(self, item_id):
+        return self._by_id.get(item_id)
+
+    def find(self, name, is_link):
+        return self._by_key.get((name, is_link))
+
+    def has_name(self, name):
+        return (name, False) in self._by_key or (name, True) in self._by_key
+
+    def next_clipboard_name(self):
+        clipboard_count = sum(1 for item in self.items if item["name"].startswith("📎 clipboard-")) + 1
+        while self.has_name(f"📎 clipboard-{clipboard_count}"):
+            clipboard_count += 1  # Earlier removals leave gaps, so the count alone can collide
+        return f"📎 clipboard-{clipboard_count}"
+
+    def row(self, item_id):
+        return self._rows[item_id]
+
+    def append(self, item_data):
+        item_data.setdefault("id", uuid.uuid4().hex)
+        item_data.setdefault("is_link", False)
+        self._rows[item_data["id"]] = len(self.items)
+        self.items.append(item_data)
+        self._by_id[item_data["id"]] = item_data
+        self._by_key[self.key(item_data)] = item_data
+
+    def rename(self, item_id, new_name):
+        item_data = self._by_id[item_id]
+        if self._by_key.get(self.key(item_data)) is item_data:
+            del self._by_key[self.key(item_data)]
+        item_data["name"] = new_name
+        self._by_key[self.key(item_data)] = item_data
+
+    def replace(self, items):
+        for item_data in items:
+            item_data.setdefault("id", uuid.uuid4().hex)
+            item_data.setdefault("is_link", False)
+        self.items[:] = items
+        self.reindex()
+
+    def remove(self, item_ids):
+        for row in sorted((self._rows[item_id] for item_id in item_ids), reverse=True):
+            del self.items[row]
+        self.reindex()  # Renumber once, however many rows went
+
+class BlobStore:
+    """Content-addressed, zlib-compressed store for cold-copy bodies.
+
+    Blobs are keyed by the SHA-256 of their UTF-8 text, so dropping the same
+    content twice stores it once. Bodies are only read back when copying.
+    """
+    def __init__(self, directory=CONTENT_DIR):
+        self.directory = directory
+
+    def _path(self, content_hash):
+        return os.path.join(self.directory, f"{content_hash}.z")
+
+    def put(self, content):
+        data = content.encode("utf-8")
+        content_hash = hashlib.sha256(data).hexdigest()
+        path = self._path(content_hash)
+        if not os.path.exists(path):
+            os.makedirs(self.directory, exist_ok=True)
+            atomic_write(path, zlib.compress(data))
+        return content_hash
+
+    def get(self, content_hash):
+        with open(self._path(content_hash), "rb") as f:
+            return zlib.decompress(f.read()).decode("utf-8")
+
+    def iter_text(self, content_hash):
+        decoder = codecs.getincrementaldecoder("utf-8")()
+        decompressor = zlib.decompressobj()
+        with open(self._path(content_hash), "rb") as f:
+            for chunk in iter(lambda: f.read(COPY_CHUNK_SIZE), b""):
+                yield decoder.decode(decompressor.decompress(chunk))
+        yield decoder.decode(decompressor.flush(), final=True)
+
+    def remove(self, content_hash):
+        try:
+            os.remove(self._path(content_hash))
+        except OSError:
+            pass
+
+class StateStore:
+    """Persists item metadata in STATE_FILE and cold-copy content in a BlobStore.
+
+    Content is immutable once dropped, so each body is written exactly once and
+    only metadata (name, checked, link_path, window geometry) is rewritten. If
+    another process rewrote the file since this one last loaded or saved, save()
+    merges: items and settings changed here win, everything else is kept from
+    the file, and changed_on_disk() stays true until the next load().
+    """
+    METADATA_KEYS = ("id", "name", "is_link", "is_folder", "link_path", "folder_path", "checked", "content_hash",
+                     "manifest_hash", "segment_key", "segments_hash", "copy_mode")
+
+    def __init__(self, state_file=STATE_FILE, content_dir=CONTENT_DIR):
+        self.state_file = state_file
+        self.blobs = BlobStore(content_dir)
+        self.content_stats = {}  # Content hash -> measure_text() result
+        self._last_metadata = None
+        self._blob_hashes = set()
+        self._saved_items = {}  # Item id -> metadata, as this process last loaded or saved it
+        self._saved_settings = {}
+
+    def load(self):
+        if not os.path.exists(self.state_file):
+            return {"items": [], "opacity": DEFAULT_OPACITY, "width": 200, "height": 200}
+        with open(self.state_file, "r", encoding="utf-8") as f:
+            serialized = f.read()
+        state = json.loads(serialized)
+        self._last_metadata = serialized
+        if state.get("token_estimator") == TOKEN_ESTIMATOR.__name__:
+            self.content_stats = state.get("content_stats", {})
+        for item in state.get("items", []):
+            if "content" in item:  # Older state files kept bodies inline
+                item["content_hash"] = self.blobs.put(item.pop("content"))
+            elif "content_file" in item:  # ...or in one uncompressed file per item
+                legacy_path = os.path.join(self.blobs.directory, item.pop("content_file"))
+                try:
+                    with open(legacy_path, "r", encoding="utf-8") as f:
+                        item["content_hash"] = self.blobs.put(f.read())
+                    os.remove(legacy_path)
+                except OSError as e:
+                    item["content_hash"] = self.blobs.put(f"[Error reading stored content: {e}]")
+            if item.get("content_hash"):
+                self._blob_hashes.add(item["content_hash"])
+            if item.get("segments_hash"):
+                self._blob_hashes.add(item["segments_hash"])
+        self._saved_items = {item["id"]: self._metadata(item) for item in state.get("items", []) if "id" in item}
+        self._saved_settings = self._settings(state)
+        return state
+
+    def changed_on_disk(self):
+        """True if the state file differs from what this store last loaded or saved."""
+        try:
+            with open(self.state_file, "r", encoding="utf-8") as f:
+                return f.read() != self._last_metadata
+        except OSError:
+            return False
+
+    @property
+    def watch_path(self):
+        return self.state_file
+
+    @property
+    def search_path(self):
+        return os.path.join(self.blobs.directory, SEARCH_DATABASE_NAME)
+
+    def put_content(self, content):
+        content_hash = self.blobs.put(content)
+        self._blob_hashes.add(content_hash)
+        if content_hash not in self.content_stats:
+            self.content_stats[content_hash] = measure_text(content)
+        return content_hash
+
+    def track_blobs(self, content_hashes):
+        self._blob_hashes.update(content_hashes)
+
+    def track_content(self, content_hash, stats):
+        """Registers a blob, and its measure_text() stats, written directly through self.blobs."""
+        self._blob_hashes.add(content_hash)
+        self.content_stats[content_hash] = stats
+        return content_hash
+
+    def _metadata(self, item):
+        return {key: item[key] for key in self.METADATA_KEYS if key in item}
+
+    @staticmethod
+    def _settings(state):
+        """Serialized, so later edits to the live values (such as filters) are not seen as already saved."""
+        return {key: json.dumps(value, sort_keys=True) for key, value in state.items()
+                if key not in ("items", "token_estimator", "content_stats")}
+
+    def _merge(self, items, settings, on_disk):
+        """Folds the items and settings changed here since the last load or save into the state on disk."""
+        mine = {item["id"]: item for item in items}
+        names = {(item["name"], item.get("is_link", False)) for item in items}
+        merged = []
+        for item in on_disk.get("items", []):
+            item_id = item.get("id")
+            if item_id in mine:  # On both sides; a copy unchanged here takes the other process's edits
+                ours = mine.pop(item_id)
+                merged.append(item if self._saved_items.get(item_id) == ours else ours)
+            elif item_id not in self._saved_items and (item["name"], item.get("is_link", False)) not in names:
+                merged.append(item)  # Added by the other process; a name added on both sides keeps ours
+        # Left: items added here, or removed there; a removed item survives only if it was edited here
+        merged += [item for item_id, item in mine.items()
+                   if item_id not in self._saved_items or self._saved_items[item_id] != item]
+        if on_disk.get("token_estimator") == TOKEN_ESTIMATOR.__name__:
+            for content_hash, stats in on_disk.get("content_stats", {}).items():
+                self.content_stats.setdefault(content_hash, stats)
+        merged_settings = {key: value for key, value in on_disk.items()
+                           if key not in ("items", "token_estimator", "content_stats")}
+        merged_settings.update({key: json.loads(value) for key, value in settings.items()
+                                if self._saved_settings.get(key) != value})
+        return merged, merged_settings
+
+    def save(self, state):
+        items = [self._metadata(item) for item in state["items"] if not item.get("pending")]
+        settings = self._settings(state)
+        on_disk = None
+        if self.changed_on_disk():
+            try:
+                with open(self.state_file, "r", encoding="utf-8") as f:
+                    on_disk = f.read()
+                merged_items, merged_settings = self._merge(items, settings, json.loads(on_disk))
+            except (OSError, ValueError):
+                on_disk = None  # Gone or unreadable: nothing to merge with
+        if on_disk is None:
+            merged_items, merged_settings = items, {key: value for key, value in state.items() if key != "items"}
+        content_hashes = {item["content_hash"] for item in merged_items if item.get("content_hash")}
+        metadata = dict(merged_settings, items=merged_items, token_estimator=TOKEN_ESTIMATOR.__name__, content_stats={
+            content_hash: stats for content_hash, stats in self.content_stats.items() if content_hash in content_hashes
+        })
+        serialized = json.dumps(metadata, indent=4)
+        if serialized != (self._last_metadata if on_disk is None else on_disk):
+            atomic_write(self.state_file, serialized.encode("utf-8"))
+        # After a merge the file holds changes this process has not loaded, so changed_on_disk() keeps saying so
+        self._last_metadata = serialized if on_disk is None else None
+        self._saved_items = {item["id"]: item for item in items}
+        self._saved_settings = settings
+
+        # Blobs go only after the metadata no longer references them. Folder links
+        # carry their manifest and segment hashes in the transient "blob_hashes".
+        live_hashes = set(content_hashes)
+        for item in state["items"]:
+            if not item.get("pending"):
+                live_hashes.update(item.get("blob_hashes", ()))
+        for item in merged_items:
+            live_hashes.update(item[key] for key in ("segments_hash", "manifest_hash") if item.get(key))
+        for stale in self._blob_hashes - live_hashes:
+            self.blobs.remove(stale)
+        self._blob_hashes = live_hashes
+
+def user_data_dir():
+    """The per-user directory for the SQLite store, independent of the working directory."""
+    if sys.platform == "win32":
+        base = os.environ.get("APPDATA") or os.path.expanduser("~")
+        return os.path.join(base, "ContextYap")
+    if sys.platform == "darwin":
+        return os.path.expanduser("~/Library/Application Support/ContextYap")
+    base = os.environ.get("XDG_DATA_HOME") or os.path.expanduser("~/.local/share")
+    return os.path.join(base, "contextyap")
+
+class Database:
+    """One SQLite connection per thread onto a WAL-mode database file."""
+    def __init__(self, path, schema):
+        self.path = path
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.connection().executescript(schema)
+
+    def connection(self):
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            # Autocommit; writes are grouped with explicit BEGIN IMMEDIATE in transaction()
+            connection = sqlite3.connect(self.path, timeout=DATABASE_TIMEOUT, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.execute("PRAGMA foreign_keys=ON")
+            self._local.connection = connection
+        return connection
+
+    def transaction(self):
+        return _Transaction(self.connection())
+
+class _Transaction:
+    def __init__(self, connection):
+        self.connection = connection
+
+    def __enter__(self):
+        self.connection.execute("BEGIN IMMEDIATE")  # Take the write lock up front, so reads inside stay consistent
+        return self.connection
+
+    def __exit__(self, exc_type, exc, traceback):
+        self.connection.execute("ROLLBACK" if exc_type else "COMMIT")
+
+class SQLiteBlobStore:
+    """BlobStore with the same interface, keeping the compressed bodies in the blobs table."""
+    def __init__(self, database):
+        self.database = database
+
+    def put(self, content):
+        data = content.encode("utf-8")
+        content_hash = hashlib.sha256(data).hexdigest()
+        connection = self.database.connection()
+        if connection.execute("SELECT 1 FROM blobs WHERE hash = ?", (content_hash,)).fetchone() is None:
+            connection.execute("INSERT OR IGNORE INTO blobs (hash, data) VALUES (?, ?)", (content_hash, zlib.compress(data)))
+        return content_hash
+
+    def _rowid(self, content_hash):
+        row = self.database.connection().execute("SELECT rowid FROM blobs WHERE hash = ?", (content_hash,)).fetchone()
+        if row is None:
+            raise FileNotFoundError(f"No stored content for {content_hash}")
+        return row[0]
+
+    def get(self, content_hash):
+        row = self.database.connection().execute("SELECT data FROM blobs WHERE hash = ?", (content_hash,)).fetchone()
+        if row is None:
+            raise FileNotFoundError(f"No stored content for {content_hash}")
+        return zlib.decompress(row[0]).decode("utf-8")
+
+    def iter_text(self, content_hash):
+        connection = self.database.connection()
+        if not hasattr(connection, "blobopen"):  # Python < 3.11 has no incremental blob I/O
+            yield self.get(content_hash)
+            return
+        decoder = codecs.getincrementaldecoder("utf-8")()
+        decompressor = zlib.decompressobj()
+        with connection.blobopen("blobs", "data", self._rowid(content_hash), readonly=True) as blob:
+            for chunk in iter(lambda: blob.read(COPY_CHUNK_SIZE), b""):
+                yield decoder.decode(decompressor.decompress(chunk))
+        yield decoder.decode(decompressor.flush(), final=True)
+
+    def remove(self, content_hash):
+        # Another process may have listed the same content since this one tracked it
+        self.database.connection().execute(
+            "DELETE FROM blobs WHERE hash = ?1 AND NOT EXISTS "
+            "(SELECT 1 FROM items WHERE content_hash = ?1 OR manifest_hash = ?1 OR segments_hash = ?1)", (content_hash,))
+
+class SQLiteStateStore(StateStore):
+    """StateStore on a WAL-mode SQLite database under user_data_dir().
+
+    Items, check state, blobs, window geometry and other settings live in
+    separate tables. save() writes only the rows that changed since this
+    process last loaded or saved, so a toggle is one UPDATE, and items added
+    by another process are left alone. The first load imports any STATE_FILE
+    in the working directory, then renames it.
+    """
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS items (
+            id TEXT PRIMARY KEY, position INTEGER NOT NULL, name TEXT NOT NULL, is_link INTEGER NOT NULL,
+            is_folder INTEGER NOT NULL DEFAULT 0, link_path TEXT, folder_path TEXT, content_hash TEXT, manifest_hash TEXT,
+            segment_key TEXT, segments_hash TEXT, copy_mode TEXT
+        );
+        CREATE INDEX IF NOT EXISTS items_content_hash ON items (content_hash);
+        CREATE INDEX IF NOT EXISTS items_manifest_hash ON items (manifest_hash);
+        CREATE TABLE IF NOT EXISTS checks (
+            item_id TEXT PRIMARY KEY REFERENCES items (id) ON DELETE CASCADE, checked INTEGER NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS blobs (
+            hash TEXT PRIMARY KEY, data BLOB NOT NULL, estimator TEXT, bytes INTEGER, lines INTEGER, tokens INTEGER
+        );
+        CREATE TABLE IF NOT EXISTS geometry (key TEXT PRIMARY KEY, value REAL NOT NULL);
+        CREATE TABLE IF NOT EXISTS settings (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+        CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER NOT NULL);
+        INSERT OR IGNORE INTO meta (key, value) VALUES ('revision', 0);
+    """
+    ITEM_COLUMNS = ("name", "is_link", "is_folder", "link_path", "folder_path", "content_hash", "manifest_hash",
+                    "segment_key", "segments_hash", "copy_mode")
+    ADDED_COLUMNS = ("segment_key", "segments_hash", "copy_mode")  # Missing from databases created before dedup or outlines
+    GEOMETRY_KEYS = ("opacity", "width", "height")
+    LEGACY_SETTINGS = {"filters": dict, "token_budget": int, "compact_to_budget": bool}  # All migrate() imports besides geometry
+
+    def __init__(self, path=None, legacy_state_file=STATE_FILE, legacy_content_dir=CONTENT_DIR):
+        self.database = Database(path or os.path.join(user_data_dir(), DATABASE_NAME), self.SCHEMA)
+        self._add_columns()
+        self.blobs = SQLiteBlobStore(self.database)
+        self.legacy_state_file = legacy_state_file
+        self.legacy_content_dir = legacy_content_dir
+        self.content_stats = {}
+        self._blob_hashes = set()
+        self._rows = {}  # Item id -> ITEM_COLUMNS values, as last loaded or saved
+        self._checks = {}
+        self._settings = {}
+        self._saved_stats = set()
+        self._revision = None
+
+    def _add_columns(self):
+        columns = {row[1] for row in self.database.connection().execute("PRAGMA table_info(items)")}
+        if columns.issuperset(self.ADDED_COLUMNS):
+            return
+        with self.database.transaction() as connection:
+            columns = {row[1] for row in connection.execute("PRAGMA table_info(items)")}  # Another process may have won
+            for column in self.ADDED_COLUMNS:
+                if column not in columns:
+                    connection.execute(f"ALTER TABLE items ADD COLUMN {column} TEXT")
+
+    @property
+    def watch_path(self):
+        return self.database.path + "-wal"  # Every commit lands here first
+
+    @property
+    def search_path(self):
+        return os.path.join(os.path.dirname(self.database.path), SEARCH_DATABASE_NAME)
+
+    def _read_revision(self, connection):
+        return connection.execute("SELECT value FROM meta WHERE key = 'revision'").fetchone()[0]
+
+    def changed_on_disk(self):
+        return self._read_revision(self.database.connection()) != self._revision
+
+    def load(self):
+        if os.path.exists(self.legacy_state_file):
+            self.migrate(self.legacy_state_file, self.legacy_content_dir)
+        connection = self.database.connection()
+        connection.execute("BEGIN")  # One snapshot across the reads below
+        try:
+            self._revision = self._read_revision(connection)
+            rows = connection.execute(
+                f"SELECT id, checked, {', '.join(self.ITEM_COLUMNS)} FROM items "
+                "LEFT JOIN checks ON checks.item_id = items.id ORDER BY position").fetchall()
+            geometry = dict(connection.execute("SELECT key, value FROM geometry"))
+            settings = dict(connection.execute("SELECT key, value FROM settings"))
+            stats = connection.execute(
+                "SELECT hash, bytes, lines, tokens FROM blobs WHERE estimator = ? AND hash IN "
+                "(SELECT content_hash FROM items)", (TOKEN_ESTIMATOR.__name__,)).fetchall()
+        finally:
+            connection.execute("COMMIT")
+
+        items = []
+        self._rows = {}
+        self._checks = {}
+        for item_id, checked, *values in rows:
+            item = {"id": item_id, "checked": bool(checked)}
+            for column, value in zip(self.ITEM_COLUMNS, values):
+                if column in ("is_link", "is_folder"):
+                    value = bool(value)
+                if value is not None and (value or column == "is_link"):
+                    item[column] = value
+            items.append(item)
+            self._rows[item_id] = tuple(values)
+            self._checks[item_id] = bool(checked)
+            if item.get("content_hash"):
+                self._blob_hashes.add(item["content_hash"])
+            if item.get("segments_hash"):
+                self._blob_hashes.add(item["segments_hash"])
+        self._settings = dict(settings)
+        self.content_stats = {content_hash: list(counts) for content_hash, *counts in stats}
+        self._saved_stats = set(self.content_stats)
+
+        state = {"items": items, "opacity": DEFAULT_OPACITY, "width": 200, "height": 200}
+        state.update({key: int(value) if key != "opacity" else value for key, value in geometry.items()})
+        state.update({key: json.loads(value) for key, value in settings.items()})
+        return state
+
+    def save(self, state):
+        items = [item for item in state["items"] if not item.get("pending")]
+        rows = {}
+        for item in items:
+            rows[item["id"]] = tuple(
+                int(bool(item.get(column))) if column in ("is_link", "is_folder") else item.get(column)
+                for column in self.ITEM_COLUMNS)
+        checks = {item["id"]: bool(item.get("checked")) for item in items}
+        settings = {key: json.dumps(value, sort_keys=True) for key, value in state.items()
+                    if key not in ("items", "token_estimator", "content_stats") and key not in self.GEOMETRY_KEYS}
+        content_hashes = {item["content_hash"] for item in items if item.get("content_hash")}
+
+        with self.database.transaction() as connection:
+            revision = self._read_revision(connection)
+            external = revision != self._revision
+            changed = False
+            for item_id in self._rows.keys() - rows.keys():
+                connection.execute("DELETE FROM items WHERE id = ?", (item_id,))
+                changed = True
+            for item_id, values in rows.items():
+                if self._rows.get(item_id) == values:
+                    continue
+                if item_id in self._rows:
+                    connection.execute(
+                        f"UPDATE items SET {', '.join(f'{column} = ?' for column in self.ITEM_COLUMNS)} WHERE id = ?",
+                        (*values, item_id))
+                else:
+                    connection.execute(
+                        f"INSERT OR REPLACE INTO items (id, position, {', '.join(self.ITEM_COLUMNS)}) "
+                        f"VALUES (?, (SELECT COALESCE(MAX(position), 0) + 1 FROM items), {', '.join('?' * len(values))})",
+                        (item_id, *values))
+                changed = True
+            for item_id, checked in checks.items():
+                if self._checks.get(item_id) != checked:
+                    connection.execute(
+                        "INSERT INTO checks (item_id, checked) VALUES (?, ?) "
+                        "ON CONFLICT (item_id) DO UPDATE SET checked = excluded.checked", (item_id, int(checked)))
+                    changed = True
+            for key in self.GEOMETRY_KEYS:
+                if key in state:
+                    connection.execute(
+                        "INSERT INTO geometry (key, value) VALUES (?, ?) "
+                        "ON CONFLICT (key) DO UPDATE SET value = excluded.value WHERE value != excluded.value",
+                        (key, state[key]))
+            for key, value in settings.items():
+                if self._settings.get(key) != value:
+                    connection.execute(
+                        "INSERT INTO settings (key, value) VALUES (?, ?) "
+                        "ON CONFLICT (key) DO UPDATE SET value = excluded.value", (key, value))
+                    changed = True
+            for content_hash in content_hashes - self._saved_stats:
+                if content_hash in self.content_stats:
+                    connection.execute(
+                        "UPDATE blobs SET estimator = ?, bytes = ?, lines = ?, tokens = ? WHERE hash = ?",
+                        (TOKEN_ESTIMATOR.__name__, *self.content_stats[content_hash], content_hash))
+                    self._saved_stats.add(content_hash)
+            if changed:
+                revision += 1
+                connection.execute("UPDATE meta SET value = ? WHERE key = 'revision'", (revision,))
+        self._rows = rows
+        self._checks = checks
+        self._settings = settings
+        # Leave the revision stale if another process wrote first, so changed_on_disk() reports it
+        self._revision = None if external else revision
+
+        live_hashes = set(content_hashes)
+        for item in items:
+            live_hashes.update(item.get("blob_hashes", ()))
+            if item.get("segments_hash"):
+                live_hashes.add(item["segments_hash"])
+        for stale in self._blob_hashes - live_hashes:
+            self.blobs.remove(stale)
+        self._blob_hashes = live_hashes
+
+    @staticmethod
+    def is_legacy_state(state, content_dir):
+        """Whether state, parsed from a STATE_FILE, looks like this program's: other tools write state.json too."""
+        if not (isinstance(state, dict) and isinstance(state.get("items"), list)):
+            return False
+        if not all(isinstance(item, dict) and isinstance(item.get("name"), str) for item in state["items"]):
+            return False
+        # Hashes point into content_dir; only the oldest files, with bodies inline, have none
+        uses_blobs = any(item.get(key) for item in state["items"] for key in ("content_hash", "segments_hash", "manifest_hash"))
+        return not uses_blobs or os.path.isdir(content_dir)
+
+    def migrate(self, state_file, content_dir):
+        """Imports a STATE_FILE store once, appending its items, then renames the file to *.migrated.
+
+        Files that are not this program's, and files already imported (recorded
+        in meta by absolute path), are left alone. The file is first renamed to
+        a name of this process's own, so when several processes start together
+        exactly one imports it; the others find it gone and return.
+        """
+        marker = f"migrated:{os.path.abspath(state_file)}"
+        if self.database.connection().execute("SELECT 1 FROM meta WHERE key = ?", (marker,)).fetchone():
+            return
+        try:
+            with open(state_file, "r", encoding="utf-8") as f:
+                if not self.is_legacy_state(json.load(f), content_dir):
+                    return
+        except (OSError, ValueError):
+            return
+        claimed = f"{state_file}.{os.getpid()}.migrating"
+        try:
+            os.replace(state_file, claimed)
+        except FileNotFoundError:
+            return  # Another process is importing or has imported it
+        try:
+            imported = self._import(StateStore(claimed, content_dir), marker)
+        except BaseException:
+            os.replace(claimed, state_file)  # Left for the next start to retry
+            raise
+        os.replace(claimed, state_file + ".migrated" if imported else state_file)
+
+    def _import(self, legacy, marker):
+        """Copies legacy's items, blobs and known settings in; False if marker shows it was imported already."""
+        state = legacy.load()
+        hashes = set()
+        for item in state.get("items", []):
+            if item.get("content_hash"):
+                hashes.add(item["content_hash"])
+            if item.get("segments_hash"):
+                hashes.add(item["segments_hash"])
+            if item.get("manifest_hash"):
+                hashes.add(item["manifest_hash"])
+                try:
+                    manifest = json.loads(legacy.blobs.get(item["manifest_hash"]))
+                    hashes.update(entry[3] for entry in manifest["entries"] if entry[3])
+                except (OSError, ValueError, KeyError, zlib.error):
+                    pass
+        for content_hash in hashes:
+            try:
+                self.blobs.put(legacy.blobs.get(content_hash))
+            except (OSError, ValueError, zlib.error):
+                pass  # A missing body copies as "[Error reading stored content: ...]", as before
+
+        with self.database.transaction() as connection:
+            if connection.execute("SELECT 1 FROM meta WHERE key = ?", (marker,)).fetchone():
+                return False
+            connection.execute("INSERT INTO meta (key, value) VALUES (?, 1)", (marker,))
+            for item in state.get("items", []):
+                item.setdefault("id", uuid.uuid4().hex)
+                connection.execute(
+                    f"INSERT OR IGNORE INTO items (id, position, {', '.join(self.ITEM_COLUMNS)}) "
+                    f"VALUES (?, (SELECT COALESCE(MAX(position), 0) + 1 FROM items), {', '.join('?' * len(self.ITEM_COLUMNS))})",
+                    (item["id"], *(int(bool(item.get(column))) if column in ("is_link", "is_folder") else item.get(column)
+                                   for column in self.ITEM_COLUMNS)))
+                connection.execute("INSERT OR IGNORE INTO checks (item_id, checked) VALUES (?, ?)",
+                                   (item["id"], int(bool(item.get("checked")))))
+            for key in self.GEOMETRY_KEYS:
+                if isinstance(state.get(key), (int, float)):
+                    connection.execute("INSERT OR IGNORE INTO geometry (key, value) VALUES (?, ?)", (key, state[key]))
+            for key, value_type in self.LEGACY_SETTINGS.items():
+                if isinstance(state.get(key), value_type):
+                    connection.execute("INSERT OR IGNORE INTO settings (key, value) VALUES (?, ?)",
+                                       (key, json.dumps(state[key], sort_keys=True)))
+            for content_hash, counts in legacy.content_stats.items():
+                connection.execute(
+                    "UPDATE blobs SET estimator = ?, bytes = ?, lines = ?, tokens = ? WHERE hash = ? AND estimator IS NULL",
+                    (TOKEN_ESTIMATOR.__name__, *counts, content_hash))
+            connection.execute("UPDATE meta SET value = value + 1 WHERE key = 'revision'")
+        return True
+
+class SearchIndex:
+    """Trigram index over item text for the filter box, in a contentless SQLite FTS5 table.
+
+    Documents are keyed by search_keys(), so identical content is indexed once,
+    and the index survives restarts. Only trigram doclists are kept (about 1% of
+    the text). A document holding every trigram of a query matches it, which
+    lets rare false positives through. Without FTS5's trigram tokenizer
+    (SQLite < 3.34) available is False and search() always returns None.
+
+    Re-adding a key or retaining it away deletes its old document. SQLite 3.43
+    and later do that natively (contentless_delete); before that FTS5 has to be
+    handed the exact text again, so a compressed copy of each body is kept.
+    """
+    CONTENTLESS_DELETE = sqlite3.sqlite_version_info >= (3, 43, 0)
+    SCHEMA = """
+        CREATE VIRTUAL TABLE documents USING fts5(
+            body, content='', tokenize='trigram', detail=none{options}
+        );
+        CREATE TABLE document_keys (key TEXT PRIMARY KEY, document INTEGER NOT NULL);
+    """
+    BODIES_SCHEMA = "CREATE TABLE document_bodies (document INTEGER PRIMARY KEY, body BLOB NOT NULL);"
+    # PRAGMA user_version of the current layout; an index in any other is dropped and rebuilt
+    LAYOUT = 1 if CONTENTLESS_DELETE else 2
+
+    def __init__(self, path):
+        try:
+            self.database = Database(path, "")
+            self._create()
+        except sqlite3.Error:
+            self.database = None
+        self.available = self.database is not None
+
+    def _create(self):
+        connection = self.database.connection()
+        if connection.execute("PRAGMA user_version").fetchone()[0] == self.LAYOUT:
+            return
+        with self.database.transaction() as connection:
+            if connection.execute("PRAGMA user_version").fetchone()[0] == self.LAYOUT:
+                return  # Another process rebuilt it first
+            # Indexes from before deletion (layout 0) may hold orphans; this one refills as items are seen
+            for table in ("documents", "document_keys", "document_bodies"):
+                connection.execute(f"DROP TABLE IF EXISTS {table}")
+            schema = self.SCHEMA.format(options=", contentless_delete=1" if self.CONTENTLESS_DELETE else "")
+            if not self.CONTENTLESS_DELETE:
+                schema += self.BODIES_SCHEMA
+            for statement in schema.split(";"):
+                if statement.strip():
+                    connection.execute(statement)
+            connection.execute(f"PRAGMA user_version = {self.LAYOUT}")
+
+    def __contains__(self, key):
+        return self.available and self.database.connection().execute(
+            "SELECT 1 FROM document_keys WHERE key = ?", (key,)).fetchone() is not None
+
+    def _delete(self, connection, document):
+        if self.CONTENTLESS_DELETE:
+            connection.execute("DELETE FROM documents WHERE rowid = ?", (document,))
+            return
+        row = connection.execute("SELECT body FROM document_bodies WHERE document = ?", (document,)).fetchone()
+        if row is not None:
+            connection.execute("INSERT INTO documents (documents, rowid, body) VALUES ('delete', ?, ?)",
+                               (document, zlib.decompress(row[0]).decode("utf-8")))
+            connection.execute("DELETE FROM document_bodies WHERE document = ?", (document,))
+
+    def add(self, key, text):
+        with self.database.transaction() as connection:
+            old = connection.execute("SELECT document FROM document_keys WHERE key = ?", (key,)).fetchone()
+            if old is not None:
+                self._delete(connection, old[0])
+            document = connection.execute("INSERT INTO documents (body) VALUES (?)", (text,)).lastrowid
+            if not self.CONTENTLESS_DELETE:
+                connection.execute("INSERT INTO document_bodies (document, body) VALUES (?, ?)",
+                                   (document, zlib.compress(text.encode("utf-8"))))
+            connection.execute("INSERT OR REPLACE INTO document_keys (key, document) VALUES (?, ?)", (key, document))
+
+    def retain(self, keys):
+        """Forgets every key not in keys, and its document."""
+        keys = set(keys)
+        with self.database.transaction() as connection:
+            stale = [(key, document) for key, document in connection.execute("SELECT key, document FROM document_keys")
+                     if key not in keys]
+            for key, document in stale:
+                self._delete(connection, document)
+                connection.execute("DELETE FROM document_keys WHERE key = ?", (key,))
+
+    def search(self, query):
+        """Keys of documents containing every trigram of query, or None if it is shorter than three characters."""
+        query = query.lower()
+        trigrams = {query[i:i + 3] for i in range(len(query) - 2)}
+        if not self.available or not trigrams:
+            return None
+        expression = " AND ".join('"{}"'.format(trigram.replace('"', '""')) for trigram in trigrams)
+        return {key for key, in self.database.connection().execute(
+            "SELECT key FROM document_keys WHERE document IN "
+            "(SELECT rowid FROM documents WHERE documents MATCH ?)", (expression,))}
+
+def server_address():
+    """Where a running window listens for commands: a per-user socket, or a named pipe on Windows."""
+    if os.environ.get(SOCKET_ENV):
+        return os.environ[SOCKET_ENV]
+    if sys.platform == "win32":
+        return r"\\.\pipe\contextyap-" + os.environ.get("USERNAME", "user")
+    return os.path.join(tempfile.gettempdir(), f"contextyap-{os.getuid()}.sock")
+
+def send_commands(commands, address=None, timeout=None):
+    """Sends one batch of commands to a running window and returns its reply.
+
+    commands is a list of objects such as {"cmd": "add", "paths": [...]}; see
+    CommandServer in contextyap_gui for the full set. Paths must be absolute.
+    The reply is {"ok": bool, "results": [one object per command]}, or
+    {"ok": false, "error": ...} for a malformed batch.
+    """
+    payload = (json.dumps(commands) + "\n").encode("utf-8")
+    address = address or server_address()
+    if sys.platform == "win32":
+        with open(address, "r+b", buffering=0) as pipe:
+            pipe.write(payload)
+            return json.loads(pipe.readline())
+    import socket  # Deferred: only scripts that talk to a window need it
+    with socket.socket(socket.AF_UNIX) as connection:
+        connection.settimeout(timeout)
+        connection.connect(address)
+        connection.sendall(payload)
+        with connection.makefile("rb") as reply:
+            return json.loads(reply.readline())
+
+def open_store():
+    """The store selected by the STORE_ENV environment variable; shared by the GUI and the CLI."""
+    if os.environ.get(STORE_ENV, "").lower() == "sqlite":
+        return SQLiteStateStore()
+    return StateStore()
@@ -0,0 +1,1627 @@
+#!/usr/bin/env python3
+import os
+import io
+import subprocess
+import hashlib
+import queue
+import sqlite3
+import threading
+import zlib
+import json
+import time
+from PySide6.QtWidgets import (
+    QApplication, QMainWindow, QListView, QAbstractItemView, QHBoxLayout, 
+    QVBoxLayout, QWidget, QToolButton, QLabel, QMenu, QPushButton,
+    QLineEdit, QDialog, QDialogButtonBox, QFormLayout, QSpinBox,
+    QStyledItemDelegate, QStyle, QFileDialog, QInputDialog, QToolTip, QPlainTextEdit
+)
+from PySide6.QtCore import Qt, QEvent, QTimer, QObject, Signal, QFileSystemWatcher, QAbstractListModel, QModelIndex, QRect, QSize
+from PySide6.QtGui import QFont, QColor, QIcon, QPen, QAction, QKeySequence, QShortcut
+from PySide6.QtNetwork import QLocalServer, QLocalSocket
+from PySide6 import __version__ as PYSIDE_VERSION
+import pyperclip
+import sys
+from contextyap_core import (
+    DEFAULT_OPACITY, DEFAULT_TOKEN_BUDGET, PROFILER, IngestFilter, LinkCache, OutlineCache, FolderLink, ItemRegistry, open_store,
+    SearchIndex, format_progress, format_count, ingest_folder, measure_text, file_item, folder_link_item,
+    sync_folder_item, outline_stats, search_keys, segment_key, select_items, server_address, write_context, read_context_parts, compact_context, render_context
+)
+
+SAVE_DEBOUNCE_MS = 300  # Coalesce bursts of toggles/resizes into one write
+LINK_COLORS = {"ok": "#00aa00", "changed": "#ffaa00", "missing": "#aa0000"}
+FOLDER_REFRESH_DEBOUNCE_MS = 500  # Wait for a burst of directory events to settle before refreshing
+SERVER_PROBE_MS = 200  # How long to wait for another window's server before treating its socket as stale
+DEBUG_PANEL_SHORTCUT = "Ctrl+Shift+D"  # Opens the otherwise hidden profiler panel
+DEBUG_REFRESH_MS = 500
+# Item fields whose change on reload means re-attaching: the item now shows other text
+RELOAD_SOURCE_KEYS = ("is_link", "is_folder", "link_path", "folder_path", "content_hash", "segments_hash")
+MEASURE_BATCH_SIZE = 200  # Measurements per measured signal, so 10k links at start-up cost 50 emits
+MEASURE_BATCH_MS = 50  # ...or fewer, when measuring is slow
+# Over-release None/True/False on calls and emits; fatal before Python 3.12 made them immortal
+BROKEN_PYSIDE_VERSIONS = {"6.12.0"}
+
+class FolderIngestJob(QObject):
+    """Runs ingest_folder() for a dropped folder off the GUI thread; only the content and index hashes come back."""
+    progress = Signal(int, object)  # files read, bytes read (an object: a C int overflows past 2 GiB)
+    finished = Signal(object, object, object)  # content hash, measure_text() stats and segment index hash, or Nones
+
+    def __init__(self, folder_path, blobs, ingest_filter, parent=None):
+        super().__init__(parent)
+        self.folder_path = folder_path
+        self.blobs = blobs
+        self.ingest_filter = ingest_filter
+        self._cancelled = threading.Event()
+
+    def start(self):
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def cancel(self):
+        self._cancelled.set()
+
+    def _run(self):
+        result = ingest_folder(self.folder_path, self.blobs, self.ingest_filter, self._cancelled, self.progress.emit)
+        if result is not None and not self._cancelled.is_set():
+            self.finished.emit(*result)
+
+class MeasureWorker(QObject):
+    """Measures item content on a background thread, one request at a time.
+
+    Live links are read through the link cache, so measuring also warms it for
+    the next copy. Counts are looked up by content hash before measuring.
+    Results come back in batches of up to MEASURE_BATCH_SIZE, or whatever
+    finished within MEASURE_BATCH_MS.
+    """
+    measured = Signal(object)  # [(item id, content hash, measure_text() stats or None)]
+
+    def __init__(self, store, link_cache, parent=None):
+        super().__init__(parent)
+        self.store = store
+        self.link_cache = link_cache
+        self.requests = queue.Queue()
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def submit(self, item_data):
+        self.requests.put((item_data["id"], item_data["is_link"], item_data.get("link_path") or item_data.get("content_hash")))
+
+    def _measure(self, item_id, is_link, source):
+        try:
+            if is_link:
+                text = "".join(self.link_cache.iter_text(source))
+                content_hash = hashlib.sha256(text.encode("utf-8")).hexdigest()
+            else:
+                content_hash = source
+                text = None if content_hash in self.store.content_stats else self.store.blobs.get(content_hash)
+            stats = self.store.content_stats.get(content_hash) or measure_text(text)
+        except (OSError, ValueError, zlib.error):
+            PROFILER.count("errors.measure")
+            content_hash = stats = None
+        return item_id, content_hash, stats
+
+    def _run(self):
+        while True:
+            batch = [self._measure(*self.requests.get())]
+            deadline = time.monotonic() + MEASURE_BATCH_MS / 1000
+            while len(batch) < MEASURE_BATCH_SIZE and time.monotonic() < deadline:
+                try:
+                    batch.append(self._measure(*self.requests.get_nowait()))
+                except queue.Empty:
+                    break
+            self.measured.emit(batch)
+
+class OutlineWorker(QObject):
+    """Outlines the items copied as outlines on a background thread, warming the OutlineCache for the next copy.
+
+    A folder's files go to the cache's process pool together. outlined carries
+    the outline's approximate counts, which replace the full-text ones in the
+    header total.
+    """
+    outlined = Signal(str, object)  # item id, measure_text() stats of the outline or None
+
+    def __init__(self, store, link_cache, outlines, parent=None):
+        super().__init__(parent)
+        self.store = store
+        self.link_cache = link_cache
+        self.outlines = outlines
+        self.requests = queue.Queue()
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def submit(self, item_data, folder_link=None):
+        self.requests.put((dict(item_data), {item_data["id"]: folder_link} if folder_link else None))
+
+    def _run(self):
+        while True:
+            item_data, folder_links = self.requests.get()
+            try:
+                stats = outline_stats(item_data, self.store, self.outlines, self.link_cache, folder_links)
+            except (OSError, RuntimeError):  # RuntimeError covers a broken process pool
+                PROFILER.count("errors.outline")
+                stats = None
+            self.outlined.emit(item_data["id"], stats)
+
+class IndexWorker(QObject):
+    """Feeds item text into a SearchIndex on a background thread.
+
+    Keys already indexed are skipped unless resubmitted with force (a live
+    file that may have changed). indexed fires each time the queue drains.
+    """
+    indexed = Signal()
+
+    def __init__(self, store, link_cache, search_index, parent=None):
+        super().__init__(parent)
+        self.store = store
+        self.link_cache = link_cache
+        self.search_index = search_index
+        self.requests = queue.Queue()
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def submit(self, item_data, force=False):
+        if self.search_index.available:
+            for key in search_keys(item_data):
+                self.requests.put((key, force))
+
+    def retain(self, keys):
+        if self.search_index.available:
+            self.requests.put((set(keys), None))  # Queued behind the submissions before it
+
+    def _run(self):
+        while True:
+            key, force = self.requests.get()
+            try:
+                if force is None:
+                    self.search_index.retain(key)
+                elif force or key not in self.search_index:
+                    if key.startswith("link:"):
+                        text = "".join(self.link_cache.iter_text(key[len("link:"):]))
+                    else:
+                        text = self.store.blobs.get(key)
+                    self.search_index.add(key, text)
+            except (OSError, ValueError, zlib.error, sqlite3.Error):
+                PROFILER.count("errors.index")  # Unreadable text just never matches; a locked index is retried next launch
+            if self.requests.empty():
+                self.indexed.emit()
+
+class FolderLinkRefreshJob(QObject):
+    finished = Signal(bool)  # Whether any file was added, changed or removed
+
+    def __init__(self, folder_link, parent=None):
+        super().__init__(parent)
+        self.folder_link = folder_link
+
+    def start(self):
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def _run(self):
+        self.finished.emit(self.folder_link.refresh())
+
+class CopyContextJob(QObject):
+    """Assembles the context off the GUI thread, into a file or for the clipboard."""
+    finished = Signal(object)  # Text for the clipboard, or None (nothing checked, or written to a file)
+    compacted = Signal(str)  # What compaction cut, emitted before finished
+
+    def __init__(self, items, store, link_cache, folder_links, output_path=None, compact_budget=None, outlines=None,
+                 parent=None):
+        super().__init__(parent)
+        self.items = items
+        self.store = store
+        self.link_cache = link_cache
+        self.folder_links = folder_links
+        self.output_path = output_path
+        self.compact_budget = compact_budget
+        self.outlines = outlines
+
+    def start(self):
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def _run(self):
+        with PROFILER.span("copy_context"):
+            result = self._assemble()
+        self.finished.emit(result)
+
+    def _assemble(self):
+        if self.compact_budget is None:
+            write = lambda sink: write_context(self.items, self.store, sink, self.link_cache, self.folder_links,
+                                               self.outlines)
+        else:  # Compaction needs the whole context in memory, so it is not streamed
+            parts = read_context_parts(self.items, self.store, self.link_cache, self.folder_links, self.outlines)
+            with PROFILER.span("copy.compact"):
+                report = compact_context(parts, self.compact_budget)
+            if report:
+                self.compacted.emit(report)
+            write = lambda sink: render_context(parts, sink)
+        if self.output_path:
+            with open(self.output_path, "w", encoding="utf-8") as f:
+                write(f)
+            return None
+        buffer = io.StringIO()
+        wrote = write(buffer)
+        PROFILER.count("bytes.copied", buffer.tell())  # Characters, for the clipboard
+        return buffer.getvalue() if wrote else None
+
+class LinkWatcher(QObject):
+    """Watches live-linked files, invalidating the link cache as they change.
+
+    Editors often save by replacing the file, which drops it from
+    QFileSystemWatcher, so changed paths are re-added and missing ones are
+    picked up again through their parent directory.
+    """
+    state_changed = Signal(str, str)  # link path, "changed" or "missing" or "ok"
+
+    def __init__(self, link_cache, parent=None):
+        super().__init__(parent)
+        self.link_cache = link_cache
+        self.missing = {}  # Directory -> set of missing link paths in it
+        self.watcher = QFileSystemWatcher(self)
+        self.watcher.fileChanged.connect(self.file_changed)
+        self.watcher.directoryChanged.connect(self.directory_changed)
+
+    def watch(self, file_path):
+        """Starts watching file_path and returns its current state."""
+        if os.path.exists(file_path):
+            self.watcher.addPath(file_path)
+            return "ok"
+        self._watch_missing(file_path)
+        return "missing"
+
+    def unwatch(self, file_path):
+        self.watcher.removePath(file_path)
+        self.link_cache.invalidate(file_path)
+        directory = os.path.dirname(file_path)
+        if file_path in self.missing.get(directory, ()):
+            self.missing[directory].discard(file_path)
+            if not self.missing[directory]:
+                del self.missing[directory]
+                self.watcher.removePath(directory)
+
+    def _watch_missing(self, file_path):
+        directory = os.path.dirname(file_path)
+        self.missing.setdefault(directory, set()).add(file_path)
+        if os.path.isdir(directory):
+            self.watcher.addPath(directory)
+
+    def file_changed(self, file_path):
+        self.link_cache.invalidate(file_path)
+        if os.path.exists(file_path):
+            self.watcher.addPath(file_path)  # No-op unless a replace dropped it
+            self.state_changed.emit(file_path, "changed")
+        else:
+            self._watch_missing(file_path)
+            self.state_changed.emit(file_path, "missing")
+
+    def directory_changed(self, directory):
+        for file_path in list(self.missing.get(directory, ())):
+            if os.path.exists(file_path):
+                self.missing[directory].discard(file_path)
+                self.link_cache.invalidate(file_path)
+                self.watcher.addPath(file_path)
+                self.state_changed.emit(file_path, "changed")
+        if directory in self.missing and not self.missing[directory]:
+            del self.missing[directory]
+            self.watcher.removePath(directory)
+
+class CommandServer(QObject):
+    """Applies batches of JSON commands from scripts and editors, sent to server_address().
+
+    Each line a client sends is one batch: a JSON list of commands (or a single
+    command object). It is answered with one JSON line holding a result per
+    command; wait for it before sending the next batch on the same connection.
+
+        {"cmd": "add", "paths": [...], "check": false}     cold copies; folders are ingested like a drop
+        {"cmd": "link", "paths": [...], "check": false}    live links to files or folders
+        {"cmd": "check", "names": [...], "checked": true}  names (wildcards) or paths; "all": true for every item
+        {"cmd": "outline", "names": [...], "outline": true} copy as outlines, or in full with false
+        {"cmd": "copy"}                                     the assembled context, returned as "text"
+
+    Paths must be absolute; a field of the wrong JSON type fails its command
+    rather than being coerced. Batches that arrive together are applied in one
+    pass with a single save, so pushing 1000 files costs one state write, and
+    back-to-back copies from any number of clients share one assembly.
+    Folder drops finish ingesting after the reply, so a copy in the same batch
+    leaves them out.
+    """
+    def __init__(self, main_window):
+        super().__init__(main_window)
+        self.main_window = main_window
+        self.server = QLocalServer(self)
+        self.server.setSocketOptions(QLocalServer.UserAccessOption)
+        self.server.newConnection.connect(self.accept)
+        self.buffers = {}  # Connected socket -> bytes received since its last newline
+        self.queue = []  # (socket, commands) waiting for the next apply pass
+        self.copies = {}  # Running CopyContextJob -> [(socket, results, index of its result)]
+        self.apply_timer = QTimer(self)
+        self.apply_timer.setSingleShot(True)
+        self.apply_timer.setInterval(0)  # Everything already received is applied in one pass
+        self.apply_timer.timeout.connect(self.apply_queued)
+
+    def listen(self, address):
+        """Listens on address unless another window already does; a socket left by a crash is replaced."""
+        probe = QLocalSocket()
+        probe.connectToServer(address)
+        if probe.waitForConnected(SERVER_PROBE_MS):  # Probe first: listen() would unlink a live socket too
+            probe.abort()
+            return False
+        QLocalServer.removeServer(address)
+        return self.server.listen(address)
+
+    def accept(self):
+        while self.server.hasPendingConnections():
+            socket = self.server.nextPendingConnection()
+            self.buffers[socket] = b""
+            socket.readyRead.connect(self.read)
+            socket.disconnected.connect(self.drop)
+
+    def drop(self):
+        socket = self.sender()
+        self.buffers.pop(socket, None)
+        self.queue = [(queued, commands) for queued, commands in self.queue if queued is not socket]
+        socket.deleteLater()
+
+    def read(self):
+        socket = self.sender()
+        *lines, self.buffers[socket] = (self.buffers[socket] + bytes(socket.readAll())).split(b"\n")
+        for line in lines:
+            if not line.strip():
+                continue
+            try:
+                commands = json.loads(line)
+            except ValueError as e:
+                self.reply(socket, {"ok": False, "error": f"Invalid JSON: {e}"})
+                continue
+            if isinstance(commands, dict):
+                commands = [commands]
+            if not (isinstance(commands, list) and all(isinstance(command, dict) for command in commands)):
+                self.reply(socket, {"ok": False, "error": "A batch is a list of command objects"})
+                continue
+            self.queue.append((socket, commands))
+        if self.queue:
+            self.apply_timer.start()
+
+    def reply(self, socket, response):
+        if socket in self.buffers:  # Still connected
+            socket.write((json.dumps(response) + "\n").encode("utf-8"))
+
+    def apply_queued(self):
+        queue, self.queue = self.queue, []
+        copies = []
+        job = None  # Shared by copies with no other command between them, which see the same items
+        for socket, commands in queue:
+            results = []
+            for command in commands:
+                if command.get("cmd") == "copy":
+                    if job is None:
+                        job = self.main_window.copy_job()
+                        self.copies[job] = []
+                        copies.append(job)
+                    results.append(None)  # Filled in when the copy finishes
+                    self.copies[job].append((socket, results, len(results) - 1))
+                else:
+                    job = None
+                    try:
+                        results.append(self.run(command))
+                    except Exception as e:  # One bad command must not drop the rest of the queue or the save
+                        results.append({"ok": False, "error": f"{type(e).__name__}: {e}"})
+            if None not in results:
+                self.reply(socket, self.response(results))
+        self.main_window.flush_state()
+        for job in copies:
+            job.finished.connect(self.finish_copy)
+            job.start()
+
+    def finish_copy(self, text):
+        for socket, results, index in self.copies.pop(self.sender()):
+            results[index] = {"ok": True, "text": text or ""}
+            if None not in results:
+                self.reply(socket, self.response(results))
+
+    @staticmethod
+    def response(results):
+        return {"ok": all(result["ok"] for result in results), "results": results}
+
+    # Fields whose JSON type is checked before a command runs; anything else is rejected, not coerced
+    LIST_FIELDS = ("paths", "names")
+    BOOL_FIELDS = ("check", "checked", "outline", "all")
+
+    @classmethod
+    def shape_error(cls, command):
+        """Returns why command's fields have the wrong JSON types, or None."""
+        for field in cls.LIST_FIELDS:
+            value = command.get(field, [])
+            if not (isinstance(value, list) and all(isinstance(entry, str) for entry in value)):
+                return f"{field!r} must be a list of strings, got {value!r}"
+        for field in cls.BOOL_FIELDS:
+            if field in command and not isinstance(command[field], bool):
+                return f"{field!r} must be true or false, got {command[field]!r}"
+        return None
+
+    def run(self, command):
+        """Applies one non-copy command and returns its result."""
+        window = self.main_window
+        name = command.get("cmd")
+        error = self.shape_error(command)
+        if error:
+            return {"ok": False, "error": error}
+        if name in ("add", "link"):
+            added, skipped, errors = 0, [], []
+            for path in command.get("paths", []):
+                if not (os.path.isabs(path) and os.path.exists(path)):
+                    errors.append(f"Not an absolute path to a file or folder: {path!r}")
+                    continue
+                if name == "add":
+                    item_data = (window.process_folder_drop(path) if os.path.isdir(path)
+                                 else window.process_file_drop(path, is_link=False))
+                else:
+                    item_data = (window.process_folder_link(path) if os.path.isdir(path)
+                                 else window.process_file_drop(path, is_link=True))
+                if item_data is None:
+                    skipped.append(path)  # Already listed
+                    continue
+                if command.get("check"):
+                    window.update_item_state(item_data["id"], True)
+                added += 1
+            result = {"ok": not errors, "added": added, "skipped": skipped}
+            if errors:
+                result["error"] = "; ".join(errors)
+            return result
+        if name == "check":
+            selected = window.items if command.get("all") else select_items(window.items, command.get("names", []))
+            if not selected:
+                return {"ok": False, "error": f"No item matches {command.get('names', [])}"}
+            for item_data in list(selected):
+                window.update_item_state(item_data["id"], command.get("checked", True))
+            return {"ok": True, "matched": len(selected)}
+        if name == "outline":
+            selected = select_items(window.items, command.get("names", []))
+            if not selected:
+                return {"ok": False, "error": f"No item matches {command.get('names', [])}"}
+            window.set_copy_mode([item_data["id"] for item_data in selected], command.get("outline", True))
+            return {"ok": True, "matched": len(selected)}
+        return {"ok": False, "error": f"Unknown command: {name!r}"}
+
+class DragToggleController(QObject):
+    """Owns drag-to-toggle state for every checkbox in the list.
+
+    One application event filter is installed only while a drag is active, to
+    catch the mouse release wherever it lands; per-event cost doesn't depend on
+    the number of items.
+    """
+    def __init__(self, main_window):
+        super().__init__(main_window)
+        self.main_window = main_window
+        self.target_state = None
+
+    def is_active(self):
+        return self.target_state is not None
+
+    def begin(self, item_data):
+        self.target_state = not item_data.get("checked", False)
+        self.apply(item_data)
+        QApplication.instance().installEventFilter(self)
+
+    def apply(self, item_data):
+        if item_data.get("checked", False) != self.target_state:
+            self.main_window.update_item_state(item_data["id"], self.target_state)
+
+    def end(self):
+        self.target_state = None
+        QApplication.instance().removeEventFilter(self)
+
+    def eventFilter(self, obj, event):
+        if event.type() == QEvent.MouseButtonRelease:
+            self.end()
+        return False
+
+class ItemListModel(QAbstractListModel):
+    """Exposes an ItemRegistry to the list view without a widget per row."""
+    ItemRole = Qt.UserRole
+    StatusRole = Qt.UserRole + 1
+
+    def __init__(self, registry, parent=None):
+        super().__init__(parent)
+        self.registry = registry
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.registry)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        item_data = self.registry.items[index.row()]
+        if role in (Qt.DisplayRole, Qt.EditRole):
+            return item_data["name"]
+        if role == Qt.CheckStateRole:
+            return Qt.Checked if item_data.get("checked", False) else Qt.Unchecked
+        if role == Qt.ToolTipRole:
+            tooltip = []
+            if item_data["is_link"]:
+                missing = " (missing)" if item_data.get("link_state") == "missing" else ""
+                tooltip.append(f"Live Link{missing}: {item_data.get('link_path')}")
+            if item_data.get("stats"):
+                size, lines, tokens = item_data["stats"]
+                tooltip.append(f"{size:,} bytes, {lines:,} lines, ~{tokens:,} tokens")
+            if item_data.get("copy_mode") == "outline":
+                outline = item_data.get("outline_stats")
+                tooltip.append(f"Copied as outline, ~{outline[2]:,} tokens" if outline else "Copied as outline")
+            return "\n".join(tooltip) or None
+        if role == self.ItemRole:
+            return item_data
+        if role == self.StatusRole:
+            return item_data.get("status")
+        return None
+
+    def flags(self, index):
+        flags = super().flags(index)
+        if index.isValid() and not self.registry.items[index.row()]["is_link"]:
+            flags |= Qt.ItemIsEditable
+        return flags
+
+    def append(self, item_data):
+        row = len(self.registry)
+        self.beginInsertRows(QModelIndex(), row, row)
+        self.registry.append(item_data)
+        self.endInsertRows()
+
+    def remove(self, item_ids):
+        # Highest row first so earlier rows keep their numbers; renumber once at the end
+        rows = sorted((self.registry.row(item_id) for item_id in item_ids), reverse=True)
+        for row in rows:
+            self.beginRemoveRows(QModelIndex(), row, row)
+            del self.registry.items[row]
+            self.endRemoveRows()
+        self.registry.reindex()
+
+class ItemDelegate(QStyledItemDelegate):
+    """Paints the checkbox, live-link dot, name and ingest status of a row."""
+    CHECKBOX_SIZE = 15
+    LINK_DOT_SIZE = 12
+    SPACING = 6
+    ROW_HEIGHT = 22
+
+    def __init__(self, main_window, parent=None):
+        super().__init__(parent)
+        self.main_window = main_window
+
+    @classmethod
+    def checkbox_rect(cls, row_rect):
+        top = row_rect.top() + (row_rect.height() - cls.CHECKBOX_SIZE) // 2
+        return QRect(row_rect.left() + 2, top, cls.CHECKBOX_SIZE, cls.CHECKBOX_SIZE)
+
+    def sizeHint(self, option, index):
+        return QSize(option.rect.width(), max(self.ROW_HEIGHT, option.fontMetrics.height() + 4))
+
+    def paint(self, painter, option, index):
+        item_data = index.data(ItemListModel.ItemRole)
+        style = option.widget.style() if option.widget else QApplication.style()
+        style.drawPrimitive(QStyle.PE_PanelItemViewItem, option, painter, option.widget)
+
+        painter.save()
+        checkbox_rect = self.checkbox_rect(option.rect)
+        painter.setPen(QPen(QColor("black"), 1))
+        painter.setBrush(QColor("lightblue") if item_data.get("checked", False) else QColor("grey"))
+        painter.drawRect(checkbox_rect)
+        x = checkbox_rect.right() + self.SPACING
+
+        if item_data["is_link"]:
+            top = option.rect.top() + (option.rect.height() - self.LINK_DOT_SIZE) // 2
+            painter.setPen(Qt.NoPen)
+            painter.setBrush(QColor(LINK_COLORS[item_data.get("link_state", "ok")]))
+            painter.drawEllipse(QRect(x, top, self.LINK_DOT_SIZE, self.LINK_DOT_SIZE))
+            x += self.LINK_DOT_SIZE + self.SPACING
+
+        selected = option.state & QStyle.State_Selected
+        text_color = option.palette.highlightedText().color() if selected else option.palette.text().color()
+        right = option.rect.right() - 2
+        stats = MainWindow.copied_stats(item_data)
+        if stats:
+            tokens_text = format_count(stats[2])
+            if item_data.get("copy_mode") == "outline":
+                tokens_text = f"◇ {tokens_text}"
+            painter.setPen(QColor("grey"))
+            painter.drawText(QRect(x, option.rect.top(), right - x, option.rect.height()), Qt.AlignVCenter | Qt.AlignRight, tokens_text)
+            right -= option.fontMetrics.horizontalAdvance(tokens_text) + self.SPACING
+        text_rect = QRect(x, option.rect.top(), right - x, option.rect.height())
+        name = option.fontMetrics.elidedText(item_data["name"], Qt.ElideRight, text_rect.width())
+        painter.setPen(text_color)
+        painter.drawText(text_rect, Qt.AlignVCenter | Qt.AlignLeft, name)
+
+        status = item_data.get("status")
+        if status:
+            x += option.fontMetrics.horizontalAdvance(name) + self.SPACING
+            painter.setPen(QColor("grey"))
+            painter.drawText(QRect(x, option.rect.top(), right - x, option.rect.height()), Qt.AlignVCenter | Qt.AlignLeft, status)
+        painter.restore()
+
+    def createEditor(self, parent, option, index):
+        return QLineEdit(parent)
+
+    def updateEditorGeometry(self, editor, option, index):
+        left = self.checkbox_rect(option.rect).right() + self.SPACING
+        editor.setGeometry(QRect(left, option.rect.top(), option.rect.right() - left, option.rect.height()))
+
+    def setEditorData(self, editor, index):
+        item_name = index.data(Qt.EditRole)
+        editor.setText(item_name[2:] if item_name.startswith("📎 ") else item_name)
+        editor.selectAll()
+
+    def setModelData(self, editor, model, index):
+        item_data = index.data(ItemListModel.ItemRole)
+        new_name = editor.text().strip()
+        if new_name:
+            if not item_data["is_link"]:
+                new_name = f"📎 {new_name}"
+            if new_name != item_data["name"]:
+                self.main_window.update_item_name(item_data["id"], new_name)
+
+class DroppableListView(QListView):
+    def __init__(self, main_window, parent=None):
+        super().__init__(parent)
+        self.main_window = main_window
+        self.setAcceptDrops(True)
+        self.setContextMenuPolicy(Qt.CustomContextMenu)
+        self.customContextMenuRequested.connect(self.show_context_menu)
+        self.setSelectionMode(QAbstractItemView.ExtendedSelection)
+        self.setEditTriggers(QAbstractItemView.DoubleClicked)
+        self.setUniformItemSizes(True)
+
+    def dragEnterEvent(self, event):
+        if event.mimeData().hasUrls():
+            event.acceptProposedAction()
+        else:
+            super().dragEnterEvent(event)
+
+    def dragMoveEvent(self, event):
+        if event.mimeData().hasUrls():
+            event.acceptProposedAction()
+        else:
+            super().dragMoveEvent(event)
+
+    def dropEvent(self, event):
+        if event.mimeData().hasUrls():
+            urls = event.mimeData().urls()
+            for url in urls:
+                path = url.toLocalFile()
+                if path:
+                    if os.path.isdir(path):
+                        self.main_window.process_folder_drop(path)
+                    else:
+                        self.main_window.process_file_drop(path, is_link=False)
+            event.acceptProposedAction()
+        else:
+            super().dropEvent(event)
+
+    def mousePressEvent(self, event):
+        index = self.indexAt(event.pos())
+        if (event.button() == Qt.LeftButton and index.isValid()
+                and ItemDelegate.checkbox_rect(self.visualRect(index)).contains(event.pos())):
+            self.main_window.drag_controller.begin(index.data(ItemListModel.ItemRole))
+            event.accept()
+        else:
+            super().mousePressEvent(event)
+
+    def mouseMoveEvent(self, event):
+        drag_controller = self.main_window.drag_controller
+        if drag_controller.is_active():
+            index = self.indexAt(event.pos())
+            if index.isValid():
+                drag_controller.apply(index.data(ItemListModel.ItemRole))
+            event.accept()
+        else:
+            super().mouseMoveEvent(event)
+
+    def show_context_menu(self, pos):
+        index = self.indexAt(pos)
+        if index.isValid():
+            item_data = index.data(ItemListModel.ItemRole)
+            selected_rows = self.selectionModel().selectedRows()
+            if len(selected_rows) > 1 and index in selected_rows:
+                selected_items = [selected.data(ItemListModel.ItemRole) for selected in selected_rows]
+                menu = QMenu(self)
+                remove_action = menu.addAction("Remove Selected")
+                outline_action = menu.addAction("Copy Selected as Outlines")
+                outline_action.setCheckable(True)
+                outline_action.setChecked(all(selected.get("copy_mode") == "outline" for selected in selected_items))
+                action = menu.exec(self.mapToGlobal(pos))
+                if action == remove_action:
+                    self.main_window.remove_items([selected["id"] for selected in selected_items])
+                elif action == outline_action:
+                    self.main_window.set_copy_mode([selected["id"] for selected in selected_items], outline_action.isChecked())
+            else:
+                item_id, is_link = item_data["id"], item_data["is_link"]
+                menu = QMenu(self)
+                remove_action = menu.addAction("Cancel" if item_data.get("pending") else "Remove")
+                goto_action = menu.addAction("Go to Directory") if is_link else None
+                filter_action = menu.addAction("Filters…") if item_data.get("folder_path") else None
+                outline_action = None
+                if not item_data.get("pending"):
+                    outline_action = menu.addAction("Copy as Outline")
+                    outline_action.setCheckable(True)
+                    outline_action.setChecked(item_data.get("copy_mode") == "outline")
+                action = menu.exec(self.mapToGlobal(pos))
+                if action == remove_action:
+                    self.main_window.remove_items([item_id])
+                elif action == goto_action and is_link:
+                    self.main_window.go_to_directory(item_id)
+                elif action == filter_action and filter_action is not None:
+                    self.main_window.edit_ingest_filter(item_id)
+                elif action == outline_action and outline_action is not None:
+                    self.main_window.set_copy_mode([item_id], outline_action.isChecked())
+
+class FileDropArea(QWidget):
+    def __init__(self, main_window, parent=None):
+        super().__init__(parent)
+        self.main_window = main_window
+        self.setAcceptDrops(True)
+        self.setFixedSize(30, 30)
+        self.setStyleSheet("""
+            QWidget { background-color: #e0e0e0; border: 1px dashed #808080; border-radius: 5px; }
+            QWidget:hover { background-color: #c0c0c0; border: 1px solid #404040; }
+        """)
+        layout = QHBoxLayout(self)
+        layout.setContentsMargins(2, 2, 2, 2)
+        label = QLabel("🔗")
+        label.setAlignment(Qt.AlignCenter)
+        layout.addWidget(label)
+        self.setToolTip("Drop files here for live links")
+
+    def dragEnterEvent(self, event):
+        if event.mimeData().hasUrls():
+            event.acceptProposedAction()
+
+    def dragMoveEvent(self, event):
+        if event.mimeData().hasUrls():
+            event.acceptProposedAction()
+
+    def dropEvent(self, event):
+        if event.mimeData().hasUrls():
+            urls = event.mimeData().urls()
+            for url in urls:
+                file_path = url.toLocalFile()
+                if file_path:
+                    if os.path.isdir(file_path):
+                        self.main_window.process_folder_link(file_path)
+                    else:
+                        self.main_window.process_file_drop(file_path, is_link=True)
+            event.acceptProposedAction()
+
+class IngestFilterDialog(QDialog):
+    def __init__(self, folder_path, ingest_filter, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle("Folder Filters")
+        layout = QFormLayout(self)
+        self.include_edit = QLineEdit(", ".join(ingest_filter.include))
+        self.include_edit.setPlaceholderText("every text file")
+        self.exclude_edit = QLineEdit(", ".join(ingest_filter.exclude))
+        self.size_spin = QSpinBox()
+        self.size_spin.setRange(1, 1024 * 1024)
+        self.size_spin.setSuffix(" KB")
+        self.size_spin.setValue(max(1, ingest_filter.max_file_size // 1024))
+        layout.addRow(QLabel(folder_path))
+        layout.addRow("Include", self.include_edit)
+        layout.addRow("Exclude", self.exclude_edit)
+        layout.addRow("Max file size", self.size_spin)
+        buttons = QDialogButtonBox(QDialogButtonBox.Ok | QDialogButtonBox.Cancel)
+        buttons.accepted.connect(self.accept)
+        buttons.rejected.connect(self.reject)
+        layout.addRow(buttons)
+
+    def ingest_filter(self):
+        def split(text):
+            return [pattern.strip() for pattern in text.split(",") if pattern.strip()]
+        return IngestFilter(split(self.include_edit.text()), split(self.exclude_edit.text()), self.size_spin.value() * 1024)
+
+class DebugPanel(QDialog):
+    """The profiler's spans and counters, refreshed while open.
+
+    Opening the panel turns profiling on; closing it turns profiling off again
+    unless a trace file is being written.
+    """
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle("Profiler")
+        self.resize(560, 360)
+        self.report_view = QPlainTextEdit()
+        self.report_view.setReadOnly(True)
+        font = QFont("monospace")
+        font.setStyleHint(QFont.Monospace)
+        self.report_view.setFont(font)
+        self.trace_button = QPushButton()
+        self.trace_button.clicked.connect(self.toggle_trace)
+        reset_button = QPushButton("Reset")
+        reset_button.clicked.connect(self.reset)
+        buttons = QHBoxLayout()
+        buttons.addWidget(reset_button)
+        buttons.addStretch()
+        buttons.addWidget(self.trace_button)
+        layout = QVBoxLayout(self)
+        layout.addWidget(self.report_view)
+        layout.addLayout(buttons)
+        self.refresh_timer = QTimer(self)
+        self.refresh_timer.setInterval(DEBUG_REFRESH_MS)
+        self.refresh_timer.timeout.connect(self.refresh)
+
+    def showEvent(self, event):
+        PROFILER.enable()
+        self.refresh()
+        self.refresh_timer.start()
+        super().showEvent(event)
+
+    def hideEvent(self, event):
+        self.refresh_timer.stop()
+        if PROFILER.trace_path is None:
+            PROFILER.disable()
+        super().hideEvent(event)
+
+    def refresh(self):
+        self.report_view.setPlainText(PROFILER.report())
+        self.trace_button.setText(f"Stop Trace ({os.path.basename(PROFILER.trace_path)})" if PROFILER.trace_path
+                                  else "Trace to File…")
+
+    def reset(self):
+        PROFILER.reset()
+        self.refresh()
+
+    def toggle_trace(self):
+        if PROFILER.trace_path:
+            PROFILER.close()
+        else:
+            trace_path, _ = QFileDialog.getSaveFileName(self, "Trace File", "contextyap-trace.jsonl")
+            if trace_path:
+                PROFILER.enable(trace_path)
+        self.refresh()
+
+class OpacityControl(QWidget):
+    def __init__(self, main_window, parent=None):
+        super().__init__(parent)
+        self.main_window = main_window
+        self.setFixedSize(20, 20)
+        self.setStyleSheet("background-color: #d0d0d0; border: 1px solid #808080; border-radius: 3px;")
+        layout = QHBoxLayout(self)
+        layout.setContentsMargins(0, 0, 0, 0)
+        label = QLabel("👻")
+        label.setAlignment(Qt.AlignCenter)
+        layout.addWidget(label)
+        self.setToolTip("Scroll to adjust opacity (15%–100%)")
+
+    def wheelEvent(self, event):
+        delta = event.angleDelta().y()
+        current_opacity = self.main_window.windowOpacity()
+        step = 0.05
+        new_opacity = current_opacity + (step if delta > 0 else -step)
+        new_opacity = max(0.15, min(1.0, new_opacity))
+        self.main_window.setWindowOpacity(new_opacity)
+        self.main_window.save_state()
+
+class MainWindow(QMainWindow):
+    def __init__(self):
+        started = time.perf_counter()
+        super().__init__()
+        self.setWindowTitle("ContextYap")
+        self.setWindowIcon(QIcon("icon.jpg"))
+        self.setWindowFlags(self.windowFlags() | Qt.WindowStaysOnTopHint)
+        
+        self.store = open_store()
+        self.ingest_jobs = {}
+        self.copy_jobs = set()
+        self.link_cache = LinkCache()
+        self.link_watcher = LinkWatcher(self.link_cache, self)
+        self.link_watcher.state_changed.connect(self.update_link_state)
+        self.measure_worker = MeasureWorker(self.store, self.link_cache, self)
+        self.measure_worker.measured.connect(self.set_measurements)
+        self.outline_cache = OutlineCache()
+        self.outline_worker = OutlineWorker(self.store, self.link_cache, self.outline_cache, self)
+        self.outline_worker.outlined.connect(self.set_outline_stats)
+        self.folder_links = {}  # Item id -> FolderLink
+        self.folder_refresh_jobs = {}  # FolderLinkRefreshJob -> item id
+        self.folder_watch_dirs = {}  # Watched directory -> set of folder-link item ids
+        self.folder_watcher = QFileSystemWatcher(self)
+        self.folder_watcher.directoryChanged.connect(self.folder_directory_changed)
+        self.pending_folder_refreshes = set()
+        self.folder_refresh_timer = QTimer(self)
+        self.folder_refresh_timer.setSingleShot(True)
+        self.folder_refresh_timer.setInterval(FOLDER_REFRESH_DEBOUNCE_MS)
+        self.folder_refresh_timer.timeout.connect(self.refresh_pending_folders)
+        self.search_index = SearchIndex(self.store.search_path)
+        self.index_worker = IndexWorker(self.store, self.link_cache, self.search_index, self)
+        self.index_worker.indexed.connect(self.apply_search_filter)
+        self.drag_controller = DragToggleController(self)
+        self.save_timer = QTimer(self)
+        self.save_timer.setSingleShot(True)
+        self.save_timer.setInterval(SAVE_DEBOUNCE_MS)
+        self.save_timer.timeout.connect(self.flush_state)
+        
+        state = self.load_state()
+        self.items = state.get("items", [])
+        self.filters = state.get("filters", {})  # Folder path -> IngestFilter.to_dict()
+        self.token_budget = state.get("token_budget", DEFAULT_TOKEN_BUDGET)
+        self.compact_to_budget = state.get("compact_to_budget", False)
+        saved_opacity = state.get("opacity", DEFAULT_OPACITY)
+        saved_width = state.get("width", 200)
+        saved_height = state.get("height", 400)
+        self.setWindowOpacity(saved_opacity)
+        self.resize(saved_width, saved_height)
+        
+        header_layout = QHBoxLayout()
+        self.top_toggle = QToolButton()
+        self.top_toggle.setText("📌")
+        self.top_toggle.setMaximumWidth(30)
+        self.top_toggle.setCheckable(True)
+        self.top_toggle.setChecked(True)
+        self.top_toggle.setStyleSheet("""
+            QToolButton { background: #808080; color: white; border: 1px solid #808080; padding: 5px; }
+            QToolButton:checked { background: #ffaa00; color: white; }
+        """)
+        self.top_toggle.clicked.connect(self.toggle_always_on_top)
+        header_layout.addWidget(self.top_toggle)
+        
+        self.cc_button = QToolButton()
+        self.cc_button.setText("CC")
+        self.cc_button.setMaximumWidth(30)
+        self.cc_button.setStyleSheet("QToolButton { background: #808080; color: white; border: 1px solid #808080; padding: 5px; }")
+        self.cc_button.clicked.connect(self.clear_context)
+        header_layout.addWidget(self.cc_button)
+        
+        self.c_button = QToolButton()
+        self.c_button.setText("C")
+        self.c_button.setMaximumWidth(20)
+        self.c_button.setStyleSheet("QToolButton { background: #808080; color: white; border: 1px solid #808080; padding: 5px; }")
+        self.c_button.clicked.connect(lambda: self.copy_context())
+        self.c_button.setContextMenuPolicy(Qt.CustomContextMenu)
+        self.c_button.customContextMenuRequested.connect(self.show_copy_menu)
+        header_layout.addWidget(self.c_button)
+        
+        self.budget_label = QLabel()
+        self.budget_label.setContextMenuPolicy(Qt.ActionsContextMenu)
+        budget_action = QAction("Set Token Budget…", self.budget_label)
+        budget_action.triggered.connect(self.edit_token_budget)
+        self.budget_label.addAction(budget_action)
+        header_layout.addWidget(self.budget_label)
+        
+        self.collapse_button = QToolButton()
+        self.collapse_button.setText("▲")
+        self.collapse_button.setMaximumWidth(20)
+        self.collapse_button.setStyleSheet("QToolButton { background: #808080; color: white; border: 1px solid #808080; padding: 5px; }")
+        self.collapse_button.clicked.connect(self.toggle_collapse)
+        header_layout.addWidget(self.collapse_button)
+        
+        self.opacity_control = OpacityControl(self)
+        header_layout.addWidget(self.opacity_control)
+        
+        self.clipboard_button = QPushButton("📎")
+        self.clipboard_button.setFixedWidth(20)
+        self.clipboard_button.setStyleSheet("QPushButton { background-color: #4d4d4d; color: white; border: 1px solid #808080; padding: 5px; }")
+        self.clipboard_button.clicked.connect(self.add_clipboard_cold_link)
+        header_layout.addWidget(self.clipboard_button)
+        
+        header_layout.addStretch()
+        self.file_drop_area = FileDropArea(self)
+        header_layout.addWidget(self.file_drop_area)
+        
+        self.registry = ItemRegistry(self.items)
+        self.checked_stats = [0, 0, 0]  # Running bytes/lines/tokens of checked items
+        for item_data in self.items:
+            self.attach_item(item_data)
+        self.index_worker.retain(key for item_data in self.items for key in search_keys(item_data))
+        self.state_watcher = QFileSystemWatcher(self)
+        self.state_watcher.fileChanged.connect(self.state_file_changed)
+        self.watch_state_file()
+        self.model = ItemListModel(self.registry, self)
+        self.search_matches = None  # Ids of the items the filter box matches; None while it is empty
+        self.hidden_ids = set()  # Rows hidden in the view because they do not match
+        self.list_view = DroppableListView(self)
+        self.list_view.setModel(self.model)
+        self.list_view.setItemDelegate(ItemDelegate(self, self.list_view))
+        self.is_collapsed = False
+        self.previous_height = saved_height
+        self.update_budget_label()
+        
+        self.search_box = QLineEdit()
+        self.search_box.setPlaceholderText("Filter names and content…")
+        self.search_box.setClearButtonEnabled(True)
+        self.search_box.textChanged.connect(self.apply_search_filter)
+        self.search_box.returnPressed.connect(self.check_all_matches)
+        self.check_matches_button = QToolButton()
+        self.check_matches_button.setText("☑")
+        self.check_matches_button.setToolTip("Check All Matches (Enter)")
+        self.check_matches_button.setStyleSheet("QToolButton { background: #808080; color: white; border: 1px solid #808080; padding: 2px; }")
+        self.check_matches_button.clicked.connect(self.check_all_matches)
+        search_layout = QHBoxLayout()
+        search_layout.setContentsMargins(0, 0, 0, 0)
+        search_layout.setSpacing(0)
+        search_layout.addWidget(self.search_box)
+        search_layout.addWidget(self.check_matches_button)
+        self.search_widget = QWidget()
+        self.search_widget.setLayout(search_layout)
+        
+        header_widget = QWidget()
+        header_widget.setLayout(header_layout)
+        header_widget.setFixedHeight(40)
+        
+        central_widget = QWidget()
+        main_layout = QVBoxLayout()
+        main_layout.setContentsMargins(0, 0, 0, 0)
+        main_layout.setSpacing(0)
+        main_layout.addWidget(header_widget)
+        main_layout.addWidget(self.search_widget)
+        main_layout.addWidget(self.list_view)
+        central_widget.setLayout(main_layout)
+        self.setCentralWidget(central_widget)
+
+        self.command_server = CommandServer(self)
+        self.command_server.listen(server_address())
+
+        self.debug_panel = None  # Built on first use
+        debug_shortcut = QShortcut(QKeySequence(DEBUG_PANEL_SHORTCUT), self)
+        debug_shortcut.activated.connect(self.toggle_debug_panel)
+        if PROFILER.enabled:
+            PROFILER.record("startup", time.perf_counter() - started)
+
+    def closeEvent(self, event):
+        for job in self.ingest_jobs:
+            job.cancel()
+        self.save_timer.stop()
+        self.store.save(self.current_state())  # Without flush_state(), which could reload on the way out
+        self.command_server.server.close()  # Removes the socket file
+        self.outline_cache.close()
+        super().closeEvent(event)
+
+    def resizeEvent(self, event):
+        super().resizeEvent(event)
+        if not self.is_collapsed:
+            self.save_state()
+
+    def attach_item(self, item_data):
+        """Starts watching and measuring a loaded item, and adds it to the checked total."""
+        if item_data.get("is_folder"):
+            self.open_folder_link(item_data)
+        elif item_data["is_link"]:
+            item_data["link_state"] = self.link_watcher.watch(item_data["link_path"])
+        else:
+            item_data["stats"] = self.store.content_stats.get(item_data.get("content_hash"))
+        if item_data.get("stats"):
+            self.adjust_checked_stats(item_data, 1)
+        elif not item_data.get("is_folder"):
+            self.measure_worker.submit(item_data)  # Links, and counts from another estimator
+        self.index_worker.submit(item_data, force=item_data["is_link"] and not item_data.get("is_folder"))
+        self.request_outline(item_data)
+
+    def detach_item(self, item_data):
+        self.adjust_checked_stats(item_data, -1)
+        if item_data.get("is_folder"):
+            del self.folder_links[item_data["id"]]
+            self.watch_folder_directories(item_data["id"], [])
+        elif item_data["is_link"]:
+            self.link_watcher.unwatch(item_data["link_path"])
+
+    def process_file_drop(self, file_path, is_link):
+        """Adds a dropped file; returns the new item, or None if one by that name is already listed."""
+        name, _ = os.path.splitext(os.path.basename(file_path))
+        if self.registry.find(name, is_link) is None:
+            item_data = file_item(file_path, is_link, self.store)
+            if is_link:
+                item_data["link_state"] = self.link_watcher.watch(item_data["link_path"])
+            self.add_item_to_list(item_data)
+            if is_link:
+                self.measure_worker.submit(item_data)
+            self.save_state()
+            return item_data
+        return None
+
+    def process_folder_drop(self, folder_path):
+        name = self.registry.next_clipboard_name()
+        
+        # Reserve the name and row now; the item is not persisted until ingestion finishes
+        folder_path = os.path.abspath(folder_path)
+        item_data = {"name": name, "is_link": False, "folder_path": folder_path, "checked": False,
+                     "pending": True, "status": format_progress(0, 0)}
+        self.add_item_to_list(item_data)
+        
+        job = FolderIngestJob(folder_path, self.store.blobs, self.get_ingest_filter(folder_path))
+        job.progress.connect(self.update_ingest_progress)
+        job.finished.connect(self.finish_folder_ingest)
+        self.ingest_jobs[job] = item_data
+        job.start()
+        return item_data
+
+    def update_ingest_progress(self, files_read, bytes_read):
+        item_data = self.ingest_jobs.get(self.sender())
+        if item_data is not None:
+            item_data["status"] = format_progress(files_read, bytes_read)
+            self.refresh_item(item_data["id"])
+
+    def finish_folder_ingest(self, content_hash, stats, segments_hash):
+        job = self.sender()
+        if job not in self.ingest_jobs:
+            return  # Cancelled
+        item_data = self.ingest_jobs.pop(job)
+        if content_hash is None:
+            self.remove_items([item_data["id"]])
+            return
+        del item_data["pending"]
+        del item_data["status"]
+        item_data["content_hash"] = self.store.track_content(content_hash, stats)
+        item_data["segments_hash"] = segments_hash
+        self.store.track_blobs([segments_hash])
+        item_data["stats"] = stats
+        self.index_worker.submit(item_data)
+        self.adjust_checked_stats(item_data, 1)
+        self.refresh_item(item_data["id"])
+        self.save_state()
+
+    def process_folder_link(self, folder_path):
+        item_data = folder_link_item(folder_path)
+        if self.registry.find(item_data["name"], True) is None:
+            self.add_item_to_list(item_data)
+            self.open_folder_link(item_data)
+            self.refresh_item(item_data["id"])
+            self.save_state()
+            return item_data
+        return None
+
+    def open_folder_link(self, item_data):
+        folder_link = FolderLink(item_data["link_path"], self.store.blobs,
+                                 self.get_ingest_filter(item_data["link_path"]), item_data.get("manifest_hash"))
+        self.folder_links[item_data["id"]] = folder_link
+        item_data["link_state"] = "ok" if os.path.isdir(item_data["link_path"]) else "missing"
+        sync_folder_item(item_data, folder_link, self.store)
+        item_data["status"] = "scanning…"  # Until the first refresh picks up changes made while closed
+        self.start_folder_refresh(item_data["id"])
+
+    def sync_folder_link(self, item_id):
+        item_data = self.registry.get(item_id)
+        self.adjust_checked_stats(item_data, -1)
+        directories = sync_folder_item(item_data, self.folder_links[item_id], self.store)
+        self.adjust_checked_stats(item_data, 1)
+        self.refresh_item(item_id)
+        self.watch_folder_directories(item_id, directories)
+        self.index_worker.submit(item_data)  # Only new segments are read
+        self.request_outline(item_data)
+
+    def watch_folder_directories(self, item_id, directories):
+        for directory, item_ids in list(self.folder_watch_dirs.items()):
+            item_ids.discard(item_id)
+            if not item_ids:
+                del self.folder_watch_dirs[directory]
+                self.folder_watcher.removePath(directory)
+        for directory in directories:
+            if directory not in self.folder_watch_dirs:
+                self.folder_watch_dirs[directory] = set()
+                self.folder_watcher.addPath(directory)
+            self.folder_watch_dirs[directory].add(item_id)
+
+    def folder_directory_changed(self, directory):
+        self.pending_folder_refreshes.update(self.folder_watch_dirs.get(directory, ()))
+        self.folder_refresh_timer.start()
+
+    def refresh_pending_folders(self):
+        for item_id in self.pending_folder_refreshes:
+            if item_id in self.folder_links:
+                self.start_folder_refresh(item_id)
+        self.pending_folder_refreshes.clear()
+
+    def start_folder_refresh(self, item_id):
+        job = FolderLinkRefreshJob(self.folder_links[item_id])
+        job.finished.connect(self.finish_folder_refresh)
+        self.folder_refresh_jobs[job] = item_id
+        job.start()
+
+    def finish_folder_refresh(self, changed):
+        item_id = self.folder_refresh_jobs.pop(self.sender(), None)
+        item_data = self.registry.get(item_id)
+        if item_data is None or item_id not in self.folder_links:
+            return  # Removed while refreshing
+        first_refresh = item_data.pop("status", None) is not None
+        if not os.path.isdir(item_data["link_path"]):
+            item_data["link_state"] = "missing"
+        elif changed and not first_refresh:
+            item_data["link_state"] = "changed"
+        self.sync_folder_link(item_id)
+        self.save_state()
+
+    def get_ingest_filter(self, folder_path):
+        return IngestFilter.from_dict(self.filters.get(folder_path, {}))
+
+    def edit_ingest_filter(self, item_id):
+        item_data = self.registry.get(item_id)
+        folder_path = item_data and item_data.get("folder_path")
+        if not folder_path:
+            return
+        dialog = IngestFilterDialog(folder_path, self.get_ingest_filter(folder_path), self)
+        if dialog.exec() == QDialog.Accepted:
+            self.filters[folder_path] = dialog.ingest_filter().to_dict()
+            if item_id in self.folder_links:
+                self.folder_links[item_id].ingest_filter = dialog.ingest_filter()
+                self.start_folder_refresh(item_id)
+            self.save_state()
+
+    def add_item_to_list(self, item_data):
+        self.model.append(item_data)
+        self.index_worker.submit(item_data)
+
+    def apply_search_filter(self):
+        """Hides the rows the filter box does not match; also runs whenever the search index catches up."""
+        query = self.search_box.text().strip()
+        if not query:
+            if self.search_matches is not None:
+                self.show_matches(None)
+            return
+        with PROFILER.span("list.filter"):
+            matching_keys = self.search_index.search(query)
+            lowered = query.lower()
+            self.show_matches({
+                item_data["id"] for item_data in self.items
+                if lowered in item_data["name"].lower()
+                or (matching_keys and not matching_keys.isdisjoint(search_keys(item_data)))
+            })
+
+    def show_matches(self, matches):
+        """Hides every row not in matches (None shows all), touching only rows whose visibility changes."""
+        self.search_matches = matches
+        hidden = set() if matches is None else {item_data["id"] for item_data in self.items} - matches
+        for item_id in hidden ^ self.hidden_ids:
+            if self.registry.get(item_id) is not None:  # Removed since it was hidden
+                self.list_view.setRowHidden(self.registry.row(item_id), item_id in hidden)
+        self.hidden_ids = hidden
+
+    def check_all_matches(self):
+        if self.search_matches is None:
+            return  # No filter; "all matches" would be every item
+        for item_data in list(self.items):
+            if item_data["id"] in self.search_matches and not item_data.get("pending"):
+                self.update_item_state(item_data["id"], True)
+
+    def remove_items(self, item_ids):
+        item_ids = [item_id for item_id in item_ids if self.registry.get(item_id) is not None]
+        for job, pending_item in list(self.ingest_jobs.items()):
+            if pending_item["id"] in item_ids:
+                job.cancel()
+                del self.ingest_jobs[job]
+        for item_id in item_ids:
+            self.detach_item(self.registry.get(item_id))
+        self.model.remove(item_ids)
+        self.save_state()
+
+    def update_item_state(self, item_id, checked):
+        item_data = self.registry.get(item_id)
+        if item_data:
+            self.adjust_checked_stats(item_data, -1)
+            item_data["checked"] = checked
+            self.adjust_checked_stats(item_data, 1)
+            self.refresh_item(item_id)
+            self.save_state()
+
+    def adjust_checked_stats(self, item_data, sign):
+        """Adds (sign=1) or removes (sign=-1) a checked item's counts from the header total."""
+        stats = self.copied_stats(item_data)
+        if item_data.get("checked", False) and stats:
+            for i, count in enumerate(stats):
+                self.checked_stats[i] += sign * count
+            self.update_budget_label()
+
+    @staticmethod
+    def copied_stats(item_data):
+        """The counts of what a copy would paste for the item: its outline's, once known, or its full text's."""
+        if item_data.get("copy_mode") == "outline" and item_data.get("outline_stats"):
+            return item_data["outline_stats"]
+        return item_data.get("stats")
+
+    def set_copy_mode(self, item_ids, outline):
+        for item_id in item_ids:
+            item_data = self.registry.get(item_id)
+            if item_data is None or item_data.get("pending"):
+                continue
+            self.adjust_checked_stats(item_data, -1)
+            item_data.pop("outline_stats", None)
+            if outline:
+                item_data["copy_mode"] = "outline"
+            else:
+                item_data.pop("copy_mode", None)
+            self.adjust_checked_stats(item_data, 1)
+            self.refresh_item(item_id)
+            self.request_outline(item_data)
+        self.save_state()
+
+    def request_outline(self, item_data):
+        if item_data.get("copy_mode") == "outline" and not item_data.get("pending"):
+            self.outline_worker.submit(item_data, self.folder_links.get(item_data["id"]))
+
+    def set_outline_stats(self, item_id, stats):
+        item_data = self.registry.get(item_id)
+        if item_data is None or item_data.get("copy_mode") != "outline":
+            return  # Removed, or switched back to full text, while being outlined
+        self.adjust_checked_stats(item_data, -1)
+        item_data["outline_stats"] = stats
+        self.adjust_checked_stats(item_data, 1)
+        self.refresh_item(item_id)
+
+    def refresh_item(self, item_id):
+        """Repaints an item's row.
+
+        Rows are painted from the item dicts, so a repaint is all a change needs;
+        it also spares a Python dataChanged.emit() per toggle or measurement.
+        """
+        if item_id not in self.hidden_ids:
+            self.list_view.viewport().update(self.list_view.visualRect(self.model.index(self.registry.row(item_id))))
+
+    def update_budget_label(self):
+        size, lines, tokens = self.checked_stats
+        color = "#aa0000" if tokens > self.token_budget else "grey"
+        self.budget_label.setText(format_count(tokens))
+        self.budget_label.setStyleSheet(f"color: {color};")
+        self.budget_label.setToolTip(f"~{tokens:,} of {self.token_budget:,} tokens checked\n{size:,} bytes, {lines:,} lines")
+
+    def edit_token_budget(self):
+        budget, accepted = QInputDialog.getInt(self, "Token Budget", "Tokens:", self.token_budget, 1, 100000000, 1000)
+        if accepted:
+            self.token_budget = budget
+            self.update_budget_label()
+            self.save_state()
+
+    def set_measurements(self, measurements):
+        """Applies a MeasureWorker batch, then repaints the list once."""
+        for item_id, content_hash, stats in measurements:
+            self.set_item_stats(item_id, content_hash, stats)
+        self.list_view.viewport().update()
+
+    def set_item_stats(self, item_id, content_hash, stats):
+        """Records an item's counts; the caller repaints its row."""
+        item_data = self.registry.get(item_id)
+        if item_data is None:
+            return  # Removed while being measured
+        self.adjust_checked_stats(item_data, -1)
+        item_data["stats"] = stats
+        self.adjust_checked_stats(item_data, 1)
+        if content_hash and stats:
+            self.store.content_stats.setdefault(content_hash, stats)
+        if item_data["is_link"]:
+            self.request_outline(item_data)  # Measured because the file changed
+
+    def update_item_name(self, item_id, new_name):
+        item_data = self.registry.get(item_id)
+        if item_data and not self.registry.has_name(new_name):
+            self.registry.rename(item_id, new_name)
+            self.refresh_item(item_id)
+            self.save_state()
+
+    def go_to_directory(self, item_id):
+        path = self.get_item_path(item_id)
+        if self.registry.get(item_id).get("is_folder"):
+            path = os.path.join(path, "")  # So dirname() below opens the folder itself
+        if os.path.exists(path):
+            if sys.platform == "win32":
+                os.startfile(os.path.dirname(path))
+            elif sys.platform == "darwin":
+                subprocess.Popen(["open", os.path.dirname(path)])
+            else:
+                subprocess.Popen(["xdg-open", os.path.dirname(path)])
+
+    def get_item_path(self, item_id):
+        return self.registry.get(item_id)["link_path"]
+
+    def clear_context(self):
+        for item_data in self.items:
+            item_data["checked"] = False
+        self.checked_stats = [0, 0, 0]
+        self.update_budget_label()
+        self.list_view.viewport().update()
+        self.save_state()
+
+    def checked_items(self):
+        # Shallow copies, so the copy thread never sees later edits
+        return [dict(item_data) for item_data in self.items if item_data.get("checked", False) and not item_data.get("pending")]
+
+    def copy_context(self, output_path=None):
+        job = self.copy_job(output_path)
+        job.finished.connect(self.copy_to_clipboard)
+        job.start()
+
+    def copy_job(self, output_path=None):
+        """A CopyContextJob over the checked items as they are now; connect finished, then start() it."""
+        compact_budget = self.token_budget if self.compact_to_budget else None
+        job = CopyContextJob(self.checked_items(), self.store, self.link_cache, dict(self.folder_links),
+                             output_path, compact_budget, self.outline_cache)
+        job.compacted.connect(self.show_compaction_report)
+        job.finished.connect(self.finish_copy)
+        self.copy_jobs.add(job)
+        return job
+
+    def finish_copy(self, result):
+        job = self.sender()
+        self.copy_jobs.discard(job)
+        for copied in job.items:
+            item_data = self.registry.get(copied["id"])
+            if item_data and item_data.get("link_state") == "changed":
+                item_data["link_state"] = "ok"  # The copy picked up the change
+                self.refresh_item(item_data["id"])
+            if item_data and item_data["id"] in self.folder_links:
+                self.sync_folder_link(item_data["id"])  # The copy refreshed the manifest
+                self.save_state()
+
+    def copy_to_clipboard(self, result):
+        if result:
+            with PROFILER.span("clipboard"):
+                pyperclip.copy(result)
+
+    def show_compaction_report(self, report):
+        self.c_button.setToolTip(report)
+        QToolTip.showText(self.c_button.mapToGlobal(self.c_button.rect().bottomLeft()), report, self.c_button)
+
+    def update_link_state(self, link_path, state):
+        for item_data in self.items:
+            if item_data["is_link"] and item_data["link_path"] == link_path:
+                item_data["link_state"] = state
+                self.refresh_item(item_data["id"])
+                if state == "missing":
+                    self.set_item_stats(item_data["id"], None, None)
+                else:
+                    self.measure_worker.submit(item_data)
+                    self.index_worker.submit(item_data, force=True)
+
+    def show_copy_menu(self, pos):
+        menu = QMenu(self)
+        save_action = menu.addAction("Save to File…")
+        compact_action = menu.addAction("Compact to Budget")
+        compact_action.setCheckable(True)
+        compact_action.setChecked(self.compact_to_budget)
+        chosen = menu.exec(self.c_button.mapToGlobal(pos))
+        if chosen == save_action:
+            self.save_context_to_file()
+        elif chosen == compact_action:
+            self.compact_to_budget = compact_action.isChecked()
+            self.save_state()
+
+    def save_context_to_file(self):
+        output_path, _ = QFileDialog.getSaveFileName(self, "Save Context", "context.md")
+        if output_path:
+            self.copy_context(output_path)
+
+    def add_clipboard_cold_link(self):
+        clipboard_text = pyperclip.paste().strip()
+        if clipboard_text:
+            name = self.registry.next_clipboard_name()
+            content_hash = self.store.put_content(clipboard_text)
+            item_data = {"name": name, "is_link": False, "content_hash": content_hash,
+                         "segment_key": segment_key(clipboard_text), "checked": False,
+                         "stats": self.store.content_stats[content_hash]}
+            self.add_item_to_list(item_data)
+            self.save_state()
+
+    def toggle_debug_panel(self):
+        if self.debug_panel is None:
+            self.debug_panel = DebugPanel(self)
+        self.debug_panel.setVisible(not self.debug_panel.isVisible())
+
+    def toggle_always_on_top(self):
+        current_flags = self.windowFlags()
+        if self.top_toggle.isChecked():
+            self.setWindowFlags(current_flags | Qt.WindowStaysOnTopHint)
+        else:
+            self.setWindowFlags(current_flags & ~Qt.WindowStaysOnTopHint)
+        self.show()
+
+    def toggle_collapse(self):
+        if self.is_collapsed:
+            self.list_view.show()
+            self.search_widget.show()
+            self.collapse_button.setText("▲")
+            self.setMinimumHeight(0)
+            self.setMaximumHeight(16777215)
+            self.resize(self.width(), self.previous_height)
+            self.is_collapsed = False
+        else:
+            self.previous_height = self.height()
+            self.list_view.hide()
+            self.search_widget.hide()
+            self.collapse_button.setText("▼")
+            header_height = 40 + self.frameGeometry().height() - self.geometry().height()
+            self.setFixedHeight(header_height)
+            self.is_collapsed = True
+        self.save_state()
+
+    def load_state(self):
+        with PROFILER.span("load_state"):
+            return self.store.load()
+
+    def watch_state_file(self):
+        if os.path.exists(self.store.watch_path) and not self.state_watcher.files():
+            self.state_watcher.addPath(self.store.watch_path)
+
+    def state_file_changed(self, path):
+        # Atomic replaces drop the watch, so it is re-added on every change
+        self.state_watcher.removePath(path)
+        self.watch_state_file()
+        if self.store.changed_on_disk():
+            self.reload_state()
+
+    def reload_state(self):
+        """Adopts state written by another process, such as the command line.
+
+        Edits still waiting for the debounced save are merged into the newer
+        file first; folder drops still being ingested are kept. Items are
+        matched by id: unchanged ones stay attached with their caches, a new
+        name, check or copy mode is applied in place, and only items whose
+        source changed are detached and attached again.
+        """
+        if self.save_timer.isActive():
+            self.flush_state()  # Merges, then comes back here
+            return
+        state = self.load_state()
+        old_filters, self.filters = self.filters, state.get("filters", {})
+        self.token_budget = state.get("token_budget", DEFAULT_TOKEN_BUDGET)
+        self.compact_to_budget = state.get("compact_to_budget", False)
+        with PROFILER.span("list.rebuild"):
+            previous_ids = [item_data["id"] for item_data in self.items]
+            current = {item_data["id"]: item_data for item_data in self.items if not item_data.get("pending")}
+            items = []
+            for loaded in state.get("items", []):
+                item_data = current.pop(loaded.get("id"), None)
+                source = item_data and (item_data.get("link_path") or item_data.get("folder_path"))
+                if item_data is None:
+                    self.attach_item(loaded)
+                    item_data = loaded
+                elif (any(item_data.get(key) != loaded.get(key) for key in RELOAD_SOURCE_KEYS)
+                      or old_filters.get(source) != self.filters.get(source)):
+                    self.detach_item(item_data)
+                    self.attach_item(loaded)
+                    item_data = loaded
+                else:
+                    self.update_item_in_place(item_data, loaded)
+                items.append(item_data)
+            for item_data in current.values():  # Removed by the other process
+                self.detach_item(item_data)
+            items += [item_data for item_data in self.items if item_data.get("pending")]
+            self.registry.replace(items)
+            if [item_data["id"] for item_data in self.items] == previous_ids:
+                self.list_view.viewport().update()
+            else:
+                self.model.beginResetModel()
+                self.model.endResetModel()
+                self.hidden_ids = set()  # A reset shows every row again
+                self.apply_search_filter()
+        self.update_budget_label()
+
+    def update_item_in_place(self, item_data, loaded):
+        """Copies another process's name, check and copy mode onto an attached item."""
+        self.adjust_checked_stats(item_data, -1)
+        item_data["name"] = loaded["name"]
+        item_data["checked"] = loaded.get("checked", False)
+        if item_data.get("copy_mode") != loaded.get("copy_mode"):
+            item_data.pop("outline_stats", None)
+            item_data.pop("copy_mode", None)
+            if loaded.get("copy_mode"):
+                item_data["copy_mode"] = loaded["copy_mode"]
+            self.request_outline(item_data)
+        self.adjust_checked_stats(item_data, 1)
+
+    def save_state(self):
+        self.save_timer.start()  # Restarting the timer coalesces bursts into one write
+
+    def current_state(self):
+        return {
+            "items": self.items,
+            "opacity": self.windowOpacity(),
+            "width": self.width(),
+            "height": self.height() if not self.is_collapsed else self.previous_height,
+            "filters": self.filters,
+            "token_budget": self.token_budget,
+            "compact_to_budget": self.compact_to_budget
+        }
+
+    def flush_state(self):
+        self.save_timer.stop()
+        with PROFILER.span("save_state"):
+            self.store.save(self.current_state())
+        self.watch_state_file()
+        if self.store.changed_on_disk():  # Another process wrote first; show the merged result
+            self.reload_state()
+
+def main():
+    if PYSIDE_VERSION in BROKEN_PYSIDE_VERSIONS and sys.version_info < (3, 12):
+        print(f"contextyap: PySide6 {PYSIDE_VERSION} corrupts reference counts on Python < 3.12 and soon crashes; "
+              'install another version: pip install "PySide6!=6.12.0"', file=sys.stderr)
+        return 1
+    PROFILER.enable_from_env()
+    app = QApplication(sys.argv)
+    window = MainWindow()
+    window.show()
+    return app.exec()
+
+if __name__ == "__main__":
+    sys.exit(main())
\ No newline at end of file
@@ -0,0 +1,34 @@
+"""benchmarks/suite.py exit status: failed cases fail the run and the comparison."""
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks"))
+
+import suite
+
+def write_results(path, results):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"meta": {"commit": None}, "results": results}, f)
+    return str(path)
+
+def test_a_failed_case_fails_the_run(tmp_path, monkeypatch):
+    monkeypatch.setattr(suite, "spawn", lambda case, parameter, work: {"error": "RuntimeError: boom"}
+                        if case == "persistence-sqlite" else {"save_ms": 1.0})
+    out = tmp_path / "results.json"
+    assert suite.run_suite(["persistence-json", "persistence-sqlite"], ["small"], str(out)) == 1
+    assert json.loads(out.read_text(encoding="utf-8"))["results"]["persistence-sqlite/small"] == {
+        "error": "RuntimeError: boom"}
+    monkeypatch.setattr(suite, "spawn", lambda case, parameter, work: {"save_ms": 1.0})
+    assert suite.run_suite(["persistence-json"], ["small"], str(out)) == 0
+
+def test_compare_counts_failed_cases_and_regressions(tmp_path, capsys):
+    before = write_results(tmp_path / "before.json", {"copy/small": {"copy_ms": 10.0}, "toggle/100": {"toggle_ms": 1.0}})
+    assert suite.compare(before, write_results(tmp_path / "same.json", {"copy/small": {"copy_ms": 10.5},
+                                                                        "toggle/100": {"toggle_ms": 1.0}}), 0.1) == 0
+    assert suite.compare(before, write_results(tmp_path / "slower.json", {"copy/small": {"copy_ms": 20.0},
+                                                                          "toggle/100": {"toggle_ms": 1.0}}), 0.1) == 1
+    failed = write_results(tmp_path / "failed.json", {"copy/small": {"copy_ms": 10.0}, "toggle/100": {"error": "boom"}})
+    capsys.readouterr()
+    assert suite.compare(before, failed, 0.1) == 1
+    assert "error: boom" in capsys.readouterr().out
@@ -0,0 +1,81 @@
+"""compact_context: pass order, the budget, and the one-line report."""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from contextyap_core import BACK_REFERENCE, ContextPart, compact_context, estimate_tokens
+
+LICENSE_HEADER = "# Copyright (c) 2020 Example\n# Licensed under the MIT License\n"
+
+def folder(name, files):
+    body = "\n".join(f"📎 {path}\n```\n{text}\n```" for path, text in files)
+    return ContextPart(name, body, True)
+
+def rendered_tokens(parts):
+    return estimate_tokens("".join(part.render() for part in parts))
+
+def code(lines, comment_every=0):
+    return "\n".join(f"# note {i}" if comment_every and i % comment_every == 0 else f"value_{i} = {i} * 2"
+                     for i in range(lines))
+
+def test_parts_that_fit_are_left_alone():
+    parts = [folder("📎 proj", [("a.py", "x = 1\n\n\n\ny = 2")])]
+    before = parts[0].render()
+    assert compact_context(parts, rendered_tokens(parts)) is None
+    assert parts[0].render() == before
+
+def test_folder_bodies_split_into_files():
+    parts = [folder("📎 proj", [("a.py", "x = 1"), ("b.md", "# Title")]), ContextPart("📎 note", "plain text", False)]
+    assert [path for path, _ in parts[0].files] == ["a.py", "b.md"]
+    assert parts[1].files == [["📎 note", "plain text"]]
+
+def test_whitespace_goes_first_and_later_passes_do_not_run():
+    padded = "x = 1   \n\n\n\n# keep this comment\ny = 2\n\n\n"
+    parts = [folder("📎 proj", [("a.py", padded * 20)])]
+    report = compact_context(parts, rendered_tokens(parts) - 10)
+    text = parts[0].files[0][1]
+    assert report.split(": ", 1)[1].startswith("whitespace −")
+    assert "\n\n\n" not in text and "   \n" not in text
+    assert "# keep this comment" in text  # Comment stripping was not needed
+    assert "duplicates" not in report and "truncated" not in report
+
+def test_duplicates_become_back_references_before_anything_is_stripped():
+    body = LICENSE_HEADER + code(200, comment_every=5)
+    parts = [folder("📎 proj", [("a.py", body), ("copy/a.py", body + "\n\n")])]
+    report = compact_context(parts, rendered_tokens(parts) * 2 // 3)
+    assert [name.split(" −")[0] for name in report.split(": ", 1)[1].split(", ")] == ["whitespace", "duplicates"]
+    assert parts[0].files[1][1] == BACK_REFERENCE.format("📎 a.py")
+    assert parts[0].files[0][1].startswith("# Copyright")  # Within budget before the license pass
+
+def test_stripping_runs_before_truncation():
+    body = LICENSE_HEADER + code(400, comment_every=2)
+    parts = [folder("📎 proj", [("a.py", body)])]
+    report = compact_context(parts, rendered_tokens(parts) * 3 // 4)
+    text = parts[0].files[0][1]
+    assert "license headers" in report and "comments" in report
+    assert "truncated" not in report and "lines cut" not in text
+    assert "Copyright" not in text and "# note" not in text
+    assert "value_399 = 399 * 2" in text
+
+def test_truncation_meets_the_budget_and_cuts_the_largest_files():
+    parts = [folder("📎 proj", [("big.py", code(2000)), ("small.py", code(20))])]
+    budget = 3000
+    report = compact_context(parts, budget)
+    big, small = (text for _, text in parts[0].files)
+    assert rendered_tokens(parts) <= budget
+    assert "still over" not in report and report.split(": ", 1)[1].startswith("truncated −")
+    assert "lines cut …]" in big and big.startswith("value_0 = 0 * 2") and big.endswith("value_1999 = 1999 * 2")
+    assert small == code(20)  # Under the cap, so kept whole
+
+def test_report_text():
+    parts = [folder("📎 proj", [("a.py", "x = 1" + " " * 400), ("b.py", "y = 2")])]
+    before = rendered_tokens(parts)
+    report = compact_context(parts, before - 50)
+    assert report == f"Compacted ~{before} → ~{rendered_tokens(parts)} tokens: whitespace −100 (1 file)"
+
+def test_report_says_when_the_budget_cannot_be_met():
+    parts = [folder("📎 proj", [(f"f{i}.py", f"file = {i}\n" + code(300)) for i in range(5)])]
+    report = compact_context(parts, 10)
+    assert report.startswith("Compacted ~") and ", still over the 10 budget: truncated −" in report
+    assert "(5 files)" in report
@@ -0,0 +1,96 @@
+"""Copy-time dedup: segment keys, back-references, and streaming cold folder drops."""
+import io
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from contextyap_core import (BACK_REFERENCE, IngestFilter, LinkCache, SQLiteStateStore, _split_segments, file_item,
+                             first_occurrence, ingest_folder, segment_key, write_context)
+
+SHARED = "".join(f"def shared_{i}():\n    return {i}\n\n" for i in range(8))
+
+def open_store(tmp_path):
+    store = SQLiteStateStore(str(tmp_path / "contextyap.db"), str(tmp_path / "state.json"),
+                             str(tmp_path / "state_content"))
+    store.load()
+    return store
+
+def make_tree(root, files):
+    for relative_path, text in files.items():
+        path = root / relative_path
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(text, encoding="utf-8")
+
+def folder_drop(store, folder_path, name):
+    content_hash, stats, segments_hash = ingest_folder(str(folder_path), store.blobs, IngestFilter([], []))
+    return {"id": name, "name": name, "is_link": False, "folder_path": str(folder_path), "checked": True,
+            "content_hash": store.track_content(content_hash, stats), "segments_hash": segments_hash}
+
+def copied(items, store, link_cache=None):
+    sink = io.StringIO()
+    write_context(items, store, sink, link_cache)
+    return sink.getvalue()
+
+def test_segment_key_ignores_surrounding_blank_lines_and_trailing_spaces():
+    assert segment_key(SHARED) == segment_key("\n\n" + SHARED.replace("1\n", "1   \n") + "\n\n")
+    assert segment_key(SHARED) != segment_key(SHARED.replace("return 1", "return 2"))
+    assert segment_key("x = 1\n") is None  # Too short to be worth a back-reference
+
+def test_first_occurrence_refers_back_to_the_first_label():
+    seen = {}
+    assert "".join(first_occurrence("k", "a.py", seen, ["body"])) == "body"
+    assert "".join(first_occurrence("k", "b.py", seen, ["body"])) == BACK_REFERENCE.format("a.py")
+    assert "".join(first_occurrence(None, "c.py", seen, ["body"])) == "body"  # No key, no dedup
+
+def test_files_shared_by_folder_drops_are_written_once(tmp_path):
+    make_tree(tmp_path / "one", {"shared.py": SHARED, "only_one.py": "one = 1\n"})
+    make_tree(tmp_path / "two", {"copy_of_shared.py": SHARED + "\n\n", "only_two.py": "two = 2\n"})
+    store = open_store(tmp_path)
+    text = copied([folder_drop(store, tmp_path / "one", "📎 one"), folder_drop(store, tmp_path / "two", "📎 two")],
+                  store)
+    assert text.count("def shared_7()") == 1
+    assert BACK_REFERENCE.format(os.path.join("📎 one", "shared.py")) in text
+    assert "one = 1" in text and "two = 2" in text
+
+def test_cold_files_and_live_links_share_back_references(tmp_path):
+    make_tree(tmp_path / "src", {"shared.py": SHARED})
+    store = open_store(tmp_path)
+    path = str(tmp_path / "src" / "shared.py")
+    cold = dict(file_item(path, False, store), id="cold", checked=True)
+    live = dict(file_item(path, True, store), id="live", name="live", checked=True)
+    folder = folder_drop(store, tmp_path / "src", "📎 src")
+    text = copied([cold, live, folder], store, LinkCache())
+    assert text.count("def shared_7()") == 1
+    assert text.count(BACK_REFERENCE.format("shared")) == 2  # The cold copy's item name
+
+def test_cold_folder_drops_are_streamed(tmp_path, monkeypatch):
+    make_tree(tmp_path / "src", {f"f{i}.py": f"value = {i}\n" for i in range(5)})
+    store = open_store(tmp_path)
+    item_data = folder_drop(store, tmp_path / "src", "📎 src")
+    expected = store.blobs.get(item_data["content_hash"])
+    get = store.blobs.get
+    monkeypatch.setattr(store.blobs, "get", lambda content_hash: pytest.fail("Folder text loaded whole")
+                        if content_hash == item_data["content_hash"] else get(content_hash))
+    assert copied([item_data], store) == f"📎 src\n```\n{expected}\n```\n"
+
+def test_split_segments_matches_slicing_for_any_chunk_size():
+    bodies = {"a": "body a", "b": "", "c": "body c is longer"}
+    text = "head"
+    segments = []
+    for name, body in bodies.items():
+        text += f"\n[{name}]"
+        segments.append([name, f"k{name}", len(text), len(text) + len(body)])
+        text += body
+    text += "\ntail"
+    for size in (1, 3, 7, len(text)):
+        chunks = [text[i:i + size] for i in range(0, len(text), size)]
+        pieces = list(_split_segments(chunks, segments))
+        assert [body for _, body, _ in pieces] == [*bodies.values(), None]
+        assert "".join(gap + (body or "") for gap, body, _ in pieces) == text
+
+def test_split_segments_rejects_text_shorter_than_its_index():
+    with pytest.raises(ValueError):
+        list(_split_segments(["short"], [["a", "k", 0, 10]]))
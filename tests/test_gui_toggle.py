@@ -0,0 +1,58 @@
+"""Offscreen toggling of many rows: counts stay right and the Qt binding does not corrupt reference counts."""
+import os
+import sys
+
+import pytest
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+QtWidgets = pytest.importorskip("PySide6.QtWidgets")
+
+import contextyap_gui
+
+ITEM_COUNT = 300
+TOGGLES = 1500
+
+@pytest.fixture
+def window(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("CONTEXTYAP_SOCKET", str(tmp_path / "contextyap.sock"))
+    monkeypatch.delenv("CONTEXTYAP_STORE", raising=False)
+    app = QtWidgets.QApplication.instance() or QtWidgets.QApplication([])
+    window = contextyap_gui.MainWindow()
+    for i in range(ITEM_COUNT):
+        content_hash = window.store.put_content(f"item {i}\n")
+        window.add_item_to_list({"name": f"📎 item-{i}", "is_link": False, "checked": False,
+                                 "content_hash": content_hash, "stats": window.store.content_stats[content_hash]})
+    window.show()
+    app.processEvents()
+    yield window
+    window.close()
+    app.processEvents()
+
+def test_many_toggles_keep_totals_and_reference_counts(window):
+    app = QtWidgets.QApplication.instance()
+    before = sys.getrefcount(None), sys.getrefcount(True), sys.getrefcount(False)
+    ids = [item_data["id"] for item_data in window.items]
+    for i in range(TOGGLES):
+        window.update_item_state(ids[i * 7 % ITEM_COUNT], i % 3 != 0)
+        if i % 50 == 0:
+            app.processEvents()  # Paint the dirty rows
+    for item_id in ids:
+        window.update_item_state(item_id, True)
+    window.clear_context()
+    window.clear_context()
+    app.processEvents()
+    after = sys.getrefcount(None), sys.getrefcount(True), sys.getrefcount(False)
+
+    assert window.checked_stats == [0, 0, 0]
+    assert not any(item_data["checked"] for item_data in window.items)
+    # A binding that drops a reference per call would lose thousands here, and abort soon after
+    assert all(count_after > count_before - 100 for count_before, count_after in zip(before, after))
+
+def test_toggles_update_the_checked_total(window):
+    ids = [item_data["id"] for item_data in window.items]
+    for item_id in ids[:10]:
+        window.update_item_state(item_id, True)
+    assert window.checked_stats == [sum(item_data["stats"][i] for item_data in window.items[:10]) for i in range(3)]
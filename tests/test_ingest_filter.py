@@ -0,0 +1,89 @@
+"""IgnoreRules and IngestFilter: which files a folder drop reads."""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from contextyap_core import IgnoreRules, IngestFilter
+
+def make_tree(root, files):
+    for relative_path, text in files.items():
+        path = root / relative_path
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(text, encoding="utf-8")
+
+def walked(root, ingest_filter):
+    return sorted(os.path.relpath(path, root).replace(os.sep, "/") for path in ingest_filter.iter_files(str(root)))
+
+def test_unanchored_pattern_matches_at_any_depth():
+    rules = IgnoreRules().extended(["*.log"])
+    assert rules.match("a.log", False)
+    assert rules.match("deep/dir/a.log", False)
+    assert not rules.match("a.log.txt", False)
+
+def test_anchored_pattern_matches_from_base_only():
+    rules = IgnoreRules().extended(["/build"])
+    assert rules.match("build", True)
+    assert not rules.match("src/build", True)
+
+def test_dir_only_pattern_skips_files():
+    rules = IgnoreRules().extended(["cache/"])
+    assert rules.match("cache", True)
+    assert not rules.match("cache", False)
+
+def test_last_matching_rule_wins():
+    rules = IgnoreRules().extended(["*.md", "!README.md"])
+    assert rules.match("notes.md", False)
+    assert not rules.match("README.md", False)
+
+def test_double_star_and_character_class():
+    rules = IgnoreRules().extended(["docs/**/draft?.md", "v[0-9].txt"])
+    assert rules.match("docs/draft1.md", False)
+    assert rules.match("docs/a/b/draft2.md", False)
+    assert rules.match("v1.txt", False)
+    assert not rules.match("vx.txt", False)
+
+def test_nested_rules_apply_below_their_directory():
+    rules = IgnoreRules().extended(["*.tmp"], base="sub")
+    assert rules.match("sub/a.tmp", False)
+    assert not rules.match("a.tmp", False)
+
+def test_ignore_rules_are_case_sensitive_by_default():
+    rules = IgnoreRules().extended(["*.md"])
+    assert not rules.match("README.MD", False)
+    assert IgnoreRules().extended(["*.md"], ignore_case=True).match("README.MD", False)
+
+def test_include_patterns_ignore_case(tmp_path):
+    make_tree(tmp_path, {"README.MD": "", "App.JS": "", "CHANGELOG.Md": "", "index.js": "", "data.json": ""})
+    assert walked(tmp_path, IngestFilter(["*.js", "*.md"], [])) == ["App.JS", "CHANGELOG.Md", "README.MD", "index.js"]
+
+def test_empty_include_reads_everything(tmp_path):
+    make_tree(tmp_path, {"a.txt": "", "b/c.py": ""})
+    assert walked(tmp_path, IngestFilter([], [])) == ["a.txt", "b/c.py"]
+
+def test_excluded_directories_are_pruned(tmp_path):
+    make_tree(tmp_path, {"node_modules/x.js": "", "src/locale/fr.js": "", "src/a.js": "", "lib/src/locale/b.js": ""})
+    assert walked(tmp_path, IngestFilter(["*.js"], ["node_modules/", "/src/locale/"])) == ["lib/src/locale/b.js",
+                                                                                         "src/a.js"]
+
+def test_gitignore_files_are_honoured_and_nested(tmp_path):
+    make_tree(tmp_path, {
+        ".gitignore": "*.log\nbuild/\n",
+        "keep.txt": "", "drop.log": "", "build/out.txt": "",
+        "sub/.ignore": "secret.txt\n!important.log\n",
+        "sub/secret.txt": "", "sub/important.log": "", "secret.txt": "",
+    })
+    assert walked(tmp_path, IngestFilter([], [])) == [".gitignore", "keep.txt", "secret.txt", "sub/.ignore",
+                                                     "sub/important.log"]
+
+def test_user_excludes_win_over_ignore_file_negations(tmp_path):
+    make_tree(tmp_path, {".gitignore": "!*.md\n", "a.md": "", "b.txt": ""})
+    assert walked(tmp_path, IngestFilter([], ["*.md"])) == [".gitignore", "b.txt"]
+
+def test_ignore_file_rules_stay_case_sensitive(tmp_path):
+    make_tree(tmp_path, {".gitignore": "*.log\n", "a.log": "", "B.LOG": ""})
+    assert walked(tmp_path, IngestFilter([], [])) == [".gitignore", "B.LOG"]
+
+def test_files_over_the_size_limit_are_skipped(tmp_path):
+    make_tree(tmp_path, {"small.txt": "x", "big.txt": "x" * 100})
+    assert walked(tmp_path, IngestFilter([], [], max_file_size=10)) == ["small.txt"]
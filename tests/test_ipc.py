@@ -0,0 +1,98 @@
+"""Command server under concurrent clients: every batch gets its reply, and copies see what was pushed."""
+import os
+import subprocess
+import sys
+import threading
+import time
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+pytest.importorskip("PySide6.QtNetwork")
+
+from contextyap_core import SOCKET_ENV, STORE_ENV, send_commands
+
+FILES = 200
+BATCH_SIZE = 10
+CLIENTS = 4
+START_TIMEOUT = 30  # Seconds to wait for the window's socket
+REPLY_TIMEOUT = 30  # Seconds any one batch may take
+
+@pytest.fixture
+def address(tmp_path):
+    address = str(tmp_path / "contextyap.sock")
+    env = dict(os.environ, QT_QPA_PLATFORM="offscreen", XDG_DATA_HOME=str(tmp_path),
+               **{STORE_ENV: "sqlite", SOCKET_ENV: address})
+    window = subprocess.Popen([sys.executable, os.path.join(ROOT, "contextyap.py")], cwd=tmp_path, env=env)
+    try:
+        deadline = time.monotonic() + START_TIMEOUT
+        while not os.path.exists(address):
+            if time.monotonic() > deadline or window.poll() is not None:
+                pytest.fail("The window did not start listening")
+            time.sleep(0.05)
+        yield address
+    finally:
+        window.terminate()
+        window.wait(START_TIMEOUT)
+
+def concurrently(batches_per_client, address):
+    """Sends each client's batches in turn from its own thread; returns every client's replies."""
+    replies = [[] for _ in batches_per_client]
+    errors = []
+
+    def client(batches, replies):
+        try:
+            for batch in batches:
+                replies.append(send_commands(batch, address, REPLY_TIMEOUT))
+        except Exception as e:  # Reported below, so a stuck reply fails the test instead of hanging it
+            errors.append(e)
+
+    threads = [threading.Thread(target=client, args=(batches, client_replies))
+               for batches, client_replies in zip(batches_per_client, replies)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(REPLY_TIMEOUT * (len(batches_per_client[0]) + 1))
+    assert not errors
+    assert not any(thread.is_alive() for thread in threads)
+    return replies
+
+def test_every_client_gets_a_reply_per_batch(address, tmp_path):
+    paths = []
+    for i in range(FILES):
+        paths.append(str(tmp_path / f"file-{i}.txt"))
+        with open(paths[-1], "w", encoding="utf-8") as f:
+            f.write(f"body of file {i}\n")
+    shares = [paths[i::CLIENTS] for i in range(CLIENTS)]
+    batches = [[[{"cmd": "add", "paths": [path], "check": True} for path in share[start:start + BATCH_SIZE]]
+                for start in range(0, len(share), BATCH_SIZE)] for share in shares]
+    replies = concurrently(batches, address)
+
+    for client_batches, client_replies in zip(batches, replies):
+        assert len(client_replies) == len(client_batches)
+        assert all(reply["ok"] and len(reply["results"]) == len(batch)
+                   for batch, reply in zip(client_batches, client_replies))
+    text = send_commands([{"cmd": "copy"}], address, REPLY_TIMEOUT)["results"][0]["text"]
+    assert all(f"body of file {i}\n" in text for i in range(FILES))
+
+def test_concurrent_copies_all_get_the_same_text(address, tmp_path):
+    path = str(tmp_path / "notes.txt")
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("shared notes\n")
+    assert send_commands([{"cmd": "add", "paths": [path], "check": True}], address, REPLY_TIMEOUT)["ok"]
+    replies = concurrently([[[{"cmd": "copy"}, {"cmd": "copy"}]] * 5 for _ in range(CLIENTS * 2)], address)
+
+    texts = {result["text"] for client_replies in replies for reply in client_replies for result in reply["results"]}
+    assert sum(len(client_replies) for client_replies in replies) == CLIENTS * 2 * 5
+    assert len(texts) == 1 and "shared notes" in texts.pop()
+
+def test_a_copy_sees_the_commands_before_it_in_its_batch(address, tmp_path):
+    path = str(tmp_path / "later.txt")
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("added later\n")
+    reply = send_commands([{"cmd": "copy"}, {"cmd": "add", "paths": [path], "check": True}, {"cmd": "copy"}],
+                          address, REPLY_TIMEOUT)
+    first, _, second = reply["results"]
+    assert reply["ok"] and "added later" not in first["text"] and "added later" in second["text"]
@@ -0,0 +1,167 @@
+"""Outlines: the Python ast outline, the JS/TS line scanner, and OutlineCache's process pool and its fallback."""
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import contextyap_core
+from contextyap_core import OUTLINE_PARALLEL_MIN, OutlineCache, _python_outline, _script_outline, outline_text
+
+PYTHON_SOURCE = '''"""Shapes and their areas.
+
+More detail here.
+"""
+import math
+
+PI_ISH = 3.14
+_private = 1
+__all__ = ["Circle"]
+
+@dataclass
+class Circle(Shape, metaclass=Meta):
+    """A round shape."""
+    radius: float = 1.0
+
+    def area(self) -> float:
+        """Area in square units."""
+        return math.pi * self.radius ** 2
+
+    async def grow(self, by=1, *, cap=None):
+        self.radius += by
+
+def helper(x):
+    return x * 2
+'''
+
+SCRIPT_SOURCE = '''import { a } from "./a";
+
+/**
+ * Adds two numbers.
+ * @param {number} x
+ */
+export function add(x, y) {
+  const s = "{ not a brace";
+  return x + y;
+}
+
+export const twice = (x) => {
+  return add(x, x);
+};
+
+class Counter extends Base {
+  count = 0;
+  constructor(start) {
+    super();
+    if (start) {
+      this.count = start;
+    }
+  }
+  static create() { return new Counter(0); }
+  get value() { return this.count; }
+}
+
+export interface Point {
+  x: number;
+  y: number;
+}
+
+export default Counter;
+'''
+
+SCRIPT_TESTS = '''describe("add", () => {
+  it("adds", () => {});
+  it("adds negatives", () => {});
+  describe("edge cases", () => {
+    test("zero", () => {});
+  });
+});
+'''
+
+def test_python_outline_keeps_signatures_docstring_summaries_and_constants():
+    assert _python_outline(PYTHON_SOURCE) == '\n'.join([
+        '"""Shapes and their areas."""',
+        "PI_ISH = 3.14",
+        "__all__ = ['Circle']",
+        "@dataclass",
+        "class Circle(Shape, metaclass=Meta):",
+        '    """A round shape."""',
+        "    def area(self) -> float:",
+        '        """Area in square units."""',
+        "        ...",
+        "    async def grow(self, by=1, *, cap=None):",
+        "        ...",
+        "def helper(x):",
+        "    ...",
+    ])
+
+def test_script_outline_keeps_declarations_members_and_jsdoc_summaries():
+    assert _script_outline(SCRIPT_SOURCE) == "\n".join([
+        "/** Adds two numbers. */",
+        "export function add(x, y) { … }",  # The brace inside the string does not open a block
+        "export const twice = (x) => { … }",
+        "class Counter extends Base { … }",
+        "  constructor(start) { … }",  # Not the if () inside it
+        "  static create() { … }",
+        "  get value() { … }",
+        "export interface Point { … }",
+        "  x: number;",
+        "  y: number;",
+        "export default Counter;",
+    ])
+
+def test_script_outline_sums_up_test_files():
+    assert _script_outline(SCRIPT_TESTS) == 'describe("add")  // 2 tests\n  describe("edge cases")  // 1 test'
+
+def test_outline_text_picks_the_language_by_extension():
+    assert outline_text("shapes.py", PYTHON_SOURCE).endswith("[Outline of 25 lines]")
+    assert outline_text("counter.ts", SCRIPT_SOURCE).startswith("/** Adds two numbers. */")
+    assert outline_text(None, PYTHON_SOURCE) == outline_text("shapes.py", PYTHON_SOURCE)  # Python tried first
+    assert outline_text(None, SCRIPT_SOURCE) == outline_text("counter.js", SCRIPT_SOURCE)
+    assert outline_text("main.go", SCRIPT_SOURCE) is None  # Unsupported
+    assert outline_text("broken.py", "def f(:\n") is None  # Does not parse
+    assert outline_text("short.py", "X = 1\n") is None  # Not shorter than the file
+
+def sources(count):
+    return [(f"module_{i}.py", PYTHON_SOURCE.replace("helper", f"helper_{i}"), None) for i in range(count)]
+
+def expected(files):
+    return [outline_text(path, text) or text for path, text, _ in files]
+
+class FailingPool:
+    def __init__(self, error):
+        self.error = error
+
+    def map(self, function, batches):
+        raise self.error
+
+    def shutdown(self, cancel_futures=False):
+        pass
+
+@pytest.mark.parametrize("error", [OSError("no semaphores"), RuntimeError("workers failed to start")])
+def test_warm_falls_back_to_inline_outlining_when_the_pool_fails(monkeypatch, error):
+    monkeypatch.setattr(contextyap_core.os, "cpu_count", lambda: 4)
+    cache = OutlineCache()
+    cache._pool = FailingPool(error)
+    files = sources(OUTLINE_PARALLEL_MIN)
+    cache.warm(files)
+    assert cache._pool is None  # Closed, so the next warm() starts a fresh one
+    monkeypatch.setattr(contextyap_core, "outline_text", lambda path, text: pytest.fail("Not cached by warm()"))
+    assert [cache.get(path, text) for path, text, _ in files] == expected(files)
+
+def test_small_batches_and_single_cpus_never_start_a_pool(monkeypatch):
+    monkeypatch.setattr(OutlineCache, "_executor", lambda self: pytest.fail("Pool started"))
+    OutlineCache().warm(sources(OUTLINE_PARALLEL_MIN - 1))
+    monkeypatch.setattr(contextyap_core.os, "cpu_count", lambda: 1)
+    OutlineCache().warm(sources(OUTLINE_PARALLEL_MIN))
+
+def test_warm_on_the_pool_matches_inline_outlining(monkeypatch):
+    monkeypatch.setattr(contextyap_core.os, "cpu_count", lambda: 2)
+    cache = OutlineCache()
+    files = sources(OUTLINE_PARALLEL_MIN)
+    try:
+        cache.warm(files)
+    finally:
+        cache.close()
+    assert [cache.get(path, text) for path, text, _ in files] == expected(files)
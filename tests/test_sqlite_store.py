@@ -0,0 +1,69 @@
+"""SQLiteStateStore: state.json migration and blob clean-up."""
+import json
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from contextyap_core import SQLiteStateStore, StateStore
+
+def open_store(tmp_path):
+    return SQLiteStateStore(str(tmp_path / "contextyap.db"), str(tmp_path / "state.json"), str(tmp_path / "state_content"))
+
+def write_legacy(tmp_path, count=3, **settings):
+    legacy = StateStore(str(tmp_path / "state.json"), str(tmp_path / "state_content"))
+    items = [{"id": f"item-{i}", "name": f"📎 clipboard-{i}", "is_link": False, "checked": i == 0,
+              "content_hash": legacy.put_content(f"body {i}")} for i in range(count)]
+    legacy.save(dict({"items": items, "opacity": 0.8, "width": 300, "height": 500}, **settings))
+
+def test_migrates_this_programs_state_once(tmp_path):
+    write_legacy(tmp_path, token_budget=5000, version=3)
+    state = open_store(tmp_path).load()
+    assert [item["name"] for item in state["items"]] == ["📎 clipboard-0", "📎 clipboard-1", "📎 clipboard-2"]
+    assert state["token_budget"] == 5000 and state["width"] == 300
+    assert "version" not in state  # Only known settings are imported
+    assert os.path.exists(tmp_path / "state.json.migrated") and not os.path.exists(tmp_path / "state.json")
+    store = open_store(tmp_path)
+    assert store.blobs.get(state["items"][1]["content_hash"]) == "body 1"
+
+    os.replace(tmp_path / "state.json.migrated", tmp_path / "state.json")  # Restored from a backup, say
+    assert len(open_store(tmp_path).load()["items"]) == 3
+    assert os.path.exists(tmp_path / "state.json")  # Recorded as imported, so left alone
+
+def test_leaves_other_programs_state_json_alone(tmp_path):
+    for content in ({"version": 3}, [1, 2, 3], {"items": "not a list"}, {"items": [{"no": "name"}]}):
+        (tmp_path / "state.json").write_text(json.dumps(content), encoding="utf-8")
+        state = open_store(tmp_path).load()
+        assert state["items"] == [] and "version" not in state
+        assert json.loads((tmp_path / "state.json").read_text(encoding="utf-8")) == content
+
+def test_hashes_without_their_content_directory_are_not_migrated(tmp_path):
+    content = {"items": [{"name": "a", "is_link": False, "content_hash": "0" * 64}]}
+    (tmp_path / "state.json").write_text(json.dumps(content), encoding="utf-8")
+    assert open_store(tmp_path).load()["items"] == []
+    assert os.path.exists(tmp_path / "state.json")
+
+def test_inline_content_from_the_oldest_files_is_migrated(tmp_path):
+    content = {"items": [{"name": "📎 a", "is_link": False, "content": "inline body", "checked": True}]}
+    (tmp_path / "state.json").write_text(json.dumps(content), encoding="utf-8")
+    store = open_store(tmp_path)
+    items = store.load()["items"]
+    assert [item["name"] for item in items] == ["📎 a"] and items[0]["checked"]
+    assert store.blobs.get(items[0]["content_hash"]) == "inline body"
+
+def test_blobs_still_referenced_by_an_item_are_kept(tmp_path):
+    writer = open_store(tmp_path)
+    writer.load()
+    segments_hash = writer.blobs.put('{"segments": []}')
+    content_hash = writer.put_content("folder text")
+    writer.save({"items": [{"id": "folder", "name": "📎 clipboard-1", "is_link": False, "checked": False,
+                            "content_hash": content_hash, "segments_hash": segments_hash}]})
+    for stale in (segments_hash, content_hash):  # As if another process dropped and forgot them
+        writer.blobs.remove(stale)
+        assert writer.blobs.get(stale)
+    writer.save({"items": []})
+    open_store(tmp_path).blobs.remove(segments_hash)
+    with pytest.raises(FileNotFoundError):  # Gone once nothing refers to it
+        writer.blobs.get(segments_hash)